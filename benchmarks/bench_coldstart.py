@@ -0,0 +1,52 @@
+"""Cold-start benchmark of `core.dataloader.build_layers`
+
+Run from the repository root:
+
+    python -m benchmarks.bench_coldstart [--scenarios berlin stations_x10] [--workers 1 4] [--repeat 3]
+
+Every run builds all layers into an empty artifact store, as the first start of the app does, and
+reports the median wall time per scenario and number of loader threads (`pdict["loader_workers"]`,
+1 is the sequential loader).
+"""
+import io
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import contextlib
+
+from core import dataloader          as dl
+from benchmarks.bench_pipeline       import SCENARIOS, scenario_pdict
+
+
+def cold_start(cfg, workers):
+    """Wall time of one `build_layers` call with an empty artifact store."""
+    folder = tempfile.mkdtemp(prefix="heatmap_coldstart_")
+    try:
+        cfg = dict(cfg, picklefolder=folder, loader_workers=workers)
+        t_start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            dl.build_layers(cfg)
+        return time.perf_counter() - t_start
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=["berlin", "stations_x10"], choices=sorted(SCENARIOS))
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:<16}  {:>7}  {:>10}".format("scenario", "workers", "cold [s]"))
+    for name in args.scenarios:
+        cfg, _ = scenario_pdict(name)
+        for workers in args.workers:
+            secs = statistics.median(cold_start(cfg, workers) for _ in range(args.repeat))
+            print("{:<16}  {:>7}  {:10.3f}".format(name, workers, secs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Benchmark of every stage of the heatmap pipeline, headless and offline
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pipeline                          # default scenarios
+    python -m benchmarks.bench_pipeline --scenarios berlin stations_x100
+    python -m benchmarks.bench_pipeline --baseline <commit> --threshold 0.25
+
+Each scenario runs the stages of `main()` without Streamlit (the map layers are serialised, not
+displayed) and reports the median wall time, CPU time, peak memory and row counts per stage.
+Results are written to `benchmarks/results/<commit>.json`. With `--baseline` the run fails (exit
+code 1) if a stage got slower than the baseline by more than the threshold.
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import contextlib
+
+import pandas                        as pd
+from branca.colormap                 import LinearColormap
+
+from config                          import pdict
+from core import methods             as m1
+from core import ingest              as ig
+from core import spatial             as sp
+from core import geosource           as gs
+from core import aggregate           as ag
+from core import layers              as ly
+from core import metrics             as mt
+from benchmarks import synthetic     as sy
+
+
+HERE            = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR     = os.path.join(HERE, "results")
+DATA_DIR        = os.path.join(HERE, ".data")
+
+# name: (station scale, grid refinement); "berlin" uses the real files where they exist
+SCENARIOS = {
+    "berlin":           (1, 1),
+    "stations_x10":     (10, 1),
+    "stations_x100":    (100, 1),
+    "grid_x4":          (1, 2),
+    "grid_x16":         (1, 4),
+}
+# stations_x100 reads a register of 2M rows, which takes about a minute per run; run it explicitly
+DEFAULT_SCENARIOS = ["berlin", "stations_x10", "grid_x4", "grid_x16"]
+
+# Stages whose wall time is ignored by the regression check because they are too short to be stable
+MIN_CHECKED_SECS = 0.005
+
+
+def scenario_pdict(name):
+    """Configuration of a scenario; the register is synthetic if the real one is not present."""
+    station_scale, grid = SCENARIOS[name]
+    if name == "berlin" and os.path.exists(pdict["file_lstations"]):
+        return dict(pdict), False
+    return sy.scenario_files(pdict, DATA_DIR, station_scale, grid), True
+
+
+def run_pipeline(cfg):
+    """Run all stages of `main()` once, without Streamlit and without the artifact store."""
+    timed = lambda stage, func, *args: mt.instrument(stage)(func)(*args)
+
+    df_geodat_plz   = timed("read_geodat_plz", gs.read_areas, cfg, "PLZ")
+    df_geodat_dis   = timed("read_geodat_dis", gs.read_areas, cfg, "Bezirk")
+    area_index      = sp.build_area_index(df_geodat_plz, df_geodat_dis, cfg)
+
+    df_lstat        = ig.read_lstations(cfg, verbose=False)
+    gdf_lstat2      = m1.preprop_lstat(df_lstat, area_index, cfg)
+    gdf_lstat3      = m1.count_plz_occurrences(gdf_lstat2)
+
+    df_residents    = ig.read_residents(cfg)
+    gdf_resid       = m1.preprop_resid(df_residents, area_index, cfg)
+
+    plz_bezirk      = timed("plz_bezirk_map", ag.plz_bezirk_map, area_index)
+    agg_plz         = ag.aggregate_plz(gdf_lstat2, gdf_resid, area_index, plz_bezirk)
+    ag.rollup_bezirk(agg_plz, area_index)
+
+    ly.clear_cache()
+    for gdf, col in ((gdf_resid, 'Einwohner'), (gdf_lstat3, 'Number')):
+        color_map = LinearColormap(colors=['yellow', 'red'], vmin=gdf[col].min(), vmax=gdf[col].max())
+        ly.layer_geojson(gdf, col, color_map, zoom=10)
+
+
+def bench_scenario(name, repeat):
+    """Median of the per-stage measurements over `repeat` runs of a scenario."""
+    cfg, synthetic  = scenario_pdict(name)
+    runs            = []
+    for _ in range(repeat):
+        mt.reset()
+        t_start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_pipeline(cfg)
+        total = time.perf_counter() - t_start
+        stages = mt.summary()
+        stages["total"] = {"calls": 1, "wall_s": total, "cpu_s": sum(s["cpu_s"] for s in stages.values()),
+                           "peak_bytes": max(s["peak_bytes"] for s in stages.values()),
+                           "rows_in": None, "rows_out": None}
+        runs.append(stages)
+
+    ret = {}
+    for stage in runs[0]:
+        ret[stage] = {k: (statistics.median(r[stage][k] for r in runs) if k in ("wall_s", "cpu_s", "peak_bytes")
+                          else runs[0][stage][k]) for k in runs[0][stage]}
+    return {"synthetic_register": synthetic, "repeat": repeat, "stages": ret}
+
+
+def current_commit():
+    """Short hash of HEAD, with a `-dirty` suffix if tracked files are modified."""
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return sha + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_result(ref):
+    """A stored result, given as a path or as the commit it was recorded for."""
+    path = ref if os.path.exists(ref) else os.path.join(RESULTS_DIR, ref + ".json")
+    with open(path, encoding="utf-8") as f_in:
+        return json.load(f_in)
+
+
+def regressions(result, baseline, threshold):
+    """Stages that are slower than in `baseline` by more than `threshold` (relative)."""
+    ret = []
+    for name, scen in result["scenarios"].items():
+        base_stages = baseline["scenarios"].get(name, {}).get("stages", {})
+        for stage, s in scen["stages"].items():
+            b = base_stages.get(stage)
+            if b and b["wall_s"] >= MIN_CHECKED_SECS and s["wall_s"] > b["wall_s"] * (1 + threshold):
+                ret.append((name, stage, b["wall_s"], s["wall_s"]))
+    return ret
+
+
+def print_scenario(name, scen):
+    print("\n{}{}".format(name, " (synthetic register)" if scen["synthetic_register"] else ""))
+    print("  {:<26} {:>9} {:>9} {:>10} {:>9} {:>9}".format("stage", "wall [s]", "cpu [s]", "peak [MB]",
+                                                            "rows in", "rows out"))
+    for stage, s in scen["stages"].items():
+        print("  {:<26} {:>9.3f} {:>9.3f} {:>10.1f} {:>9} {:>9}".format(
+            stage, s["wall_s"], s["cpu_s"], s["peak_bytes"] / 2 ** 20,
+            "" if s["rows_in"] is None else s["rows_in"], "" if s["rows_out"] is None else s["rows_out"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=DEFAULT_SCENARIOS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", help="commit or result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative slow-down per stage (default 0.2 = 20%%)")
+    parser.add_argument("--no-save", action="store_true", help="do not store the result")
+    args = parser.parse_args()
+
+    mt.enable()
+    result = {
+        "commit":       current_commit(),
+        "timestamp":    time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python":       platform.python_version(),
+        "platform":     platform.platform(),
+        "scenarios":    {},
+    }
+    for name in args.scenarios:
+        result["scenarios"][name] = bench_scenario(name, args.repeat)
+        print_scenario(name, result["scenarios"][name])
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, result["commit"] + ".json")
+        with open(path, "w", encoding="utf-8") as f_out:
+            json.dump(result, f_out, indent=2)
+        print("\nResult written to {}".format(path))
+
+    if args.baseline:
+        slower = regressions(result, load_result(args.baseline), args.threshold)
+        for name, stage, before, after in slower:
+            print("REGRESSION {}/{}: {:.3f}s -> {:.3f}s".format(name, stage, before, after))
+        if slower:
+            sys.exit(1)
+        print("No regression beyond {:.0%} against {}".format(args.threshold, args.baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark of the nearest-station and coverage queries of `core.proximity`
+
+Run from the repository root:
+
+    python -m benchmarks.bench_proximity [--stations 100000] [--points 100000 500000] [--k 3]
+
+Stations and population points are drawn uniformly from the bounding box in `pdict`.
+"""
+import argparse
+import time
+
+import numpy                         as np
+import pandas                        as pd
+
+from core import proximity           as px
+from config                          import pdict
+
+
+def random_points(n, bbox, seed):
+    """`n` uniform points in a `(lon_min, lat_min, lon_max, lat_max)` box as a station-like DataFrame."""
+    rng = np.random.default_rng(seed)
+    lon_min, lat_min, lon_max, lat_max = bbox
+    return pd.DataFrame({
+        'Längengrad':   rng.uniform(lon_min, lon_max, n).astype('float32'),
+        'Breitengrad':  rng.uniform(lat_min, lat_max, n).astype('float32'),
+    })
+
+
+def timed(func, *args, **kwargs):
+    t_start = time.perf_counter()
+    value = func(*args, **kwargs)
+    return value, time.perf_counter() - t_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=100000)
+    parser.add_argument("--points", type=int, nargs="+", default=[100000, 500000])
+    parser.add_argument("--k", type=int, default=pdict["nearest_k"])
+    parser.add_argument("--radius", type=float, default=pdict["coverage_radius"])
+    args = parser.parse_args()
+
+    index, t_index = timed(px.build_station_index.__wrapped__, random_points(args.stations, pdict["bbox"], 0), pdict)
+    print("Station index over {} stations: {:.3f} secs".format(args.stations, t_index))
+
+    print("{:>9}  {:>11}  {:>11}  {:>11}  {:>9}".format("points", "project [s]", "k-NN [s]", "cover [s]",
+                                                      "covered"))
+    for n in args.points:
+        pts             = random_points(n, pdict["bbox"], n)
+        xy, t_proj      = timed(px.project, pts['Längengrad'], pts['Breitengrad'], pdict)
+        _, t_knn        = timed(px.nearest_stations, index, xy, args.k)
+        (_, share), t_cov = timed(px.coverage, index, xy, args.radius)
+        print("{:>9}  {:11.3f}  {:11.3f}  {:11.3f}  {:8.1%}".format(n, t_proj, t_knn, t_cov, share))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Load test of the Streamlit app with concurrent sessions, with and without the shared layer store
+
+Run from the repository root:
+
+    python -m benchmarks.bench_serving [--sessions 1 10 50] [--modes process store] [--processes 1 2]
+                                       [--scenario berlin]
+
+Every measurement starts fresh Streamlit servers (`streamlit run`, one process each) and opens the
+sessions against them over the websocket protocol of the browser, spread evenly over the servers. All
+sessions start at once; each one runs the app and then switches the layer and the level
+(`SESSION_STEPS`), as an analyst opening the app does. The sessions stay connected until the memory of
+the servers is read. The modes are
+
+    process     every server loads its own layers from the artifact store (`serve_folder` None)
+    store       every server memory-maps the same layer store of `core.serving`
+
+The report gives the median and 95th percentile latency of a script run (from sending the widget
+state to the end of the script), the RSS of the largest server after the sessions, and the summed PSS
+of all servers, in which pages shared by several processes are split between them.
+"""
+import os
+import io
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+import contextlib
+import urllib.request
+
+from benchmarks.bench_pipeline       import SCENARIOS, scenario_pdict
+
+
+ROOT            = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP             = os.path.join(ROOT, "benchmarks", "serving_app.py")
+BASE_PORT       = 8650
+
+# Widget changes of a session after its first run: (label of the widget, option)
+SESSION_STEPS   = (("Select Layer", "Charging_Stations"), ("Select Level", "Bezirk"), ("Select Layer", "Supply_Gap"))
+
+
+def memory_kb(pid, field):
+    """A field of `/proc/<pid>/status` (e.g. `VmRSS`) or `/proc/<pid>/smaps_rollup` (`Pss`) in kB."""
+    for name in ("status", "smaps_rollup"):
+        with open("/proc/{}/{}".format(pid, name)) as f_in:
+            for line in f_in:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    raise KeyError(field)
+
+
+def start_server(port, scenario, serve_folder):
+    """Start one app server and wait until it answers its health check."""
+    env  = dict(os.environ, HEATMAP_BENCH_SCENARIO=scenario, HEATMAP_BENCH_SERVE_FOLDER=serve_folder)
+    proc = subprocess.Popen([sys.executable, "-m", "streamlit", "run", APP, "--server.port", str(port),
+                             "--server.headless", "true", "--server.fileWatcherType", "none",
+                             "--browser.gatherUsageStats", "false"],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(300):
+        try:
+            urllib.request.urlopen("http://127.0.0.1:{}/_stcore/health".format(port), timeout=1)
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("server on port {} did not start".format(port))
+
+
+class Session:
+    """One browser session of the app on an open websocket of `/_stcore/stream`."""
+
+    def __init__(self, ws):
+        self.ws         = ws
+        self.widgets    = {}                # label: widget id
+        self.states     = {}                # widget id: selected option
+
+    def run(self):
+        """Send the current widget states, read the messages of the script run and return its duration."""
+        from streamlit.proto.BackMsg_pb2       import BackMsg
+        from streamlit.proto.ForwardMsg_pb2    import ForwardMsg
+
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        for widget_id, option in self.states.items():
+            msg.rerun_script.widget_states.widgets.add(id=widget_id, string_value=option)
+
+        t_start = time.perf_counter()
+        self.ws.send(msg.SerializeToString())
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(self.ws.recv(timeout=600))
+            kind = fwd.WhichOneof("type")
+            if kind == "delta" and fwd.delta.WhichOneof("type") == "new_element":
+                element = fwd.delta.new_element
+                if element.WhichOneof("type") == "radio":
+                    self.widgets[element.radio.label] = element.radio.id
+                elif element.WhichOneof("type") == "exception":
+                    raise RuntimeError(element.exception.message)
+            elif kind == "script_finished":
+                return time.perf_counter() - t_start
+
+    def select(self, label, option):
+        self.states[self.widgets[label]] = option
+
+
+def measure(scenario, mode, n_sessions, n_processes, serve_folder):
+    """Start the servers of one measurement, run the sessions against them and read the server memory."""
+    from websockets.sync.client import connect
+
+    servers     = [start_server(BASE_PORT + i, scenario, serve_folder if mode == "store" else "")
+                   for i in range(n_processes)]
+    latencies, errors = [], []
+    started     = threading.Barrier(n_sessions)
+    finished    = threading.Barrier(n_sessions + 1)
+    measured    = threading.Event()
+
+    def client(port):
+        try:
+            with connect("ws://127.0.0.1:{}/_stcore/stream".format(port), subprotocols=["streamlit"],
+                         max_size=None, open_timeout=60) as ws:
+                session = Session(ws)
+                started.wait()
+                latencies.append(session.run())
+                for label, option in SESSION_STEPS:
+                    session.select(label, option)
+                    latencies.append(session.run())
+                # the session stays open until the memory of the servers was read
+                finished.wait()
+                measured.wait()
+        except Exception as exc:
+            errors.append(repr(exc))
+            started.abort()
+            finished.abort()
+
+    threads = [threading.Thread(target=client, args=(BASE_PORT + i % n_processes,)) for i in range(n_sessions)]
+    try:
+        t_start = time.perf_counter()
+        for t in threads:
+            t.start()
+        with contextlib.suppress(threading.BrokenBarrierError):
+            finished.wait()
+        wall    = time.perf_counter() - t_start
+        if errors:
+            raise RuntimeError("session failed: {}".format(errors[0]))
+        rss     = [memory_kb(p.pid, "VmRSS") for p in servers]
+        pss     = [memory_kb(p.pid, "Pss") for p in servers]
+    finally:
+        measured.set()
+        for t in threads:
+            t.join()
+        for p in servers:
+            p.terminate()
+            p.wait()
+
+    latencies.sort()
+    return {
+        "p50_ms":   1000 * statistics.median(latencies),
+        "p95_ms":   1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        "wall_s":   wall,
+        "rss_mb":   max(rss) / 1024,
+        "pss_mb":   sum(pss) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--modes", nargs="+", default=["process", "store"], choices=["process", "store"])
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--scenario", default="berlin", choices=sorted(SCENARIOS))
+    args = parser.parse_args()
+
+    from core import dataloader          as dl
+    from core import serving             as sv
+
+    # the artifacts and the store are prepared once, so that no server builds them
+    serve_folder    = tempfile.mkdtemp(prefix="heatmap_serving_")
+    cfg             = dict(scenario_pdict(args.scenario)[0], serve_folder=serve_folder)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            dl.build_layers(cfg)
+            sv.load_store(cfg)
+
+        print("{:<8} {:>5} {:>8}  {:>8} {:>8} {:>8}  {:>8} {:>8}".format(
+            "mode", "procs", "sessions", "p50 [ms]", "p95 [ms]", "wall [s]", "RSS [MB]", "PSS [MB]"))
+        for n_processes in args.processes:
+            for n_sessions in args.sessions:
+                for mode in args.modes:
+                    r = measure(args.scenario, mode, n_sessions, n_processes, serve_folder)
+                    print("{:<8} {:>5} {:>8}  {:8.0f} {:8.0f} {:8.1f}  {:8.1f} {:8.1f}".format(
+                        mode, n_processes, n_sessions, r["p50_ms"], r["p95_ms"], r["wall_s"], r["rss_mb"],
+                        r["pss_mb"]), flush=True)
+    finally:
+        shutil.rmtree(serve_folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark of `HelperTools.sortDF` against the former row-by-row implementation
+
+Run from the repository root:
+
+    python -m benchmarks.bench_sort [--sizes 1000 10000 100000] [--legacy-max 10000]
+
+The former implementation is quadratic; sizes above `--legacy-max` are skipped for it and an
+extrapolated duration is printed instead.
+"""
+import argparse
+import time
+
+import numpy                         as np
+import pandas                        as pd
+
+import core.HelperTools              as ht
+
+
+def legacy_sortDF(dframe, col, asc):
+    """The implementation of `HelperTools.sortDF` before the vectorised sort, kept for comparison."""
+    dfColList = dframe.columns.values
+    retDF = pd.DataFrame(columns=dfColList)
+    while not dframe.empty:
+        dfCol = dframe[col]
+        poppedStackdfCol = min(dfCol) if asc == True else max(dfCol)
+        poppedStackIndexVal = dframe.index[dframe[col] == poppedStackdfCol].tolist()
+        poppedRow, dframe = ht.popRowFromDF(dframe, poppedStackIndexVal[0])
+        dict_row = dict(zip(dfColList, poppedRow))
+        retDF = pd.concat([retDF, pd.DataFrame([dict_row])], ignore_index=True)
+    return retDF
+
+
+def make_frame(n, seed=0):
+    """Station-like test data with many ties in the sort column."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'PLZ':      rng.integers(10115, 14200, n),
+        'KW':       rng.choice([11.0, 22.0, 50.0, 150.0, 300.0], n),
+        'ID':       np.arange(n),
+    })
+
+
+def timed(func, *args):
+    t_start = time.perf_counter()
+    value = func(*args)
+    return value, time.perf_counter() - t_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--legacy-max", type=int, default=10000)
+    args = parser.parse_args()
+
+    print("{:>8}  {:>6}  {:>12}  {:>12}  {:>9}".format("rows", "asc", "legacy [s]", "sortDF [s]", "speed-up"))
+    legacy_rate = None
+    for n in args.sizes:
+        dframe = make_frame(n)
+        for asc in (True, False):
+            new, t_new = timed(ht.sortDF.__wrapped__, dframe, 'KW', asc)
+            if n <= args.legacy_max:
+                old, t_old = timed(legacy_sortDF, dframe.copy(), 'KW', asc)
+                assert (old['ID'].astype(int).values == new['ID'].values).all(), "results differ"
+                legacy_rate = t_old / n ** 2
+                legacy = "{:12.3f}".format(t_old)
+            else:
+                t_old = legacy_rate * n ** 2 if legacy_rate else float("nan")
+                legacy = "{:>12}".format("~%.0f" % t_old)
+            print("{:>8}  {:>6}  {}  {:12.4f}  {:8.0f}x".format(n, str(asc), legacy, t_new, t_old / t_new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Import-time budget of the data-preparation modules
+
+Run from the repository root:
+
+    python -m benchmarks.check_imports
+    python -m benchmarks.check_imports --budget 1.5 --repeat 5
+
+Every module in `BUDGETS` is imported in a fresh interpreter with `python -X importtime`. The check
+fails (exit code 1) if its cumulative import time exceeds the budget or if it pulls in one of the
+visualisation packages in `FORBIDDEN`, which must only load when a map is drawn.
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+
+ROOT            = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module: import time budget in seconds (median over fresh interpreters)
+BUDGETS = {
+    "core.methods":     1.5,
+    "core.dataloader":  2.0,
+    "core.aggregate":   1.5,
+    "export":           0.2,
+}
+
+# Packages that belong to the rendering side; no module in `BUDGETS` may import them
+FORBIDDEN = ("streamlit", "streamlit_folium", "folium", "branca", "matplotlib", "jinja2")
+
+
+def import_profile(module):
+    """
+    The function `import_profile` imports `module` in a fresh interpreter with `-X importtime`.
+
+    :param module: The `module` parameter is the dotted module name
+    :return: A tuple `(total_s, imported)`: the cumulative import time of the module in seconds and
+    the set of all top-level packages loaded on the way.
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+    total, imported = None, set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue                                    # header line
+        name = name.strip()
+        imported.add(name.split(".")[0])
+        if name == module:
+            total = int(cumulative) / 1e6
+    return total, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", choices=list(BUDGETS), default=list(BUDGETS))
+    parser.add_argument("--budget", type=float, help="override the budget of all modules [s]")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    failed = []
+    print("{:<18} {:>9} {:>9}  {}".format("module", "time [s]", "budget", "forbidden imports"))
+    for module in args.modules:
+        runs        = [import_profile(module) for _ in range(args.repeat)]
+        total       = statistics.median(r[0] for r in runs)
+        budget      = args.budget or BUDGETS[module]
+        forbidden   = sorted(set(FORBIDDEN) & set.union(*(r[1] for r in runs)))
+        print("{:<18} {:>9.3f} {:>9.3f}  {}".format(module, total, budget, ", ".join(forbidden) or "-"))
+        if total > budget or forbidden:
+            failed.append(module)
+
+    if failed:
+        print("Import budget exceeded: {}".format(", ".join(failed)))
+        sys.exit(1)
+    print("All imports within budget")
+
+
+if __name__ == "__main__":
+    main()
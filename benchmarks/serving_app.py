@@ -0,0 +1,17 @@
+"""Entry point of the app servers started by `benchmarks.bench_serving`
+
+Runs `main.py` with the configuration of a benchmark scenario; the scenario and the store folder
+(empty for per-process layers) are taken from the environment variables `HEATMAP_BENCH_SCENARIO` and
+`HEATMAP_BENCH_SERVE_FOLDER`.
+"""
+import os
+
+import config
+from benchmarks.bench_pipeline       import scenario_pdict
+
+config.pdict.update(scenario_pdict(os.environ["HEATMAP_BENCH_SCENARIO"])[0],
+                    serve_folder=os.environ["HEATMAP_BENCH_SERVE_FOLDER"] or None)
+
+import main                                                     # noqa: E402
+
+main.main()
@@ -0,0 +1,163 @@
+"""Synthetic, scaled-up inputs for the pipeline benchmarks
+
+All data is generated locally from the bundled Berlin geodata with a fixed seed, so every run
+of the benchmark sees the same inputs and no network access is needed.
+"""
+import os
+
+import numpy                         as np
+import pandas                        as pd
+import shapely
+
+from core import spatial             as sp
+from core import geosource           as gs
+
+
+# Postal codes available to synthetic areas; `preprop_resid` and `preprop_lstat` keep this range
+SYNTHETIC_PLZ_RANGE = (10116, 14199)
+
+# Register columns in file order; the pipeline reads a subset of them
+REGISTER_COLUMNS = ['Betreiber', 'Straße', 'Hausnummer', 'Postleitzahl', 'Ort', 'Bundesland ',
+                    'Breitengrad', 'Längengrad', 'Inbetriebnahmedatum', 'Nennleistung Ladeeinrichtung [kW]',
+                    'Art der Ladeeinrichung', 'Anzahl Ladepunkte']
+
+
+def wkt_geodata(pdict, level):
+    """The areas of a level of the real data in the layout of `geodata_berlin_*.csv`, with WKT geometry."""
+    ret = gs.read_areas(pdict, level, bbox=False)
+    # full precision, so that parsing the WKT again gives the same coordinates
+    return ret.assign(geometry=shapely.to_wkt(ret['geometry'].values, rounding_precision=-1))
+
+
+def grid_geodata(df_geodat_plz, k):
+    """
+    The function `grid_geodata` splits every postal code polygon into the cells of a k x k grid over
+    its bounding box, giving a finer polygon layer that still tiles Berlin without gaps.
+
+    :param df_geodat_plz: The `df_geodat_plz` parameter is the DataFrame of `geodata_berlin_plz.csv`
+    :param k: The `k` parameter is the number of grid rows and columns per polygon; 1 returns the input
+    :return: A DataFrame with the columns `PLZ` and `geometry` (WKT). The cells are numbered with new,
+    unique codes from `SYNTHETIC_PLZ_RANGE`.
+    """
+    if k == 1:
+        return df_geodat_plz
+    cells = []
+    for poly in shapely.from_wkt(df_geodat_plz['geometry'].values):
+        x0, y0, x1, y1 = poly.bounds
+        xs, ys = np.linspace(x0, x1, k + 1), np.linspace(y0, y1, k + 1)
+        boxes = shapely.box(*np.meshgrid(xs[:-1], ys[:-1]), *np.meshgrid(xs[1:], ys[1:])).ravel()
+        parts = shapely.intersection(poly, boxes)
+        cells.extend(p for p in parts if not p.is_empty and p.area > 0)
+
+    lo, hi = SYNTHETIC_PLZ_RANGE
+    if len(cells) > hi - lo:
+        raise ValueError("grid {} gives {} cells, only {} codes available".format(k, len(cells), hi - lo))
+    return pd.DataFrame({'PLZ': np.arange(lo, lo + len(cells)), 'geometry': shapely.to_wkt(cells)})
+
+
+def residents_for(df_geodat_plz, seed=0):
+    """Synthetic `plz_einwohner.csv` rows, one per area, located at the area's representative point."""
+    rng     = np.random.default_rng(seed)
+    geoms   = shapely.from_wkt(df_geodat_plz['geometry'].values)
+    points  = shapely.point_on_surface(geoms)
+    return pd.DataFrame({
+        'plz':          df_geodat_plz['PLZ'].values,
+        'note':         'synthetic',
+        'einwohner':    rng.integers(500, 40000, len(geoms)),
+        'qkm':          1.0,
+        'lat':          shapely.get_y(points),
+        'lon':          shapely.get_x(points),
+    })
+
+
+def register_for(df_geodat_plz, df_geodat_dis, pdict, n_berlin, n_other, seed=0, mistyped=0.02):
+    """
+    The function `register_for` generates a charging register with `n_berlin` stations inside the
+    given areas and `n_other` stations elsewhere in Germany.
+
+    :param df_geodat_plz: The `df_geodat_plz` parameter is the area layer the Berlin stations are
+    placed in
+    :param df_geodat_dis: The `df_geodat_dis` parameter is the district layer
+    :param pdict: The `pdict` parameter is the configuration dictionary
+    :param n_berlin: The `n_berlin` parameter is the number of stations in Berlin
+    :param n_other: The `n_other` parameter is the number of stations outside Berlin
+    :param seed: The `seed` parameter seeds the random generator
+    :param mistyped: The `mistyped` parameter is the share of Berlin stations with a wrong postal code
+    :return: A DataFrame with the columns of `REGISTER_COLUMNS`.
+    """
+    rng         = np.random.default_rng(seed)
+    parsed      = lambda df: df.assign(geometry=sp.parse_geometry(df['geometry']))
+    level       = sp.build_area_index(parsed(df_geodat_plz), parsed(df_geodat_dis), pdict)["PLZ"]
+    x0, y0, x1, y1 = shapely.total_bounds(level["geoms"])
+
+    # rejection sampling in the bounding box: keep points that fall into an area
+    lon, lat, plz = [], [], []
+    while sum(len(p) for p in plz) < n_berlin:
+        x, y    = rng.uniform(x0, x1, n_berlin), rng.uniform(y0, y1, n_berlin)
+        pos     = sp.locate_points(shapely.points(x, y), level)
+        found   = pos >= 0
+        lon.append(x[found]); lat.append(y[found]); plz.append(level["keys"][pos[found]])
+    lon, lat, plz = (np.concatenate(v)[:n_berlin] for v in (lon, lat, plz))
+    wrong       = rng.random(n_berlin) < mistyped
+    plz[wrong]  = rng.integers(*SYNTHETIC_PLZ_RANGE, wrong.sum())
+
+    n           = n_berlin + n_other
+    days        = rng.integers(0, 15 * 365, n)
+    return pd.DataFrame({
+        'Betreiber':        rng.choice(['EnBW', 'Allego', 'Vattenfall', 'Ionity', 'Tesla'], n),
+        'Straße':           rng.choice(['Hauptstraße', 'Bahnhofstraße', 'Parkstraße'], n),
+        'Hausnummer':       rng.integers(1, 200, n).astype(str),
+        'Postleitzahl':     np.concatenate([plz, rng.integers(20000, 99999, n_other)]),
+        'Ort':              np.concatenate([np.repeat('Berlin', n_berlin), np.repeat('Ort', n_other)]),
+        'Bundesland ':      np.concatenate([np.repeat('Berlin', n_berlin),
+                                            rng.choice(['Bayern', 'Hessen', 'Sachsen', 'Hamburg'], n_other)]),
+        'Breitengrad':      np.concatenate([lat, rng.uniform(47.3, 55.0, n_other)]),
+        'Längengrad':       np.concatenate([lon, rng.uniform(6.0, 15.0, n_other)]),
+        'Inbetriebnahmedatum': (pd.Timestamp('2010-01-01') + pd.to_timedelta(days, 'D')).strftime('%d.%m.%Y'),
+        'Nennleistung Ladeeinrichtung [kW]': rng.choice([3.7, 11.0, 22.0, 50.0, 150.0, 300.0], n),
+        'Art der Ladeeinrichung': rng.choice(['Normalladeeinrichtung', 'Schnellladeeinrichtung'], n),
+        'Anzahl Ladepunkte': rng.integers(1, 5, n),
+    })[REGISTER_COLUMNS]
+
+
+def write_register(df, path):
+    """Write a register in the Bundesnetzagentur layout: 10 metadata lines, ';' and decimal commas."""
+    with open(path, "w", encoding="utf-8") as f_out:
+        for i in range(10):
+            f_out.write("Synthetischer Auszug des Ladesäulenregisters;Zeile {}\n".format(i + 1))
+        df.to_csv(f_out, sep=';', decimal=',', index=False)
+
+
+def scenario_files(pdict, folder, station_scale=1, grid=1, base_stations=4000, seed=0):
+    """
+    The function `scenario_files` generates (or reuses) the input files of a synthetic scenario and
+    returns a copy of `pdict` pointing to them.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary of the real data
+    :param folder: The `folder` parameter is where the generated files are kept between runs
+    :param station_scale: The `station_scale` parameter multiplies the number of stations
+    :param grid: The `grid` parameter splits every postal code polygon into grid x grid cells
+    :param base_stations: The `base_stations` parameter is the number of Berlin stations at scale 1;
+    the register holds four times as many stations outside Berlin
+    :param seed: The `seed` parameter seeds the random generators
+    :return: The modified copy of `pdict`.
+    """
+    os.makedirs(folder, exist_ok=True)
+    name        = "s{}_g{}_b{}_r{}".format(station_scale, grid, base_stations, seed)
+    ret         = dict(pdict)
+    ret["file_geodat_plz"]  = os.path.join(folder, name + "_geodat_plz.csv")
+    ret["geodat_plz_key"]   = "PLZ"
+    ret["file_lstations"]   = os.path.join(folder, name + "_register.csv")
+    ret["file_residents"]   = os.path.join(folder, name + "_residents.csv") if grid > 1 else pdict["file_residents"]
+
+    if not all(os.path.exists(ret[k]) for k in ("file_geodat_plz", "file_lstations", "file_residents")):
+        print(" ====> Generating synthetic inputs: {}".format(name))
+        df_geodat_plz   = grid_geodata(wkt_geodata(pdict, "PLZ"), grid)
+        df_geodat_dis   = wkt_geodata(pdict, "Bezirk")
+        df_geodat_plz.to_csv(ret["file_geodat_plz"], sep=';', index=False)
+        if grid > 1:
+            residents_for(df_geodat_plz, seed).to_csv(ret["file_residents"], index=False)
+        n_berlin        = base_stations * station_scale
+        write_register(register_for(df_geodat_plz, df_geodat_dis, pdict, n_berlin, 4 * n_berlin, seed),
+                       ret["file_lstations"])
+    return ret
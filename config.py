@@ -5,12 +5,64 @@ p['picklefolder']           = 'pickles'
 p['geocode']                = 'PLZ'
 
 p["file_lstations"]         = "data/Ladesaeulenregister.csv"
+p["lstat_chunksize"]        = 100000
+p["plz_assignment"]         = "location"            # "location": PLZ polygon containing the station, "declared": Postleitzahl
+p["lstat_update"]           = "delta"               # "delta": apply a new register to the stored layers, "full": rebuild
+p["loader_workers"]         = None                  # threads reading the sources and building the stages, None: one per CPU (at most 4), 1: sequential
+p["gap_smoothing"]          = 0.5                   # share of the neighbouring areas in the demand and supply scores
+p["nearest_k"]              = 3                     # nearest stations reported per PLZ
+p["coverage_radius"]        = 500                   # residents within this distance [m] of a station count as covered
+p["coverage_samples"]       = 100                   # points per PLZ area over which its residents are spread for the coverage
+p["series_freq"]            = "MS"                  # periods of the time series by commissioning date (pandas frequency)
+p["series_start"]           = "2000-01-01"          # first period; stations dated earlier (e.g. mistyped years) are counted from it
+p["power_buckets"]          = {"AC": 22, "DC": None}    # charger classes by inclusive upper bound [kW], ascending
 # p["file_buildings"]         = "gebaeude.csv"
 p["file_residents"]         = "data/plz_einwohner.csv"
 # p["file_amounttraf"]        = "Verkehrsaufkommen.csv"
 
-p["file_geodat_plz"]       = "datasets/geodata_berlin_plz.csv"
-p["file_geodat_dis"]       = "datasets/geodata_berlin_dis.csv"
+p["map_mode"]               = "geojson"             # "geojson": embed the polygons, "tiles": load vector tiles (tiles.py)
+p["tiles_file"]             = "tiles/heatmap.mbtiles"
+p["tiles_url"]              = "http://localhost:8765/tiles/{z}/{x}/{y}.pbf"
+p["tiles_zoom"]             = (8, 14)               # min and max zoom level of the tile set
+p["serve_folder"]           = None                  # shared memory-mapped layer store (serving.py), None: every process loads its own layers
+
+# Regions the analysis can run for. The settings of the selected region are copied into `pdict`;
+# every region keeps its own artifacts under `picklefolder/<region>` (see `core.regions`). Regions
+# whose geometry files are missing (Deutschland unless the nationwide files are added to `datasets/`)
+# are not offered by `export.py`.
+#   lstat_bundesland:   Bundesland of the register rows, None for all
+#   lstat_plz_range:    open range of the declared station postal codes
+#   resid_plz_range:    open range of the resident postal codes
+#   bbox:               lon_min, lat_min, lon_max, lat_max; also sets the map extent
+#   crs_metric:         projected CRS for areas and distances
+#   file_geodat_*:      PLZ and district polygons: shapefile, GeoParquet or CSV with WKT (see core.geosource)
+#   geodat_*_key:       column of the PLZ or district name in that file
+p["regions"]                = {
+    "Berlin": {
+        "lstat_bundesland":     "Berlin",
+        "lstat_plz_range":      (10115, 14200),
+        "resid_plz_range":      (10000, 14200),
+        "bbox":                 (13.08, 52.33, 13.77, 52.68),
+        "crs_metric":           "EPSG:25833",       # ETRS89 / UTM 33N
+        "file_geodat_plz":      "datasets/berlin_postleitzahlen/berlin_postleitzahlen.shp",
+        "geodat_plz_key":       "PLZ99",
+        "file_geodat_dis":      "datasets/berlin_bezirke/bezirksgrenzen.shp",
+        "geodat_dis_key":       "Gemeinde_n",
+    },
+    "Deutschland": {
+        "lstat_bundesland":     None,
+        "lstat_plz_range":      (1000, 100000),
+        "resid_plz_range":      (1000, 100000),
+        "bbox":                 (5.86, 47.27, 15.05, 55.06),
+        "crs_metric":           "EPSG:3035",        # ETRS89 / LAEA Europe, equal-area
+        "file_geodat_plz":      "datasets/geodata_de_plz.csv",
+        "geodat_plz_key":       "PLZ",
+        "file_geodat_dis":      "datasets/geodata_de_kreis.csv",
+        "geodat_dis_key":       "Bezirk",
+    },
+}
+p["region"]                 = "Berlin"
+p.update(p["regions"][p["region"]])
 
 # p["gebaeude_filter"]        = ["Freistehendes Einzelgebäude", "Doppelhaushälfte"]
 
@@ -1,8 +1,8 @@
 import math
+import os
+import hashlib
 import pandas as pd
 
-import pickle
-
 import time    
 import functools   
 import random
@@ -13,7 +13,7 @@ from collections import Counter, OrderedDict
 def timer(func):
     """
     The `timer` function is a decorator in Python that measures and prints the runtime of the decorated
-    function.
+    function. Structured measurements of the pipeline stages are recorded by `core.metrics.instrument`.
     
     :param func: The `func` parameter in the `timer` function is a function that will be timed when it
     is called. The `timer` function is a decorator that calculates and prints the runtime of the
@@ -26,7 +26,7 @@ def timer(func):
         value = func(*args, **kwargs)
         end_time = time.perf_counter()  # 2
         run_time = end_time - start_time  # 3
-        print(" ====> Duration {:.2f} secs: {}".format(run_time, func.__doc__))
+        print(" ====> Duration {:.2f} secs: {}".format(run_time, func.__qualname__))
         return value
 
     return wrapper_timer #  no "()" here, we need the object to be returned.
@@ -54,36 +54,29 @@ def isElFilled(el, liste):
 validateIndex = lambda d: False if True in d.duplicated(keep="first") else False
 
 #------------------------------------------------------------------------------
-# Serialisierung    
-@timer 
-def pickle_out(objName, dateiName):
-    """
-    The function `pickle_out` serializes an object and saves it to a file using the pickle module in
-    Python.
-    
-    :param objName: The `objName` parameter in the `pickle_out` function is the object that you want to
-    serialize and save to a file using the `pickle` module in Python. This object can be any Python
-    object such as a dictionary, list, class instance, etc
-    :param dateiName: The `dateiName` parameter in the `pickle_out` function is the name of the file
-    where the object will be serialized and saved using the `pickle` module in Python. This parameter
-    specifies the file path where the serialized object will be stored
-    """
-    with open(dateiName, "wb") as p_out:
-        pickle.dump(objName, p_out)
+# Fingerprints of input files
+
+_digest_memo = {}
 
-@timer 
-def pickle_in(dateiName):
+def file_digest(dateiName, chunk_size=1 << 20):
     """
-    The function `pickle_in` deserializes data from a file using the `pickle` module in Python.
+    The function `file_digest` returns the modification time and the SHA-256 content hash of a file.
     
-    :param dateiName: The `dateiName` parameter in the `pickle_in` function is a string that represents
-    the name of the file from which you want to deserialize (load) data using the `pickle` module in
-    Python
-    :return: The function `pickle_in` is returning the deserialized object loaded from the file
-    specified by the `dateiName` parameter using the `pickle.load` method.
+    :param dateiName: The `dateiName` parameter is the path of the file to fingerprint
+    :param chunk_size: The `chunk_size` parameter is the number of bytes read per step while hashing,
+    so that large files are never loaded into memory at once
+    :return: A tuple `(mtime_ns, size, sha256)`. The hash is memoised on `(path, mtime_ns, size)`, so
+    an unchanged file is only read once per process.
     """
-    with open(dateiName, "rb") as p_in:
-        return pickle.load(p_in)
+    st_         = os.stat(dateiName)
+    memo_key    = (os.path.abspath(dateiName), st_.st_mtime_ns, st_.st_size)
+    if memo_key not in _digest_memo:
+        h = hashlib.sha256()
+        with open(dateiName, "rb") as f_in:
+            for block in iter(lambda: f_in.read(chunk_size), b""):
+                h.update(block)
+        _digest_memo[memo_key] = h.hexdigest()
+    return st_.st_mtime_ns, st_.st_size, _digest_memo[memo_key]
 
 #------------------------------------------------------------------------------
 
@@ -231,6 +224,24 @@ def popRowFromDF(dframe, indexVal):
     ShrinkedDF = dframe.drop(indexVal)
     return poppedRow, ShrinkedDF
 
+def sort_df(dframe, by, ascending=True):
+    """
+    The function `sort_df` sorts a DataFrame by one or more columns with a single stable sort and
+    returns it with a new index.
+    
+    :param dframe: The `dframe` parameter is the Pandas DataFrame to sort; it is not modified
+    :param by: The `by` parameter is a column name or a list of column names; later columns break ties
+    of earlier ones
+    :param ascending: The `ascending` parameter is a boolean, or a list with one boolean per column in
+    `by`
+    :return: The sorted DataFrame with a new index 0..n-1. Rows with equal keys keep their original
+    order, in ascending and in descending order alike, so the first occurrence wins on ties. Missing
+    values are placed last.
+    """
+    return dframe \
+        .sort_values(by=by, ascending=ascending, kind="stable", na_position="last") \
+        .reset_index(drop=True)
+
 @timer    
 def sortDF(dframe,col,asc):         #Pandas-df, String, Boolean
     """
@@ -239,40 +250,14 @@ def sortDF(dframe,col,asc):         #Pandas-df, String, Boolean
     
     :param dframe: The `dframe` parameter is a Pandas DataFrame that you want to sort based on a
     specific column
-    :param col: The `col` parameter in the `sortDF` function is a string that represents the column in
-    the DataFrame by which you want to sort the data. This column will be used to determine the order in
-    which the rows of the DataFrame will be sorted
+    :param col: The `col` parameter in the `sortDF` function is a string (or a list of strings) that
+    represents the column(s) in the DataFrame by which you want to sort the data
     :param asc: The `asc` parameter in the `sortDF` function is a boolean value that determines whether
-    the sorting should be done in ascending order (`True`) or descending order (`False`). If `asc` is
-    `True`, the DataFrame will be sorted in ascending order based on the specified column. If `
-    :return: The function `sortDF` returns a sorted DataFrame based on the specified column and sorting
-    order (ascending or descending).
+    the sorting should be done in ascending order (`True`) or descending order (`False`)
+    :return: The function `sortDF` returns a sorted DataFrame with a new index. If the highest/lowest
+    value occurs multiple times, the first occurrence comes first. See `sort_df`.
     """
-
-    dfColList = dframe.columns.values
-    retDF = pd.DataFrame(columns=dfColList)
-    while not dframe.empty:
-    #for i in range(4):      
-
-        dfCol = dframe[col]     
-
-        poppedStackdfCol = min(dfCol) if asc == True else max(dfCol)
-        poppedStackIndexVal = dframe \
-            .index[dframe[col] == poppedStackdfCol] \
-            .tolist()
-
-        #falls höchster/niedrigster Rang mehrfach vorliegt, wird der erste in Liste genommen 
-        #if highest/lowest rank occurs multiple times, the first one is included in the list
-        poppedRow, dframe = popRowFromDF(dframe, poppedStackIndexVal[0])        
-        dict_row = dict(zip(dfColList, poppedRow))
-#        retDF = pd.concat([retDF, dict_row], axis = 1, ignore_index = True)
-        
-        # retDF = retDF \
-        #     .append(dict_row, ignore_index = True)
-            
-        retDF = pd.concat([retDF, pd.DataFrame([dict_row])], ignore_index=True)
-
-    return retDF
+    return sort_df(dframe, col, asc)
 
 # END
 #------------------------------------------------------------------------------
@@ -0,0 +1,197 @@
+import numpy                         as np
+import pandas                        as pd
+import geopandas                     as gpd
+
+from core import metrics             as mt
+from core import schema              as sc
+
+
+# Columns that can be summed when rolling postal codes up to districts
+ADDITIVE_COLS = ['Number', 'KW_total', 'KW_n', 'Einwohner']
+
+# Additive station measures, the measures of the station cube
+STATION_COLS  = ['Number', 'KW_total', 'KW_n']
+
+# Bucket of stations without a rated power
+UNKNOWN_BUCKET = 'Unknown'
+
+
+def plz_bezirk_map(area_index):
+    """
+    The function `plz_bezirk_map` returns the district of every postal code area, as determined by
+    `core.spatial.build_area_index` from the area's representative point. Areas crossing a district
+    border are given to one district as a whole.
+
+    :param area_index: The `area_index` parameter is the index built by `core.spatial.build_area_index`
+    :return: A Series mapping each PLZ to its Bezirk (missing if the area lies outside all districts).
+    """
+    return area_index["PLZ"]["table"]['Bezirk']
+
+
+def station_totals(gdf_lstat, plz=None):
+    """
+    The function `station_totals` computes the additive station measures per postal code.
+
+    :param gdf_lstat: The `gdf_lstat` parameter is a station DataFrame with the columns `PLZ` and `KW`
+    :param plz: The optional `plz` parameter is the index of postal codes to report; codes without
+    stations get 0. By default only the codes of `gdf_lstat` are reported.
+    :return: A DataFrame indexed by PLZ with the columns `Number`, `KW_total` and `KW_n`.
+    """
+    ret = gdf_lstat.assign(KW=gdf_lstat['KW'].astype(sc.TOTALS['KW_total'])).groupby('PLZ').agg(
+        Number=('PLZ', 'size'),
+        KW_total=('KW', 'sum'),
+        KW_n=('KW', 'count'),
+    )
+    ret = ret if plz is None else ret.reindex(plz, fill_value=0)
+    return ret.astype({c: sc.TOTALS[c] for c in ret.columns})
+
+
+def add_ratios(dframe):
+    """
+    The function `add_ratios` derives the non-additive columns from the additive ones, so that they
+    are computed the same way at every level.
+
+    :param dframe: The `dframe` parameter is a DataFrame with the columns in `ADDITIVE_COLS` and the area
+    `Area_km2`
+    :return: The dataframe with `KW_mean`, `Stations_per_10k` and `Stations_per_km2` (missing where
+    undefined).
+    """
+    dframe['KW_mean']           = dframe['KW_total'] / dframe['KW_n'].where(dframe['KW_n'] > 0)
+    dframe['Stations_per_10k']  = 1e4 * dframe['Number'] / dframe['Einwohner'].where(dframe['Einwohner'] > 0)
+    dframe['Stations_per_km2']  = dframe['Number'] / dframe['Area_km2'].where(dframe['Area_km2'] > 0)
+    return dframe
+
+
+@mt.instrument("aggregate_plz")
+def aggregate_plz(gdf_lstat, gdf_resid, area_index, plz_bezirk):
+    """
+    The function `aggregate_plz` computes the station count, total and mean charging power, residents
+    and stations per 10k residents of every postal code area in one grouped pass over the stations.
+
+    :param gdf_lstat: The `gdf_lstat` parameter is the station GeoDataFrame of `preprop_lstat` with the
+    columns `PLZ` and `KW`
+    :param gdf_resid: The `gdf_resid` parameter is the resident GeoDataFrame of `preprop_resid`
+    :param area_index: The `area_index` parameter is the index built by `core.spatial.build_area_index`;
+    it provides the PLZ polygons
+    :param plz_bezirk: The `plz_bezirk` parameter is the Series of `plz_bezirk_map`
+    :return: A GeoDataFrame with one row per PLZ polygon, its Bezirk, `ADDITIVE_COLS`, its area and the
+    ratios of `add_ratios`. Areas without stations have a count of 0.
+    """
+    plz         = pd.Index(area_index["PLZ"]["keys"], name='PLZ')
+
+    stations    = station_totals(gdf_lstat, plz)
+    residents   = gdf_resid.groupby('PLZ')['Einwohner'].sum().reindex(plz, fill_value=0)
+
+    ret         = stations.assign(Einwohner=residents.astype(sc.TOTALS['Einwohner']),
+                                  Area_km2=area_index["PLZ"]["area_km2"],
+                                  Bezirk=plz_bezirk.reindex(plz)).reset_index()
+    ret['PLZ']  = sc.plz_code(ret['PLZ'])
+    ret         = add_ratios(ret)
+    return gpd.GeoDataFrame(ret, geometry=area_index["PLZ"]["geoms"])
+
+
+@mt.instrument("rollup_bezirk")
+def rollup_bezirk(agg_plz, area_index):
+    """
+    The function `rollup_bezirk` rolls the postal code totals of `aggregate_plz` up to districts. Only
+    the additive columns are summed; the area is that of the district polygon and the ratios are
+    derived again from the district totals.
+
+    :param agg_plz: The `agg_plz` parameter is the GeoDataFrame of `aggregate_plz`
+    :param area_index: The `area_index` parameter is the index built by `core.spatial.build_area_index`;
+    it provides the district polygons
+    :return: A GeoDataFrame with one row per district polygon and the same measures as `agg_plz`.
+    """
+    bezirk      = pd.Index(area_index["Bezirk"]["keys"], name='Bezirk')
+    ret         = agg_plz.groupby('Bezirk')[ADDITIVE_COLS].sum().reindex(bezirk, fill_value=0).astype(sc.TOTALS)
+    ret         = add_ratios(ret.assign(Area_km2=area_index["Bezirk"]["area_km2"]).reset_index())
+    return gpd.GeoDataFrame(ret, geometry=area_index["Bezirk"]["geoms"])
+
+
+# -----------------------------------------------------------------------------
+def power_bucket(kw, pdict):
+    """
+    The function `power_bucket` assigns every charging power to a bucket of `pdict["power_buckets"]`.
+
+    :param kw: The `kw` parameter is a Series of rated powers in kW; missing values are allowed
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["power_buckets"]` maps the
+    bucket names to their inclusive upper bound in kW (None for no bound), in ascending order
+    :return: A Categorical with the bucket names and `UNKNOWN_BUCKET` for missing powers as categories.
+    """
+    names   = list(pdict["power_buckets"])
+    bounds  = [np.inf if b is None else b for b in pdict["power_buckets"].values()]
+    # missing powers sort behind every bound and get the code of the unknown bucket
+    codes   = np.searchsorted(bounds, np.asarray(kw, dtype="float64"), side='left')
+    return pd.Categorical.from_codes(codes, categories=names + [UNKNOWN_BUCKET])
+
+
+@mt.instrument("station_cube")
+def station_cube(gdf_lstat, plz, pdict):
+    """
+    The function `station_cube` pre-aggregates the stations into a dense cube keyed by region, postal
+    code and power bucket, so that filters on the charger class are slices of the cube instead of
+    groupbys over the stations.
+
+    :param gdf_lstat: The `gdf_lstat` parameter is the station GeoDataFrame of `preprop_lstat` with the
+    columns `PLZ` and `KW`
+    :param plz: The `plz` parameter lists the postal codes of the region, e.g. `agg_plz['PLZ']`; every
+    code gets a row per bucket, also without stations
+    :param pdict: The `pdict` parameter is the configuration dictionary; it provides `region` and
+    `power_buckets`
+    :return: A DataFrame with the columns `Region`, `PLZ`, `Bucket` and `STATION_COLS`, sorted by PLZ and
+    bucket with one row per combination.
+    """
+    buckets = power_bucket(gdf_lstat['KW'], pdict)
+    full    = pd.MultiIndex.from_product([pd.Index(plz, name='PLZ'), buckets.categories], names=['PLZ', 'Bucket'])
+    ret     = gdf_lstat.assign(KW=gdf_lstat['KW'].astype(sc.TOTALS['KW_total']), Bucket=buckets) \
+                .groupby(['PLZ', 'Bucket'], observed=True).agg(
+                    Number=('PLZ', 'size'),
+                    KW_total=('KW', 'sum'),
+                    KW_n=('KW', 'count'),
+                ).reindex(full, fill_value=0).reset_index()
+    ret['Bucket']   = pd.Categorical(ret['Bucket'], categories=buckets.categories)
+    ret.insert(0, 'Region', pd.Series(pdict["region"], index=ret.index, dtype='str'))
+    return ret.astype({c: sc.TOTALS[c] for c in STATION_COLS})
+
+
+def cube_slice(cube, buckets=None, regions=None):
+    """
+    The function `cube_slice` sums the station measures of the selected buckets per postal code. The
+    dense layout of `station_cube` lets the buckets be added column-wise, without a groupby.
+
+    :param cube: The `cube` parameter is a cube of `station_cube`, or several concatenated
+    :param buckets: The `buckets` parameter lists the buckets to keep (default: all)
+    :param regions: The `regions` parameter lists the regions to keep (default: all)
+    :return: A DataFrame with the columns `Region`, `PLZ` and `STATION_COLS`, one row per postal code.
+    """
+    categories  = cube['Bucket'].cat.categories
+    n_buckets   = len(categories)
+    keep        = np.isin(categories, list(categories) if buckets is None else list(buckets))
+    ret         = cube[['Region', 'PLZ']].iloc[::n_buckets].reset_index(drop=True)
+    for col in STATION_COLS:
+        ret[col] = cube[col].to_numpy().reshape(-1, n_buckets)[:, keep].sum(axis=1).astype(cube[col].dtype)
+    return ret if regions is None else ret[ret['Region'].isin(regions)].reset_index(drop=True)
+
+
+def filter_power(agg_plz, agg_bezirk, cube, buckets):
+    """
+    The function `filter_power` restricts the station measures of the aggregates to the selected power
+    buckets. Residents, areas and geometry are kept; the ratios are derived again.
+
+    :param agg_plz: The `agg_plz` parameter is the GeoDataFrame of `aggregate_plz`
+    :param agg_bezirk: The `agg_bezirk` parameter is the GeoDataFrame of `rollup_bezirk`
+    :param cube: The `cube` parameter is the cube of `station_cube` for the region of the aggregates
+    :param buckets: The `buckets` parameter lists the buckets to keep
+    :return: A tuple `(agg_plz, agg_bezirk)` of filtered copies.
+    """
+    totals      = cube_slice(cube, buckets).set_index('PLZ').reindex(agg_plz['PLZ'].values)
+    plz         = agg_plz.copy()
+    for col in STATION_COLS:
+        plz[col] = totals[col].fillna(0).to_numpy().astype(plz[col].dtype)
+    plz         = add_ratios(plz)
+
+    rolled      = plz.groupby('Bezirk')[STATION_COLS].sum().reindex(agg_bezirk['Bezirk'].values, fill_value=0)
+    bezirk      = agg_bezirk.copy()
+    for col in STATION_COLS:
+        bezirk[col] = rolled[col].to_numpy().astype(bezirk[col].dtype)
+    return plz, add_ratios(bezirk)
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+
+import pandas                        as pd
+import geopandas                     as gpd
+import core.HelperTools              as ht
+from core import geosource           as gs
+
+
+# Layout of the files written by this module. Bump it when the on-disk layout changes.
+FORMAT_VERSION  = 2
+
+# Version of each preprocessing stage. Bump an entry when the code of that stage changes so that
+# stored artifacts built by the old code are rebuilt.
+STAGE_VERSIONS  = {
+    "lstat_rows":   3,      # ingest.row_state
+    "lstat":        9,      # preprop_lstat
+    "lstat_count":  1,      # count_plz_occurrences
+    "resid":        4,      # preprop_resid
+    "agg_plz":      2,      # aggregate.aggregate_plz
+    "agg_bezirk":   2,      # aggregate.rollup_bezirk
+    "adj_plz":      1,      # spatial.neighbours
+    "adj_bezirk":   1,      # spatial.neighbours
+    "gap_plz":      1,      # gap.gap_analysis
+    "gap_bezirk":   1,      # gap.gap_analysis
+    "prox_plz":     2,      # proximity.proximity_plz
+    "cube_plz":     1,      # aggregate.station_cube
+    "series_plz":   2,      # timeseries.station_series
+    "series_bezirk": 1,     # timeseries.rollup_series
+}
+
+# `pdict` keys of the input files each stage reads
+STAGE_SOURCES   = {
+    "lstat_rows":   ("file_lstations",),
+    "lstat":        ("file_lstations", "file_geodat_plz", "file_geodat_dis"),
+    "lstat_count":  (),
+    "resid":        ("file_residents", "file_geodat_plz"),
+    "agg_plz":      ("file_geodat_plz", "file_geodat_dis"),
+    "agg_bezirk":   ("file_geodat_dis",),
+    "adj_plz":      ("file_geodat_plz",),
+    "adj_bezirk":   ("file_geodat_dis",),
+    "gap_plz":      (),
+    "gap_bezirk":   (),
+    "prox_plz":     (),
+    "cube_plz":     (),
+    "series_plz":   (),
+    "series_bezirk": (),
+}
+
+# `pdict` settings of the area polygons: the region's extent, the key columns and the CRS areas are
+# measured in (`core.geosource.read_areas`, `core.spatial.build_area_index`)
+AREA_SETTINGS   = ("bbox", "geocode", "geodat_plz_key", "geodat_dis_key", "crs_metric")
+
+# Filters applied while reading the charging register (`core.ingest.read_lstations`)
+REGISTER_SETTINGS = ("lstat_bundesland", "lstat_plz_range", "plz_assignment")
+
+# `pdict` settings each stage's own computation depends on. Settings of upstream stages are covered
+# by the checksums of their artifacts; runtime and display settings are not listed anywhere.
+STAGE_SETTINGS  = {
+    "lstat_rows":   REGISTER_SETTINGS + ("bbox",),
+    "lstat":        REGISTER_SETTINGS + AREA_SETTINGS,
+    "lstat_count":  (),
+    "resid":        ("resid_plz_range",) + AREA_SETTINGS,
+    "agg_plz":      AREA_SETTINGS,
+    "agg_bezirk":   AREA_SETTINGS,
+    "adj_plz":      AREA_SETTINGS,
+    "adj_bezirk":   AREA_SETTINGS,
+    "gap_plz":      ("gap_smoothing",),
+    "gap_bezirk":   ("gap_smoothing",),
+    "prox_plz":     ("crs_metric", "nearest_k", "coverage_radius", "coverage_samples"),
+    "cube_plz":     ("region", "power_buckets"),
+    "series_plz":   ("series_freq", "series_start"),
+    "series_bezirk": (),
+}
+
+
+def artifact_paths(pdict, stage):
+    """
+    The function `artifact_paths` returns where the data and the manifest of a stage are stored.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["picklefolder"]` is the
+    root folder of the store, which holds one folder per region (`pdict["region"]`)
+    :param stage: The `stage` parameter is the name of the stage, a key of `STAGE_VERSIONS`
+    :return: A tuple `(data_path, manifest_path)`.
+    """
+    base = os.path.join(pdict["picklefolder"], pdict["region"], stage)
+    return base + ".parquet", base + ".json"
+
+
+def stage_provenance(pdict, stage, upstream=None):
+    """
+    The function `stage_provenance` describes everything a stage's output depends on: the code version
+    of the stage, the content hashes of its input files, its settings and the checksums of the upstream
+    artifacts it was built from.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary
+    :param stage: The `stage` parameter is the name of the stage; its input files are listed in
+    `STAGE_SOURCES` and its settings in `STAGE_SETTINGS`
+    :param upstream: The `upstream` parameter maps names of upstream stages to the checksum of the
+    artifact they produced
+    :return: A JSON-serialisable dictionary. Two equal provenances describe the same output.
+    """
+    # input files are covered by their content hash, not by their path
+    settings = {k: pdict[k] for k in STAGE_SETTINGS[stage]}
+    return {
+        "stage":            stage,
+        "stage_version":    STAGE_VERSIONS[stage],
+        "sources":          {k: gs.dataset_digest(pdict[k])[2] for k in STAGE_SOURCES[stage]},
+        "upstream":         dict(upstream or {}),
+        "settings":         json.loads(json.dumps(settings, sort_keys=True, default=str)),
+    }
+
+
+def same_provenance(prov_a, prov_b, ignore=()):
+    """
+    The function `same_provenance` compares two provenances while disregarding some input files, e.g.
+    to find out whether a stored artifact differs from the current inputs only by its register file.
+
+    :param prov_a: The `prov_a` parameter is a result of `stage_provenance`
+    :param prov_b: The `prov_b` parameter is a result of `stage_provenance`
+    :param ignore: The `ignore` parameter lists `pdict` keys whose file content and setting are not
+    compared
+    :return: True if both provenances agree on everything else.
+    """
+    strip = lambda prov: dict(prov, sources={k: v for k, v in prov["sources"].items() if k not in ignore},
+                              settings={k: v for k, v in prov["settings"].items() if k not in ignore})
+    return strip(prov_a) == strip(prov_b)
+
+
+def stored_provenance(pdict, stage):
+    """Provenance of the artifact currently stored for a stage, or None; the data file is not read."""
+    try:
+        with open(artifact_paths(pdict, stage)[1], encoding="utf-8") as f_in:
+            manifest = json.load(f_in)
+    except (OSError, ValueError):
+        return None
+    return manifest.get("provenance") if manifest.get("format_version") == FORMAT_VERSION else None
+
+
+def load_artifact(pdict, stage, provenance=None):
+    """
+    The function `load_artifact` reads a stored stage output back if it was built from exactly the
+    given provenance and its checksum still matches. Geometries are stored as WKB in GeoParquet, so no
+    WKT is parsed; outputs without geometry are read as plain DataFrames.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary
+    :param stage: The `stage` parameter is the name of the stage
+    :param provenance: The `provenance` parameter is the result of `stage_provenance` for the inputs at
+    hand. Without it, whatever artifact is stored is returned, whatever it was built from.
+    :return: A tuple `(GeoDataFrame, manifest)`, or `(None, None)` if the artifact is missing, stale or
+    corrupt.
+    """
+    data_path, manifest_path = artifact_paths(pdict, stage)
+    try:
+        with open(manifest_path, encoding="utf-8") as f_in:
+            manifest = json.load(f_in)
+    except (OSError, ValueError):
+        return None, None
+
+    if manifest.get("format_version") != FORMAT_VERSION:
+        return None, None
+    if provenance is not None and manifest.get("provenance") != provenance:
+        return None, None
+    if not os.path.exists(data_path) or ht.file_digest(data_path)[2] != manifest.get("sha256"):
+        return None, None
+
+    if manifest.get("geometry", True):
+        return gpd.read_parquet(data_path), manifest
+    return pd.read_parquet(data_path), manifest
+
+
+def save_artifact(pdict, stage, gdf, provenance):
+    """
+    The function `save_artifact` writes a stage output as GeoParquet together with a JSON manifest
+    holding the format version, the checksum of the data file and the provenance. Both files are
+    replaced atomically.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary
+    :param stage: The `stage` parameter is the name of the stage
+    :param gdf: The `gdf` parameter is the output of the stage as a GeoDataFrame (or a DataFrame for
+    stages without geometry)
+    :param provenance: The `provenance` parameter is the result of `stage_provenance`
+    :return: The manifest that was written.
+    """
+    data_path, manifest_path = artifact_paths(pdict, stage)
+    os.makedirs(os.path.dirname(data_path) or ".", exist_ok=True)
+
+    gdf.to_parquet(data_path + ".tmp")
+    os.replace(data_path + ".tmp", data_path)
+
+    manifest = {
+        "format_version":   FORMAT_VERSION,
+        "created":          time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "rows":             len(gdf),
+        "geometry":         isinstance(gdf, gpd.GeoDataFrame),
+        "sha256":           ht.file_digest(data_path)[2],
+        "provenance":       provenance,
+    }
+    with open(manifest_path + ".tmp", "w", encoding="utf-8") as f_out:
+        json.dump(manifest, f_out, indent=2, ensure_ascii=False)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return manifest
+
+
+def get_or_build(pdict, stage, provenance, build):
+    """
+    The function `get_or_build` returns the stored output of a stage, calling `build` and storing its
+    result only when the stored artifact is missing or its inputs changed. A plain DataFrame with a
+    `geometry` column returned by `build` is converted to a GeoDataFrame, as it would be when loaded.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary
+    :param stage: The `stage` parameter is the name of the stage
+    :param provenance: The `provenance` parameter is the result of `stage_provenance`
+    :param build: The `build` parameter is a function without arguments computing the stage output
+    :return: A tuple `(GeoDataFrame, sha256)`; the checksum identifies the artifact for downstream
+    provenances.
+    """
+    gdf, manifest = load_artifact(pdict, stage, provenance)
+    if gdf is None:
+        print(" ====> Rebuilding artifact: {}".format(stage))
+        gdf         = build()
+        if not isinstance(gdf, gpd.GeoDataFrame) and "geometry" in gdf:
+            gdf     = gpd.GeoDataFrame(gdf, geometry="geometry")
+        manifest    = save_artifact(pdict, stage, gdf, provenance)
+    return gdf, manifest["sha256"]
@@ -0,0 +1,334 @@
+import os
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import core.HelperTools              as ht
+from core import methods             as m1
+from core import artifacts           as ar
+from core import ingest              as ig
+from core import spatial             as sp
+from core import aggregate           as ag
+from core import delta               as dt
+from core import gap                 as gp
+from core import proximity           as px
+from core import geosource           as gs
+from core import timeseries          as ts
+
+
+# Input files whose content determines the prepared layers
+SOURCE_KEYS = ("file_geodat_plz", "file_geodat_dis", "file_lstations", "file_residents")
+
+# Default upper bound of the loader threads, one per source file
+MAX_LOADER_WORKERS = 4
+
+# Prepared layers of the current process, one `(cache_key, layers)` entry per region. Streamlit
+# re-executes `main.py` on every widget interaction, but imported modules stay loaded, so this cache
+# survives reruns.
+_layers_cache   = {}
+_layers_lock    = threading.Lock()
+_region_locks   = {}                # one lock per region, so regions can be built concurrently
+
+
+def source_fingerprint(pdict):
+    """
+    The function `source_fingerprint` describes the current state of every input file listed in
+    `SOURCE_KEYS`.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary holding the input file paths
+    :return: A tuple of `(path, mtime_ns, size, sha256)` entries, one per input file.
+    """
+    return tuple((pdict[k],) + gs.dataset_digest(pdict[k]) for k in SOURCE_KEYS)
+
+
+def cache_key(pdict):
+    """
+    The function `cache_key` builds the key under which the prepared layers are cached. It combines the
+    mtime and content hash of every input file with the settings in `pdict`.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary
+    :return: A hashable key that changes as soon as an input file or a setting changes.
+    """
+    settings = json.dumps(pdict, sort_keys=True, default=str)
+    return (source_fingerprint(pdict), settings)
+
+
+class _Task:
+    """
+    Result of `func`, computed at most once: by a worker of the pool once `start` was called, or by the
+    first thread asking for it. A task that is waited for before a worker picked it up runs in the
+    waiting thread, so tasks waiting for each other cannot block the pool.
+    """
+    def __init__(self, func):
+        self.func       = func
+        self.future     = Future()
+        self.taken      = False
+        self.lock       = threading.Lock()
+
+    def _run(self):
+        with self.lock:
+            if self.taken:
+                return
+            self.taken = True
+        try:
+            self.future.set_result(self.func())
+        except BaseException as exc:
+            self.future.set_exception(exc)
+
+    def start(self, pool):
+        if pool is not None:
+            pool.submit(self._run)
+        return self
+
+    def result(self):
+        self._run()
+        return self.future.result()
+
+# -----------------------------------------------------------------------------
+@ht.timer
+def build_layers(pdict):
+    """Build the station and resident GeoDataFrames, reusing stored artifacts where possible
+
+    Every stage is looked up in the artifact store under `pdict["picklefolder"]` first; a source file is
+    only read when a stage depending on it has to be rebuilt. With `pdict["lstat_update"] == "delta"` a
+    new charging register is applied to the stored station layers by `core.delta.update_stations`.
+
+    With more than one loader thread (`pdict["loader_workers"]`, by default one per CPU core and at
+    most `MAX_LOADER_WORKERS`) the source files needed by stale stages are read concurrently and the
+    station and resident stages run in parallel; the WKT geometry is parsed once into the area index
+    shared by both. pandas and pyarrow release the GIL while reading the files, so the threads overlap;
+    shapely holds it while parsing WKT, which is why large WKT files are parsed in worker processes
+    instead (`core.spatial.parse_geometry`).
+
+    :param pdict: The `pdict` parameter is the configuration dictionary with the input file paths
+    :return: A dictionary with the charging stations per postal code (`lstat`), the residents per
+    postal code (`resid`), the measures of `core.aggregate` per postal code (`agg_plz`) and per
+    district (`agg_bezirk`), the neighbours of every postal code (`adj_plz`) and district (`adj_bezirk`)
+    as tables of `core.spatial.adjacency_table`, the supply gaps of `core.gap` per postal code
+    (`gap_plz`) and per district (`gap_bezirk`) together with the coverage of
+    `core.proximity.add_coverage`, the distances to the nearest stations per postal code (`prox_plz`), the
+    station cube per postal code and power bucket (`cube_plz`) and the cumulative station measures per
+    period of commissioning and postal code (`series_plz`) or district (`series_bezirk`).
+    """
+    workers = pdict["loader_workers"] or min(MAX_LOADER_WORKERS, os.cpu_count() or 1)
+    if workers <= 1:
+        return _build_layers(pdict, None)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="loader") as pool:
+        return _build_layers(pdict, pool)
+
+
+def _build_layers(pdict, pool):
+    """The stages of `build_layers`; the sources are read and the branches run in `pool` if given."""
+
+    # Every source is read at most once, by a worker if it was started below or else on first use
+    geodat_plz      = _Task(lambda: gs.read_areas(pdict, "PLZ"))
+    geodat_dis      = _Task(lambda: gs.read_areas(pdict, "Bezirk"))
+    register        = _Task(lambda: ig.read_lstations(pdict))
+    residents       = _Task(lambda: ig.read_residents(pdict))
+
+    # PLZ and Bezirk polygons and the per-PLZ lookup table, built at most once and only if a stage
+    # needs them; both branches share it
+    area_index      = _Task(lambda: sp.build_area_index(geodat_plz.result(), geodat_dis.result(), pdict))
+    get_area_index  = area_index.result
+    read_register   = register.result
+
+    def preprocess(df_lstat):
+        # Preprocess electric charging station data, locating every station in the PLZ and Bezirk polygons
+        return m1.preprop_lstat(df_lstat, get_area_index(), pdict)
+
+    def build_resid():
+        # Preprocess resident data
+        return m1.preprop_resid(residents.result(), get_area_index(), pdict)
+
+    def build_agg_plz():
+        # Measures per postal code, each assigned to its district
+        plz_bezirk          = ag.plz_bezirk_map(get_area_index())
+        return ag.aggregate_plz(gdf_lstat2, gdf_residents2, get_area_index(), plz_bezirk)
+
+    prov_resid              = ar.stage_provenance(pdict, "resid")
+    prov_lstat              = ar.stage_provenance(pdict, "lstat")
+
+    # Start reading the sources of the stages that are not stored yet
+    stale_resid             = ar.stored_provenance(pdict, "resid") != prov_resid
+    stale_lstat             = ar.stored_provenance(pdict, "lstat") != prov_lstat
+    if stale_lstat:
+        register.start(pool)
+    if stale_resid:
+        residents.start(pool)
+    if stale_resid or stale_lstat:
+        geodat_plz.start(pool)
+        geodat_dis.start(pool)
+        area_index.start(pool)
+
+    resid_branch            = _Task(lambda: ar.get_or_build(pdict, "resid", prov_resid, build_resid)).start(pool)
+
+    def build_stations():
+        # A new register is applied as a delta to the stored station layers if they allow it; the
+        # updated outputs are then stored below like freshly built ones
+        updated             = {}
+        if pdict["lstat_update"] == "delta" and stale_lstat:
+            updated         = dt.update_stations(pdict, read_register, preprocess, resid_branch.result()[1]) or {}
+        build               = lambda stage, func: (lambda: updated[stage]) if stage in updated else func
+
+        prov_rows           = ar.stage_provenance(pdict, "lstat_rows")
+        ar.get_or_build(pdict, "lstat_rows", prov_rows, build("lstat_rows", lambda: ig.row_state(read_register())))
+
+        gdf_lstat2, sha_lstat = ar.get_or_build(pdict, "lstat", prov_lstat,
+                                                build("lstat", lambda: preprocess(read_register())))
+
+        prov_count          = ar.stage_provenance(pdict, "lstat_count", upstream={"lstat": sha_lstat})
+        gdf_lstat3, _       = ar.get_or_build(pdict, "lstat_count", prov_count,
+                                              build("lstat_count", lambda: m1.count_plz_occurrences(gdf_lstat2)))
+        return gdf_lstat2, sha_lstat, gdf_lstat3, build
+
+    station_branch          = _Task(build_stations).start(pool)
+    gdf_residents2, sha_resid = resid_branch.result()
+    gdf_lstat2, sha_lstat, gdf_lstat3, build = station_branch.result()
+
+    # Measures per PLZ, rolled up to Bezirk level from the PLZ totals
+    prov_agg_plz            = ar.stage_provenance(pdict, "agg_plz", upstream={"lstat": sha_lstat,
+                                                                               "resid": sha_resid})
+    gdf_agg_plz, sha_agg    = ar.get_or_build(pdict, "agg_plz", prov_agg_plz, build("agg_plz", build_agg_plz))
+
+    prov_agg_bezirk         = ar.stage_provenance(pdict, "agg_bezirk", upstream={"agg_plz": sha_agg})
+    gdf_agg_bezirk, sha_agg_bezirk = ar.get_or_build(pdict, "agg_bezirk", prov_agg_bezirk,
+                                              build("agg_bezirk", lambda: ag.rollup_bezirk(gdf_agg_plz,
+                                                                                          get_area_index())))
+
+    # Neighbours of every area, in the order of the aggregates; only rebuilt when the polygons change
+    prov_adj_plz            = ar.stage_provenance(pdict, "adj_plz")
+    df_adj_plz, sha_adj_plz = ar.get_or_build(pdict, "adj_plz", prov_adj_plz,
+                                              lambda: sp.adjacency_table(get_area_index()["PLZ"]["adjacency"]))
+
+    prov_adj_bezirk         = ar.stage_provenance(pdict, "adj_bezirk")
+    df_adj_bezirk, sha_adj_bezirk = ar.get_or_build(pdict, "adj_bezirk", prov_adj_bezirk,
+                                              lambda: sp.adjacency_table(get_area_index()["Bezirk"]["adjacency"]))
+
+    # Supply gaps, smoothed over neighbouring areas of the same level
+    prov_gap_plz            = ar.stage_provenance(pdict, "gap_plz", upstream={"agg_plz": sha_agg,
+                                                                              "adj_plz": sha_adj_plz})
+    gdf_gap_plz, _          = ar.get_or_build(pdict, "gap_plz", prov_gap_plz,
+                                              lambda: gp.gap_analysis(gdf_agg_plz, df_adj_plz, pdict))
+
+    prov_gap_bezirk         = ar.stage_provenance(pdict, "gap_bezirk", upstream={"agg_bezirk": sha_agg_bezirk,
+                                                                                 "adj_bezirk": sha_adj_bezirk})
+    gdf_gap_bezirk, _       = ar.get_or_build(pdict, "gap_bezirk", prov_gap_bezirk,
+                                              lambda: gp.gap_analysis(gdf_agg_bezirk, df_adj_bezirk, pdict))
+
+    # Distances to the nearest stations and residents within reach of one
+    prov_prox               = ar.stage_provenance(pdict, "prox_plz", upstream={"lstat": sha_lstat,
+                                                                               "resid": sha_resid,
+                                                                               "agg_plz": sha_agg})
+    df_prox_plz, _          = ar.get_or_build(pdict, "prox_plz", prov_prox,
+                                              lambda: px.proximity_plz(gdf_lstat2, gdf_residents2, gdf_agg_plz, pdict))
+
+    # Station measures per PLZ and power bucket, for filtering by charger class
+    prov_cube               = ar.stage_provenance(pdict, "cube_plz", upstream={"lstat": sha_lstat,
+                                                                               "agg_plz": sha_agg})
+    df_cube_plz, _          = ar.get_or_build(pdict, "cube_plz", prov_cube,
+                                              lambda: ag.station_cube(gdf_lstat2, gdf_agg_plz['PLZ'], pdict))
+
+    # Cumulative station measures per period of commissioning, per PLZ and rolled up per Bezirk
+    prov_series_plz         = ar.stage_provenance(pdict, "series_plz", upstream={"lstat": sha_lstat,
+                                                                                  "agg_plz": sha_agg})
+    df_series_plz, sha_series = ar.get_or_build(pdict, "series_plz", prov_series_plz,
+                                              lambda: ts.station_series(gdf_lstat2, gdf_agg_plz['PLZ'], pdict))
+
+    prov_series_bezirk      = ar.stage_provenance(pdict, "series_bezirk", upstream={"series_plz": sha_series,
+                                                                                     "agg_bezirk": sha_agg_bezirk})
+    df_series_bezirk, _     = ar.get_or_build(pdict, "series_bezirk", prov_series_bezirk,
+                                              lambda: ts.rollup_series(df_series_plz, gdf_agg_plz, gdf_agg_bezirk))
+
+    # The gap layers also carry the distances and coverage of the current register
+    gdf_gap_plz, gdf_gap_bezirk = px.add_coverage(gdf_gap_plz, gdf_gap_bezirk, df_prox_plz)
+
+    return {
+        "lstat":        gdf_lstat3,
+        "resid":        gdf_residents2,
+        "agg_plz":      gdf_agg_plz,
+        "agg_bezirk":   gdf_agg_bezirk,
+        "adj_plz":      df_adj_plz,
+        "adj_bezirk":   df_adj_bezirk,
+        "gap_plz":      gdf_gap_plz,
+        "gap_bezirk":   gdf_gap_bezirk,
+        "prox_plz":     df_prox_plz,
+        "cube_plz":     df_cube_plz,
+        "series_plz":   df_series_plz,
+        "series_bezirk": df_series_bezirk,
+    }
+
+
+def _station_layers(layers, agg_plz, agg_bezirk, pdict):
+    """Layers with the station measures of `agg_plz` and `agg_bezirk`, their station areas and gaps. The
+    coverage of the gap layers stays that of the current register."""
+    gap_plz, gap_bezirk = px.add_coverage(gp.gap_analysis(agg_plz, layers["adj_plz"], pdict),
+                                          gp.gap_analysis(agg_bezirk, layers["adj_bezirk"], pdict),
+                                          layers["prox_plz"])
+    return dict(layers,
+                lstat=agg_plz.loc[agg_plz['Number'] > 0, ['PLZ', 'Number', 'geometry']].reset_index(drop=True),
+                agg_plz=agg_plz,
+                agg_bezirk=agg_bezirk,
+                gap_plz=gap_plz,
+                gap_bezirk=gap_bezirk)
+
+
+def filter_layers(layers, buckets, pdict):
+    """
+    The function `filter_layers` restricts the station layers to chargers of the selected power buckets.
+    The measures are sliced from the station cube and the supply gaps recomputed; no station row is
+    touched.
+
+    :param layers: The `layers` parameter is the dictionary of `build_layers`
+    :param buckets: The `buckets` parameter lists buckets of `pdict["power_buckets"]`, or
+    `core.aggregate.UNKNOWN_BUCKET`
+    :param pdict: The `pdict` parameter is the configuration dictionary
+    :return: A dictionary like `layers` with filtered `lstat` (areas with stations only), `agg_plz`,
+    `agg_bezirk`, `gap_plz` and `gap_bezirk`.
+    """
+    agg_plz, agg_bezirk = ag.filter_power(layers["agg_plz"], layers["agg_bezirk"], layers["cube_plz"], buckets)
+    return _station_layers(layers, agg_plz, agg_bezirk, pdict)
+
+
+def period_layers(layers, period, pdict):
+    """
+    The function `period_layers` shows the station layers as of the end of a period of the time series:
+    only stations commissioned until then (and with a known commissioning date) are counted. The
+    measures are one block of the precomputed series; only the supply gaps are recomputed.
+
+    :param layers: The `layers` parameter is the dictionary of `build_layers`
+    :param period: The `period` parameter is a period of `layers["series_plz"]`, see
+    `core.timeseries.series_periods`
+    :param pdict: The `pdict` parameter is the configuration dictionary
+    :return: A dictionary like `layers` with `lstat`, `agg_plz`, `agg_bezirk`, `gap_plz` and `gap_bezirk`
+    of the period.
+    """
+    agg_plz     = ts.at_period(layers["agg_plz"], layers["series_plz"], period)
+    agg_bezirk  = ts.at_period(layers["agg_bezirk"], layers["series_bezirk"], period)
+    return _station_layers(layers, agg_plz, agg_bezirk, pdict)
+
+
+def load_layers(pdict):
+    """
+    The function `load_layers` returns the prepared layers, building them only when no cached copy for
+    the current input files and settings exists. Every region is cached separately; its entry is
+    replaced when a source file or a setting changes.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary of one region
+    :return: The dictionary produced by `build_layers`. It is shared between reruns and must be treated
+    as read-only.
+    """
+    key     = cache_key(pdict)
+    region  = pdict["region"]
+    with _layers_lock:
+        lock = _region_locks.setdefault(region, threading.Lock())
+    with lock:
+        cached = _layers_cache.get(region)
+        if cached is None or cached[0] != key:
+            cached = _layers_cache[region] = (key, build_layers(pdict))
+        return cached[1]
+
+
+def clear_cache():
+    """Drop all cached layers."""
+    with _layers_lock:
+        _layers_cache.clear()
@@ -0,0 +1,158 @@
+import pandas                        as pd
+import geopandas                     as gpd
+
+import core.HelperTools              as ht
+from core import artifacts           as ar
+from core import aggregate           as ag
+from core import ingest              as ig
+from core import layers              as ly
+from core import metrics             as mt
+
+
+# Stages derived from the charging register, in build order
+STATION_STAGES = ("lstat_rows", "lstat", "lstat_count", "agg_plz", "agg_bezirk")
+
+
+def diff_rows(prev_rows, new_rows):
+    """
+    The function `diff_rows` compares two register snapshots by the row keys and content hashes of
+    `core.ingest.read_lstations`.
+
+    :param prev_rows: The `prev_rows` parameter is the `Key`/`RowHash` DataFrame of the last processed
+    snapshot
+    :param new_rows: The `new_rows` parameter is the `Key`/`RowHash` DataFrame of the new snapshot
+    :return: A dictionary with the boolean masks `added` and `changed` over `new_rows`, the keys of the
+    `removed` rows and the keys of all `outdated` rows of the last snapshot (removed or changed).
+    """
+    prev_pairs  = pd.MultiIndex.from_frame(prev_rows[['Key', 'RowHash']])
+    new_pairs   = pd.MultiIndex.from_frame(new_rows[['Key', 'RowHash']])
+    unchanged   = new_pairs.isin(prev_pairs)
+    added       = ~new_rows['Key'].isin(prev_rows['Key']).values
+    return {
+        "added":    added,
+        "changed":  ~unchanged & ~added,
+        "removed":  prev_rows['Key'][~prev_rows['Key'].isin(new_rows['Key'])].values,
+        "outdated": prev_rows['Key'][~prev_pairs.isin(new_pairs)].values,
+    }
+
+
+def apply_totals(agg, delta, key_col):
+    """
+    The function `apply_totals` adds changes of the additive station measures to a stored aggregate
+    and derives its ratios again.
+
+    :param agg: The `agg` parameter is the GeoDataFrame of `aggregate_plz` or `rollup_bezirk`
+    :param delta: The `delta` parameter is a DataFrame indexed by area with the changes of `Number`,
+    `KW_total` and `KW_n`; areas missing in `agg` are ignored
+    :param key_col: The `key_col` parameter is the column identifying the areas of `agg`
+    :return: A tuple `(GeoDataFrame, changed)`; `changed` lists the areas whose measures changed.
+    """
+    ret     = agg.copy()
+    change  = delta.reindex(ret[key_col]).fillna(0)
+    for col in change.columns:
+        ret[col] = (ret[col] + change[col].values).astype(ret[col].dtype)
+    ret     = ag.add_ratios(ret)
+    changed = ret[key_col][(change != 0).any(axis=1).values]
+    return ret, changed.tolist()
+
+
+def apply_counts(lstat_count, delta, stations):
+    """
+    The function `apply_counts` updates the station count of `count_plz_occurrences`. Postal codes
+    without any station left are dropped; new ones take their geometry from `stations`.
+
+    :param lstat_count: The `lstat_count` parameter is the stored GeoDataFrame of `count_plz_occurrences`
+    :param delta: The `delta` parameter is the DataFrame of changes with a `Number` column, indexed by PLZ
+    :param stations: The `stations` parameter is the GeoDataFrame of the added and changed stations
+    :return: The updated GeoDataFrame, sorted by PLZ.
+    """
+    counts  = lstat_count.set_index('PLZ')['Number'].add(delta['Number'], fill_value=0)
+    counts  = counts[counts > 0].sort_index()
+    geoms   = pd.concat([lstat_count.set_index('PLZ').geometry, stations.groupby('PLZ').geometry.first()])
+    geoms   = geoms[~geoms.index.duplicated()]
+    return gpd.GeoDataFrame({
+        'PLZ':      counts.index.astype(lstat_count['PLZ'].dtype),
+        'Number':   counts.values.astype(lstat_count['Number'].dtype),
+    }, geometry=gpd.GeoSeries(geoms.reindex(counts.index).values, crs=lstat_count.crs))
+
+
+def stored_base(pdict, sha_resid):
+    """
+    The function `stored_base` loads the station artifacts of the last processed register if a new
+    register can be applied to them as a delta: they must form one consistent chain, and apart from
+    `file_lstations` they must have been built from the current geodata, residents and settings.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary
+    :param sha_resid: The `sha_resid` parameter is the checksum of the current resident artifact
+    :return: A dictionary `{stage: (GeoDataFrame, manifest)}` for `STATION_STAGES`, or None.
+    """
+    base = {stage: ar.load_artifact(pdict, stage) for stage in STATION_STAGES}
+    if any(gdf is None for gdf, _ in base.values()):
+        return None
+
+    sha      = {stage: manifest["sha256"] for stage, (_, manifest) in base.items()}
+    expected = {
+        "lstat_rows":   ar.stage_provenance(pdict, "lstat_rows"),
+        "lstat":        ar.stage_provenance(pdict, "lstat"),
+        "lstat_count":  ar.stage_provenance(pdict, "lstat_count", upstream={"lstat": sha["lstat"]}),
+        "agg_plz":      ar.stage_provenance(pdict, "agg_plz", upstream={"lstat": sha["lstat"],
+                                                                         "resid": sha_resid}),
+        "agg_bezirk":   ar.stage_provenance(pdict, "agg_bezirk", upstream={"agg_plz": sha["agg_plz"]}),
+    }
+    prov     = {stage: manifest["provenance"] for stage, (_, manifest) in base.items()}
+    if not all(ar.same_provenance(prov[s], expected[s], ignore=("file_lstations",)) for s in STATION_STAGES):
+        return None
+    # both row states must describe the same register
+    if prov["lstat_rows"]["sources"]["file_lstations"] != prov["lstat"]["sources"]["file_lstations"]:
+        return None
+    return base
+
+
+@mt.instrument("apply_delta")
+def update_stations(pdict, read_register, preprocess, sha_resid):
+    """
+    The function `update_stations` applies a new charging register to the stored station layers
+    instead of processing it from scratch. Only added and changed rows are preprocessed; their totals
+    and those of the removed and outdated rows are applied to the stored per-PLZ and per-Bezirk
+    aggregates. Cached map features are dropped only for the areas that changed.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary pointing to the new register
+    :param read_register: The `read_register` parameter is a function returning the new register as read
+    by `core.ingest.read_lstations`
+    :param preprocess: The `preprocess` parameter is a function applying `preprop_lstat` to a part of
+    the register
+    :param sha_resid: The `sha_resid` parameter is the checksum of the current resident artifact
+    :return: A dictionary with the updated output of every stage in `STATION_STAGES`, or None if no
+    usable stored state exists and the layers have to be built from scratch.
+    """
+    base = stored_base(pdict, sha_resid)
+    if base is None:
+        return None
+
+    raw         = read_register()
+    diff        = diff_rows(base["lstat_rows"][0], raw)
+    fresh       = preprocess(raw[diff["added"] | diff["changed"]])
+
+    lstat       = base["lstat"][0]
+    outdated    = lstat['Key'].isin(diff["outdated"])
+    delta       = ag.station_totals(fresh).sub(ag.station_totals(lstat[outdated]), fill_value=0)
+
+    agg_plz, changed_plz        = apply_totals(base["agg_plz"][0], delta, 'PLZ')
+    delta_bezirk                = delta.reindex(agg_plz['PLZ']).fillna(0).groupby(agg_plz['Bezirk'].values).sum()
+    agg_bezirk, changed_bezirk  = apply_totals(base["agg_bezirk"][0], delta_bezirk, 'Bezirk')
+
+    ly.invalidate_areas('PLZ', changed_plz)
+    ly.invalidate_areas('Bezirk', changed_bezirk)
+    print(" ====> Register delta: {} added, {} changed, {} removed; {} PLZ and {} Bezirk areas updated".format(
+        int(diff["added"].sum()), int(diff["changed"].sum()), len(diff["removed"]),
+        len(changed_plz), len(changed_bezirk)))
+
+    stations    = pd.concat([lstat[~outdated], fresh], ignore_index=True)
+    return {
+        "lstat_rows":   ig.row_state(raw),
+        # same row order as `preprop_lstat`
+        "lstat":        ht.sort_df(gpd.GeoDataFrame(stations, geometry='geometry', crs=lstat.crs), ['PLZ', 'Key']),
+        "lstat_count":  apply_counts(base["lstat_count"][0], delta, fresh),
+        "agg_plz":      agg_plz,
+        "agg_bezirk":   agg_bezirk,
+    }
@@ -0,0 +1,96 @@
+import numpy                         as np
+import pandas                        as pd
+
+from core import metrics             as mt
+from core import spatial             as sp
+
+
+# Columns added by `supply_gap`
+GAP_COLS = ['Residents_per_station', 'KW_per_capita', 'Demand_score', 'Supply_score', 'Stations_expected',
+            'Stations_gap', 'Gap_rank']
+
+
+def smooth(values, adjacency, weight):
+    """
+    The function `smooth` blends every value with the mean of its neighbours, so that an area next to
+    well supplied (or densely populated) areas is rated accordingly.
+
+    :param values: The `values` parameter is an array with one value per area
+    :param adjacency: The `adjacency` parameter is the adjacency of the areas as returned by
+    `core.spatial.neighbours`
+    :param weight: The `weight` parameter is the share of the neighbour mean, between 0 (no smoothing)
+    and 1; areas without neighbours keep their value
+    :return: A float64 array with the smoothed values.
+    """
+    indptr, indices = adjacency
+    values      = np.asarray(values, dtype="float64")
+    counts      = np.diff(indptr)
+    rows        = np.repeat(np.arange(len(values)), counts)
+    nb_sum      = np.bincount(rows, weights=values[indices], minlength=len(values))
+    nb_mean     = np.divide(nb_sum, counts, out=values.copy(), where=counts > 0)
+    return (1 - weight) * values + weight * nb_mean
+
+
+def supply_gap(agg, adjacency, weight=0.5):
+    """
+    The function `supply_gap` compares the charging supply of every area with its residents. The
+    residents and stations of each area are smoothed over its neighbours (`smooth`); the stations an area
+    would have if they were distributed like the smoothed residents (`Stations_expected`) minus its
+    smoothed stations is the gap. All columns are computed column-wise, so the gap can be recomputed
+    for filtered stations without touching the geometry.
+
+    :param agg: The `agg` parameter is the GeoDataFrame of `aggregate_plz` or `rollup_bezirk`
+    :param adjacency: The `adjacency` parameter is the adjacency of the rows of `agg`, see
+    `core.spatial.neighbours`
+    :param weight: The `weight` parameter is the share of the neighbours in the smoothed values
+    :return: A copy of `agg` with the columns of `GAP_COLS`: residents per station, installed kW per
+    resident, the smoothed residents (`Demand_score`) and stations (`Supply_score`), the expected stations,
+    the gap in stations (positive where underserved) and the rank by gap (1 = most underserved).
+    """
+    ret             = agg.copy()
+    stations        = ret['Number'].where(ret['Number'] > 0)
+    residents       = ret['Einwohner'].where(ret['Einwohner'] > 0)
+    ret['Residents_per_station']    = ret['Einwohner'] / stations
+    ret['KW_per_capita']            = ret['KW_total'] / residents
+
+    demand          = smooth(ret['Einwohner'].values, adjacency, weight)
+    supply          = smooth(ret['Number'].values, adjacency, weight)
+    share           = demand / demand.sum() if demand.sum() > 0 else np.zeros_like(demand)
+    ret['Demand_score']             = demand
+    ret['Supply_score']             = supply
+    ret['Stations_expected']        = share * supply.sum()
+    ret['Stations_gap']             = ret['Stations_expected'] - supply
+    ret['Gap_rank']                 = ret['Stations_gap'].rank(ascending=False, method='first').astype('int32')
+    return ret
+
+
+@mt.instrument("gap_analysis")
+def gap_analysis(agg, adjacency, pdict):
+    """
+    The function `gap_analysis` runs `supply_gap` on a stored aggregate with the stored adjacency of its
+    areas, so the polygons are not queried again when the gap is recomputed for a filter.
+
+    :param agg: The `agg` parameter is the GeoDataFrame of `aggregate_plz` or `rollup_bezirk`
+    :param adjacency: The `adjacency` parameter is the table of `core.spatial.adjacency_table` for the
+    areas of `agg`, in the same order
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["gap_smoothing"]` is the
+    share of the neighbours in the smoothed values
+    :return: The GeoDataFrame of `supply_gap`.
+    """
+    return supply_gap(agg, sp.table_adjacency(adjacency, len(agg)), pdict["gap_smoothing"])
+
+
+def rank_underserved(gap, key_col='PLZ', n=None):
+    """
+    The function `rank_underserved` lists the areas of a gap layer from the most to the least
+    underserved.
+
+    :param gap: The `gap` parameter is the GeoDataFrame of `supply_gap`
+    :param key_col: The `key_col` parameter is the column identifying the areas, `PLZ` or `Bezirk`
+    :param n: The optional `n` parameter limits the table to the first `n` areas
+    :return: A DataFrame without geometry, indexed by `Gap_rank`.
+    """
+    cols = [key_col] + [c for c in ('Bezirk',) if c != key_col and c in gap.columns] + \
+           ['Einwohner', 'Number', 'KW_total'] + GAP_COLS[:-1]
+    ret  = pd.DataFrame(gap[cols + ['Gap_rank']]).set_index('Gap_rank').sort_index()
+    return ret if n is None else ret.head(n)
@@ -0,0 +1,148 @@
+import os
+import json
+import hashlib
+
+import numpy                         as np
+import pandas                        as pd
+import geopandas                     as gpd
+import pyogrio
+import pyarrow.compute               as pc
+import pyarrow.parquet               as pq
+import shapely
+
+import core.HelperTools              as ht
+from core import metrics             as mt
+from core import spatial             as sp
+
+
+# Area levels: `pdict` keys of the file and of the key column in it, and the dtype of the keys
+LEVELS = {
+    "PLZ":      ("file_geodat_plz", "geodat_plz_key", "int64"),
+    "Bezirk":   ("file_geodat_dis", "geodat_dis_key", "str"),
+}
+
+# Geometry formats by file suffix
+FORMATS = {
+    ".shp":         "shapefile",
+    ".parquet":     "geoparquet",
+    ".geoparquet":  "geoparquet",
+    ".csv":         "csv",
+}
+
+# Files that belong to a shapefile besides the `.shp`
+SHAPEFILE_PARTS = (".shx", ".dbf", ".prj", ".cpg")
+
+def source_format(path):
+    """Format of a geometry file, see `FORMATS`."""
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix not in FORMATS:
+        raise ValueError("Unsupported geometry file {!r}, expected one of: {}".format(path, ", ".join(FORMATS)))
+    return FORMATS[suffix]
+
+
+def dataset_files(path):
+    """The files making up an input dataset: the file itself and, for a shapefile, its existing parts."""
+    if FORMATS.get(os.path.splitext(path)[1].lower()) != "shapefile":
+        return [path]
+    base = os.path.splitext(path)[0]
+    return [path] + [base + ext for ext in SHAPEFILE_PARTS if os.path.exists(base + ext)]
+
+
+def dataset_digest(path):
+    """
+    The function `dataset_digest` fingerprints an input file like `HelperTools.file_digest`, covering all
+    files of a shapefile, so that e.g. a changed attribute table (`.dbf`) is noticed.
+
+    :param path: The `path` parameter is the path of the input file
+    :return: A tuple `(mtime_ns, size, sha256)`; for several files the latest mtime, the total size and
+    a hash over the hashes of all files. A single file gives the result of `file_digest`.
+    """
+    digests = [ht.file_digest(f) for f in dataset_files(path)]
+    if len(digests) == 1:
+        return digests[0]
+    sha = hashlib.sha256("".join(d[2] for d in digests).encode()).hexdigest()
+    return max(d[0] for d in digests), sum(d[1] for d in digests), sha
+
+
+def _read_shapefile(path, columns, bbox):
+    # reading through Arrow skips the per-feature Python objects
+    gdf = pyogrio.read_dataframe(path, columns=columns, bbox=bbox, use_arrow=True)
+    return gdf.to_crs("EPSG:4326") if gdf.crs is not None else gdf
+
+
+def _is_wgs84(crs):
+    """Whether a PROJJSON CRS of GeoParquet metadata is WGS84 in lon/lat order; missing means OGC:CRS84."""
+    return crs is None or crs.get("id") in ({"authority": "OGC", "code": "CRS84"}, {"authority": "EPSG", "code": 4326})
+
+
+def _read_geoparquet(path, columns, bbox):
+    geo         = json.loads(pq.read_schema(path).metadata[b"geo"])
+    geom_col    = geo["primary_column"]
+    meta        = geo["columns"][geom_col]
+    if meta["encoding"].upper() != "WKB" or not _is_wgs84(meta.get("crs")):
+        # native encodings and other CRS are left to geopandas, which is slower to set up
+        gdf = gpd.read_parquet(path, columns=columns + [geom_col])
+        gdf = gdf.to_crs("EPSG:4326") if gdf.crs is not None else gdf
+        return pd.DataFrame({**{c: gdf[c].values for c in columns}, 'geometry': gdf.geometry.values})
+
+    # with a bbox covering column, row groups and rows outside the box are skipped while reading
+    covering    = meta.get("covering", {}).get("bbox")
+    filters     = None
+    if bbox is not None and covering:
+        field   = {k: pc.field(*v) for k, v in covering.items()}
+        filters = (field["xmin"] <= bbox[2]) & (field["xmax"] >= bbox[0]) & \
+                  (field["ymin"] <= bbox[3]) & (field["ymax"] >= bbox[1])
+    table       = pq.read_table(path, columns=columns + [geom_col], filters=filters)
+    ret         = pd.DataFrame({c: table.column(c).to_pandas() for c in columns})
+    ret['geometry'] = shapely.from_wkb(table.column(geom_col).to_numpy(zero_copy_only=False))
+    return ret
+
+
+def _read_csv(path, columns, bbox):
+    df = pd.read_csv(path, sep=';', usecols=columns + ['geometry'])
+    return df.assign(geometry=sp.parse_geometry(df['geometry']))
+
+
+_READERS = {
+    "shapefile":    _read_shapefile,
+    "geoparquet":   _read_geoparquet,
+    "csv":          _read_csv,
+}
+
+
+@mt.instrument("read_areas")
+def read_areas(pdict, level, bbox=None, columns=()):
+    """
+    The function `read_areas` reads the polygons of an area level from the file configured for it. The
+    reader follows the file suffix: shapefiles are read by GDAL (pyogrio through Arrow),
+    GeoParquet with pyarrow from its WKB column, and CSV files with a WKT `geometry` column by
+    `core.spatial.parse_geometry`. The binary formats apply the bounding box while reading; every format
+    reads only the key and the requested columns.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary; it provides the file and the key
+    column of the level (see `LEVELS`), e.g. `pdict["file_geodat_plz"]` and `pdict["geodat_plz_key"]`
+    :param level: The `level` parameter is `"PLZ"` or `"Bezirk"`
+    :param bbox: The `bbox` parameter is a `(lon_min, lat_min, lon_max, lat_max)` box; only areas
+    intersecting it are returned (default: `pdict["bbox"]`, False for all areas)
+    :param columns: The `columns` parameter lists further attribute columns to read
+    :return: A DataFrame in file order with the key column (named `pdict["geocode"]` for postal codes,
+    `Bezirk` for districts), the requested columns and `geometry`, an object array of valid shapely
+    geometries in WGS84.
+    """
+    path_key, key_col, dtype = LEVELS[level]
+    path        = pdict[path_key]
+    bbox        = pdict["bbox"] if bbox is None else (bbox or None)
+    cols        = [pdict[key_col]] + [c for c in columns if c != pdict[key_col]]
+    frame       = _READERS[source_format(path)](path, cols, None if bbox is None else tuple(bbox))
+
+    geoms       = np.asarray(frame['geometry'].values, dtype=object)
+    if source_format(path) != "csv":
+        geoms   = sp.repair_geometry(geoms)
+    keep        = shapely.intersects(geoms, shapely.box(*bbox)) if bbox is not None else np.ones(len(geoms), bool)
+
+    name        = pdict["geocode"] if level == "PLZ" else level
+    ret         = pd.DataFrame({name: pd.Series(frame[pdict[key_col]].values[keep]).astype(dtype).values})
+    for c in cols[1:]:
+        ret[c]  = frame[c].values[keep]
+    ret['geometry'] = geoms[keep]
+    return ret
@@ -0,0 +1,154 @@
+import time
+
+import pandas                        as pd
+from core import metrics             as mt
+from core import schema              as sc
+
+
+# Columns of the charging register used by the pipeline and how they are parsed (see `core.schema`).
+# The register writes numbers with a decimal comma.
+LSTAT_DTYPES = {
+    'Postleitzahl':                         sc.PLZ_DTYPE,
+    'Bundesland':                           'str',
+    'Breitengrad':                          sc.COORD_DTYPE,
+    'Längengrad':                           sc.COORD_DTYPE,
+    'Nennleistung Ladeeinrichtung [kW]':    sc.KW_DTYPE,
+    'Inbetriebnahmedatum':                  'str',          # dd.mm.yyyy, parsed by `preprop_lstat`
+}
+
+# Columns of `plz_einwohner.csv` used by the pipeline. The file has no gaps, so the integers are parsed
+# as plain int32, which is faster than nullable types; `core.schema.conform` converts them later on.
+RESID_DTYPES = {
+    'plz':                                  'int32',
+    'einwohner':                            'int32',
+    'lat':                                  sc.COORD_DTYPE,
+    'lon':                                  sc.COORD_DTYPE,
+}
+
+# Columns identifying a charging station across register versions. The register has no station id;
+# stations sharing all of these are told apart by their order in the file.
+STATION_KEY = ['Betreiber', 'Straße', 'Hausnummer', 'Postleitzahl', 'Inbetriebnahmedatum']
+
+
+@mt.instrument("read_residents")
+def read_residents(pdict):
+    """
+    The function `read_residents` reads the residents per postal code with the column types of
+    `RESID_DTYPES`; other columns are not parsed.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary with the path `file_residents`
+    :return: A DataFrame with the columns of `RESID_DTYPES`.
+    """
+    return pd.read_csv(pdict["file_residents"], sep=',', usecols=list(RESID_DTYPES), dtype=RESID_DTYPES)
+
+
+def register_columns(path, skiprows=10, sep=';'):
+    """
+    The function `register_columns` maps the stripped column names of the charging register to the
+    names as they appear in the file, which may carry surrounding whitespace.
+
+    :param path: The `path` parameter is the path of the register CSV
+    :param skiprows: The `skiprows` parameter is the number of metadata lines above the header
+    :param sep: The `sep` parameter is the field separator
+    :return: A dictionary `{stripped name: raw name}`.
+    """
+    header = pd.read_csv(path, sep=sep, skiprows=skiprows, nrows=0)
+    return {c.strip(): c for c in header.columns}
+
+
+def station_keys(key_hash):
+    """
+    The function `station_keys` turns the hashes of the `STATION_KEY` columns into unique row keys by
+    mixing in the number of earlier rows with the same hash.
+
+    :param key_hash: The `key_hash` parameter is a uint64 Series with one hash per register row, in
+    file order
+    :return: A uint64 Series of unique keys with the index of `key_hash`.
+    """
+    occurrence = key_hash.groupby(key_hash).cumcount()
+    return pd.util.hash_pandas_object(pd.DataFrame({'k': key_hash, 'n': occurrence}), index=False)
+
+
+def row_state(dframe):
+    """Key and content hash of every ingested register row, the state compared by `core.delta`."""
+    return dframe[['Key', 'RowHash']].reset_index(drop=True)
+
+
+def region_mask(bundesland, plz, pdict):
+    """
+    The function `region_mask` selects the register rows of the configured region by their declared
+    Bundesland and postal code.
+
+    :param bundesland: The `bundesland` parameter is the Series of Bundesland names
+    :param plz: The `plz` parameter is the Series of declared postal codes
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["lstat_bundesland"]` is the
+    Bundesland (None for all) and `pdict["lstat_plz_range"]` the open postal code range
+    :return: A boolean Series; rows without a postal code are missing.
+    """
+    plz_lo, plz_hi = pdict["lstat_plz_range"]
+    keep = (plz > plz_lo) & (plz < plz_hi)
+    if pdict["lstat_bundesland"] is not None:
+        keep = keep & (bundesland == pdict["lstat_bundesland"])
+    return keep
+
+
+@mt.instrument("read_lstations")
+def read_lstations(pdict, chunksize=None, columns=LSTAT_DTYPES, verbose=True):
+    """
+    The function `read_lstations` streams the national charging register chunk by chunk and keeps only
+    the rows of the configured region (`region_mask`). Only the needed columns are parsed,
+    with explicit dtypes and decimal commas, so peak memory depends on the regional subset instead of
+    the whole register. With `pdict["plz_assignment"] == "location"` rows inside `pdict["bbox"]` are
+    kept as well, so that stations with a wrongly declared postal code can be located later on.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary. It provides the file
+    (`file_lstations`), the Bundesland (`lstat_bundesland`, None for all), the open postal code range
+    (`lstat_plz_range`) and the default chunk size (`lstat_chunksize`).
+    :param chunksize: The `chunksize` parameter overrides `pdict["lstat_chunksize"]`
+    :param columns: The `columns` parameter maps the (stripped) register columns to read to their
+    dtypes
+    :param verbose: The `verbose` parameter prints the row counts and the duration of every chunk
+    :return: A DataFrame with the stripped column names, the unique row key `Key` of `station_keys` and
+    the hash `RowHash` of the parsed columns, which changes if a station is modified. Per-chunk statistics (`chunk`, `rows_read`,
+    `rows_kept`, `secs`) are attached as `df.attrs["ingest_stats"]`.
+    """
+    path        = pdict["file_lstations"]
+    chunksize   = chunksize or pdict["lstat_chunksize"]
+    locate      = pdict.get("plz_assignment") == "location"
+    lon_min, lat_min, lon_max, lat_max = pdict["bbox"]
+
+    raw_names   = register_columns(path)
+    dtypes      = {raw_names[c]: t for c, t in columns.items()}
+    key_only    = [c for c in STATION_KEY if c not in columns]
+    dtypes.update({raw_names[c]: 'str' for c in key_only})
+
+    reader = pd.read_csv(path, sep=';', skiprows=10, usecols=list(dtypes), dtype=dtypes,
+                         decimal=',', chunksize=chunksize)
+
+    parts, stats = [], []
+    t_chunk = time.perf_counter()
+    for i, chunk in enumerate(reader):
+        chunk.columns = chunk.columns.str.strip()
+        keep    = region_mask(chunk['Bundesland'], chunk['Postleitzahl'], pdict)
+        if locate:
+            # stations are assigned by location later on: also keep those with a wrong Bundesland/PLZ
+            lat, lon = chunk['Breitengrad'], chunk['Längengrad']
+            keep    = keep | (lat.between(lat_min, lat_max) & lon.between(lon_min, lon_max))
+        kept    = chunk.loc[keep.fillna(False)]
+        kept    = kept.assign(Key=pd.util.hash_pandas_object(kept[STATION_KEY], index=False),
+                              RowHash=pd.util.hash_pandas_object(kept[list(columns)], index=False))
+        parts.append(kept.drop(columns=key_only))
+
+        t_now = time.perf_counter()
+        stats.append({"chunk": i, "rows_read": len(chunk), "rows_kept": len(parts[-1]),
+                      "secs": t_now - t_chunk})
+        if verbose:
+            print(" ====> Chunk {}: {} rows read, {} kept, {:.2f} secs".format(
+                i, len(chunk), len(parts[-1]), t_now - t_chunk))
+        t_chunk = t_now
+
+    ret = pd.concat(parts, ignore_index=True) if parts else \
+        pd.DataFrame({c: pd.Series(dtype=t) for c, t in dict(columns, Key='uint64', RowHash='uint64').items()})
+    ret['Key'] = station_keys(ret['Key'])
+    ret.attrs["ingest_stats"] = stats
+    return ret
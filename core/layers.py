@@ -0,0 +1,300 @@
+import json
+import math
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy                         as np
+import pandas                        as pd
+import geopandas                     as gpd
+import shapely
+
+from core import metrics             as mt
+
+
+# Map layers and the column they are coloured by
+LAYER_COLUMNS = {
+    "Residents":            "Einwohner",
+    "Charging_Stations":    "Number",
+    "Charging_Power":       "KW_total",
+    "Supply_Gap":           "Stations_gap",
+    "Coverage":             "Coverage_share",
+}
+
+# Colours as RGBA in [0, 1], as `branca.colormap.LinearColormap` stores them. Layers run from yellow
+# to red; those whose values are signed are centred on zero.
+SEQUENTIAL_COLORS = [(1.0, 1.0, 0.0, 1.0), (1.0, 0.0, 0.0, 1.0)]
+DIVERGING_COLORS = {
+    "Stations_gap":         [(0.0, 0.0, 1.0, 1.0), (1.0, 1.0, 1.0, 1.0), (1.0, 0.0, 0.0, 1.0)],
+}
+
+MAP_LOCATION    = [52.52, 13.40]
+MAP_ZOOM        = 10
+MAP_WIDTH       = 800
+MAP_HEIGHT      = 600
+
+# Colours of a layer, the values they sit at and the value range; see `color_scale`
+ColorScale = namedtuple("ColorScale", ["colors", "index", "vmin", "vmax"])
+
+# Serialised layers, keyed by (key column, value column, zoom, colours, content token); least
+# recently used first
+_layer_cache        = OrderedDict()
+_layer_cache_lock   = threading.Lock()
+LAYER_CACHE_SIZE    = 32
+
+# Simplified area geometries as GeoJSON, keyed by (key column, zoom, geometry token)
+_geometry_cache     = OrderedDict()
+GEOMETRY_CACHE_SIZE = 8
+
+# Serialised features per area, keyed by (key column, value column, zoom) and then by area key. A
+# feature is only serialised again if its value, colour or geometry changed.
+_feature_cache      = {}
+
+# Two-digit hex strings for every byte value, used to build colour strings column-wise
+_HEX = np.array(["%02x" % i for i in range(256)], dtype=object)
+
+# Fill colour of missing values, the default `nan_fill_color` of `folium.Choropleth`
+NAN_COLOR = "#000000"
+
+
+def map_view(bbox, width=MAP_WIDTH, height=MAP_HEIGHT):
+    """
+    The function `map_view` centres the map on the bounding box of a region and picks the highest zoom
+    level at which the whole box fits into the map.
+
+    :param bbox: The `bbox` parameter is `(lon_min, lat_min, lon_max, lat_max)`, e.g. `pdict["bbox"]`
+    :param width: The `width` parameter is the width of the map in pixels
+    :param height: The `height` parameter is the height of the map in pixels
+    :return: A tuple `(location, zoom)` with the centre as `[lat, lon]`.
+    """
+    lon_min, lat_min, lon_max, lat_max = bbox
+    merc    = lambda lat: math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+    zoom_x  = math.log2(width / 256 * 360 / (lon_max - lon_min))
+    zoom_y  = math.log2(height / 256 * 2 * math.pi / (merc(lat_max) - merc(lat_min)))
+    return [(lat_min + lat_max) / 2, (lon_min + lon_max) / 2], int(min(zoom_x, zoom_y))
+
+
+def layer_frame(dfr1, dfr2, dfr_dis, layer, level="PLZ", gaps=None):
+    """
+    The function `layer_frame` picks the GeoDataFrame, value column and key column of a map layer at the
+    requested level.
+
+    :param dfr1: The `dfr1` parameter is the GeoDataFrame with the number of charging stations per PLZ
+    :param dfr2: The `dfr2` parameter is the GeoDataFrame with the residents per PLZ
+    :param dfr_dis: The `dfr_dis` parameter is the GeoDataFrame of `core.aggregate.rollup_bezirk`, used
+    at `Bezirk` level
+    :param layer: The `layer` parameter is a key of `LAYER_COLUMNS`
+    :param level: The `level` parameter is `PLZ` or `Bezirk`
+    :param gaps: The `gaps` parameter is a tuple with the GeoDataFrames of `core.gap.gap_analysis` per PLZ
+    and per Bezirk, which hold all measures of an area; needed for the `Charging_Power`, `Supply_Gap` and
+    `Coverage` layers
+    :return: A tuple `(gdf, value_col, key_col)`.
+    """
+    value_col = LAYER_COLUMNS[layer]
+    if layer in ("Charging_Power", "Supply_Gap", "Coverage"):
+        return gaps[level == "Bezirk"], value_col, level
+    if level == "Bezirk":
+        return dfr_dis, value_col, 'Bezirk'
+    return (dfr2 if layer == "Residents" else dfr1), value_col, 'PLZ'
+
+
+def color_scale(gdf, value_col):
+    """
+    The function `color_scale` spreads the colours of a layer evenly over its value range, like
+    `branca.colormap.LinearColormap` does, without needing branca.
+
+    :param gdf: The `gdf` parameter is the GeoDataFrame of the layer
+    :param value_col: The `value_col` parameter is the column the areas are coloured by
+    :return: A `ColorScale`; it can be passed to `color_column` and `layer_geojson` in place of the
+    colour map. Signed values (`DIVERGING_COLORS`) get a range centred on zero.
+    """
+    if value_col in DIVERGING_COLORS:
+        colors      = DIVERGING_COLORS[value_col]
+        vmax        = float(gdf[value_col].abs().max()) or 1.0
+        vmin        = -vmax
+    else:
+        colors      = SEQUENTIAL_COLORS
+        vmin, vmax  = gdf[value_col].min(), gdf[value_col].max()
+    n       = len(colors)
+    index   = [vmin + (vmax - vmin) * i * 1.0 / (n - 1) for i in range(n)]
+    return ColorScale(colors, index, vmin, vmax)
+
+
+def zoom_tolerance(zoom, pixels=0.5):
+    """
+    The function `zoom_tolerance` converts a zoom level of a web map into a simplification tolerance in
+    degrees.
+
+    :param zoom: The `zoom` parameter is the (Leaflet/OSM) zoom level the layer is shown at
+    :param pixels: The `pixels` parameter is the largest allowed deviation on screen, in pixels
+    :return: The tolerance in degrees; details smaller than `pixels` on screen are removed.
+    """
+    return 360.0 / (256 * 2 ** zoom) * pixels
+
+
+def simplify_coverage(geoms, tolerance):
+    """
+    The function `simplify_coverage` simplifies a set of polygons that share their borders, such as
+    postal code areas. Shared edges are simplified once, so neighbouring areas stay gap-free.
+
+    :param geoms: The `geoms` parameter is a GeoSeries of polygons
+    :param tolerance: The `tolerance` parameter is the simplification tolerance in the units of `geoms`
+    :return: A GeoSeries with the simplified polygons and the index of `geoms`.
+    """
+    if hasattr(shapely, "coverage_simplify"):
+        simplified = shapely.coverage_simplify(np.asarray(geoms.values), tolerance)
+        return gpd.GeoSeries(simplified, index=geoms.index, crs=geoms.crs)
+    # shapely < 2.1: topology is preserved per polygon only
+    return geoms.simplify(tolerance, preserve_topology=True)
+
+
+def color_column(values, color_map):
+    """
+    The function `color_column` computes the fill colour of every value at once, with the same linear
+    interpolation `branca.colormap.LinearColormap` applies to a single value.
+
+    :param values: The `values` parameter is a Series or array of numbers
+    :param color_map: The `color_map` parameter is the `LinearColormap` used for the legend, or the
+    `ColorScale` of `color_scale`
+    :return: A numpy array of "#RRGGBB" strings; missing and infinite values get `NAN_COLOR`.
+    """
+    x       = np.asarray(values, dtype="float64")
+    missing = ~np.isfinite(x)
+    index   = np.asarray(color_map.index, dtype="float64")
+    colors  = np.asarray(color_map.colors, dtype="float64")
+    x       = np.where(missing, index[0], x)
+    rgb     = [(np.interp(x, index, colors[:, j]) * 255.9999).astype(int) for j in range(3)]
+    ret     = "#" + _HEX[rgb[0]] + _HEX[rgb[1]] + _HEX[rgb[2]]
+    ret[missing] = NAN_COLOR
+    return ret
+
+
+def style_feature(feature):
+    """Leaflet style of a feature built by `layer_geojson`; the fill colour is precomputed."""
+    return {
+        'fillColor': feature['properties']['fillColor'],
+        'color': 'black',
+        'weight': 1,
+        'fillOpacity': 0.7
+    }
+
+
+def _geometry_token(gdf, key_col):
+    """Hash of the area keys and geometries of a layer."""
+    h = hashlib.sha1()
+    h.update(pd.util.hash_pandas_object(gdf[key_col], index=False).values.tobytes())
+    for wkb in shapely.to_wkb(np.asarray(gdf.geometry.values)):
+        h.update(wkb)
+    return h.hexdigest()
+
+
+def _content_token(gdf, value_col, key_col):
+    """Hash of the area keys, values and geometries a layer is built from."""
+    h = hashlib.sha1(_geometry_token(gdf, key_col).encode())
+    h.update(pd.util.hash_pandas_object(gdf[value_col], index=False).values.tobytes())
+    return h.hexdigest()
+
+
+def simplified_geometries(gdf, key_col, zoom):
+    """
+    The function `simplified_geometries` simplifies the areas of a layer for a zoom level and
+    serialises every geometry as GeoJSON. The result is cached, since it does not depend on the values
+    shown.
+
+    :param gdf: The `gdf` parameter is a GeoDataFrame with the columns `key_col` and `geometry`
+    :param key_col: The `key_col` parameter is the column identifying the areas
+    :param zoom: The `zoom` parameter is the zoom level the layer is shown at
+    :return: A list with the GeoJSON geometry of every row of `gdf`.
+    """
+    key = (key_col, zoom, _geometry_token(gdf, key_col))
+    with _layer_cache_lock:
+        if key in _geometry_cache:
+            _geometry_cache.move_to_end(key)
+            return _geometry_cache[key]
+
+    geometry    = simplify_coverage(gpd.GeoSeries(gdf.geometry), zoom_tolerance(zoom))
+    ret         = list(shapely.to_geojson(np.asarray(geometry.values)))
+
+    with _layer_cache_lock:
+        _geometry_cache[key] = ret
+        while len(_geometry_cache) > GEOMETRY_CACHE_SIZE:
+            _geometry_cache.popitem(last=False)
+    return ret
+
+
+def invalidate_areas(key_col, keys):
+    """
+    The function `invalidate_areas` drops the cached features of the given areas and every cached layer
+    at that level, e.g. after the stations of some postal codes changed. Features of other areas are
+    kept and reused by the next `layer_geojson` call.
+
+    :param key_col: The `key_col` parameter is the level of the areas, `PLZ` or `Bezirk`
+    :param keys: The `keys` parameter lists the changed areas
+    :return: The number of dropped features.
+    """
+    dropped = 0
+    with _layer_cache_lock:
+        for key in [k for k in _layer_cache if k[0] == key_col]:
+            del _layer_cache[key]
+        for (level, _, _), features in _feature_cache.items():
+            if level == key_col:
+                for area in keys:
+                    dropped += features.pop(area, None) is not None
+    return dropped
+
+
+def clear_cache():
+    """Drop all cached layers, geometries and features."""
+    with _layer_cache_lock:
+        _layer_cache.clear()
+        _geometry_cache.clear()
+        _feature_cache.clear()
+
+
+@mt.instrument("layer_geojson")
+def layer_geojson(gdf, value_col, color_map, zoom=10, key_col='PLZ'):
+    """
+    The function `layer_geojson` serialises one map layer as a single GeoJSON FeatureCollection. The
+    polygons are simplified for the given zoom level and every feature carries its precomputed fill
+    colour. The result is cached, so switching back to a layer reuses the finished payload; after an
+    update only the features whose value or colour changed are serialised again.
+
+    :param gdf: The `gdf` parameter is a GeoDataFrame with the columns `key_col`, `value_col` and
+    `geometry`
+    :param value_col: The `value_col` parameter is the name of the column that is coloured, e.g.
+    `Einwohner` or `Number`
+    :param color_map: The `color_map` parameter is the `LinearColormap` mapping values to colours, or the
+    `ColorScale` of `color_scale`
+    :param zoom: The `zoom` parameter is the zoom level the layer is shown at
+    :param key_col: The `key_col` parameter is the column identifying the areas, `PLZ` or `Bezirk`
+    :return: The FeatureCollection as a JSON string.
+    """
+    key = (key_col, value_col, zoom, tuple(color_map.index), tuple(color_map.colors),
+           _content_token(gdf, value_col, key_col))
+    with _layer_cache_lock:
+        if key in _layer_cache:
+            _layer_cache.move_to_end(key)
+            return _layer_cache[key]
+
+    geometry    = simplified_geometries(gdf, key_col, zoom)
+    areas       = gdf[key_col].tolist()
+    values      = [None if pd.isna(v) else v for v in gdf[value_col].tolist()]
+    fills       = color_column(gdf[value_col], color_map).tolist()
+
+    with _layer_cache_lock:
+        cached  = _feature_cache.setdefault((key_col, value_col, zoom), {})
+        parts   = []
+        for area, value, fill, geom in zip(areas, values, fills, geometry):
+            entry = cached.get(area)
+            if entry is None or entry[:3] != (value, fill, geom):
+                props   = json.dumps({key_col: area, value_col: value, 'fillColor': fill}, ensure_ascii=False)
+                entry   = (value, fill, geom, '{"type": "Feature", "properties": %s, "geometry": %s}' % (props, geom))
+                cached[area] = entry
+            parts.append(entry[3])
+    payload     = '{"type": "FeatureCollection", "features": [%s]}' % ", ".join(parts)
+
+    with _layer_cache_lock:
+        _layer_cache[key] = payload
+        while len(_layer_cache) > LAYER_CACHE_SIZE:
+            _layer_cache.popitem(last=False)
+    return payload
@@ -1,100 +1,140 @@
 import pandas                        as pd
 import geopandas                     as gpd
 import core.HelperTools              as ht
+from core import metrics             as mt
+from core import spatial             as sp
+from core import ingest              as ig
+from core import schema              as sc
 
-import folium
 # from folium.plugins import HeatMap
-import streamlit as st
-from streamlit_folium import folium_static
-from branca.colormap import LinearColormap
 
 
 
-def sort_by_plz_add_geometry(dfr, dfg, pdict): 
+@mt.instrument("sort_by_plz_add_geometry")
+def sort_by_plz_add_geometry(dfr, area_index, pdict): 
     """
-    The function `sort_by_plz_add_geometry` sorts an input dataframe by postal code, merges it with
-    geospatial data based on a specified geocode column, and returns a GeoDataFrame with geometry
+    The function `sort_by_plz_add_geometry` sorts an input dataframe by postal code and attaches the
+    polygon of each postal code from the area index, returning a GeoDataFrame with geometry
     information.
     
     :param dfr: The `dfr` parameter is the input DataFrame containing postal code and other relevant
     data
-    :param dfg: The `dfg` parameter in the `sort_by_plz_add_geometry` function refers to a GeoDataFrame
-    containing geometries for postal codes. This GeoDataFrame likely includes spatial information such
-    as polygons or points representing the geographic locations corresponding to postal codes
+    :param area_index: The `area_index` parameter is the index of `core.spatial.build_area_index`. The
+    postal codes are looked up in its `"PLZ"` level with one vectorised hash lookup; rows share the
+    parsed polygon of their postal code instead of parsing its WKT again.
     :param pdict: The `pdict` parameter is a dictionary containing mapping of columns, including geocode
-    information. It likely includes information on how to match columns between the input dataframe
-    `dfr` and the geospatial dataframe `dfg` for merging based on a common geocode column
-    :return: A geospatial dataframe with the merged data, including geometry, is being returned.
+    information; `pdict["geocode"]` names the postal code column of `dfr`
+    :return: A geospatial dataframe with the rows of `dfr` whose postal code has a polygon, sorted by
+    postal code and, for charging stations, by their `Key`, the order `core.delta` reproduces.
     """
 
-    dframe                  = dfr.copy()
-    df_geo                  = dfg.copy()
-    
-    # Sort the dataframe `dfr` by postal code (PLZ).
-    sorted_df               = dframe\
-        .sort_values(by='PLZ')\
-        .reset_index(drop=True)\
-        .sort_index()
-    
-    # Merge the sorted dataframe with a geospatial dataframe `dfg` on a geocode column in `pdict`.   
-     
-    sorted_df2              = sorted_df.merge(df_geo, on=pdict["geocode"], how ='left')
-    sorted_df3              = sorted_df2.dropna(subset=['geometry'])
+    # Sort the dataframe `dfr` by postal code (PLZ); neither input is modified, so no copies are needed
+    sort_cols               = [pdict["geocode"]] + [c for c in ['Key'] if c in dfr.columns]
+    sorted_df               = ht.sort_df(dfr, sort_cols)
+
+    # Position of every postal code in the area index; codes without a polygon are dropped
+    level                   = area_index["PLZ"]
+    pos                     = sp.lookup(level, sorted_df[pdict["geocode"]])
+    found                   = pos >= 0
+
+    ret                     = gpd.GeoDataFrame(sorted_df[found].reset_index(drop=True),
+                                               geometry=level["geoms"][pos[found]])
 
-    # Converts the 'geometry' column to a GeoSeries and returns a GeoDataFrame.
-    sorted_df3['geometry']  = gpd.GeoSeries.from_wkt(sorted_df3['geometry'])
-    ret                     = gpd.GeoDataFrame(sorted_df3, geometry='geometry')
-    
     return ret
 
 # -----------------------------------------------------------------------------
-@ht.timer
-def preprop_lstat(dfr, dfg, pdict):
+def normalise_coordinates(dframe, pdict, lat='Breitengrad', lon='Längengrad'):
+    """
+    The function `normalise_coordinates` turns the latitude and longitude columns of a dataframe into
+    `core.schema.COORD_DTYPE`, checks them against the bounding box in `pdict` and adds a point geometry
+    column.
+    
+    :param dframe: The `dframe` parameter is a DataFrame with coordinate columns. Numeric columns, e.g.
+    parsed with `decimal=','` at read time, are used as they are; text columns with decimal commas are
+    converted in one vectorised pass.
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["bbox"]` holds
+    `(lon_min, lat_min, lon_max, lat_max)`
+    :param lat: The `lat` parameter is the name of the latitude column
+    :param lon: The `lon` parameter is the name of the longitude column
+    :return: The dataframe with float32 coordinates, a boolean column `in_bbox` and a point geometry
+    column `point`. Rows outside the bounding box or without coordinates get `in_bbox == False` and an
+    empty point.
+    """
+
+    for c in (lat, lon):
+        col = dframe[c]
+        if not pd.api.types.is_numeric_dtype(col):
+            col = pd.to_numeric(col.astype(str).str.replace(',', '.', regex=False), errors='coerce')
+        dframe[c] = col.astype(sc.COORD_DTYPE)
+
+    lon_min, lat_min, lon_max, lat_max = pdict["bbox"]
+    in_bbox = dframe[lat].between(lat_min, lat_max) & dframe[lon].between(lon_min, lon_max)
+    
+    dframe['in_bbox']   = in_bbox.values
+    dframe['point']     = gpd.points_from_xy(dframe[lon].where(in_bbox), dframe[lat].where(in_bbox),
+                                             crs="EPSG:4326")
+    return dframe
+
+# -----------------------------------------------------------------------------
+@mt.instrument("preprop_lstat")
+def preprop_lstat(dfr, area_index, pdict):
     """
     The function preprop_lstat preprocesses electric charging station data from a CSV file, filtering
-    for stations in Berlin within specified postal codes and returning a GeoDataFrame with geometries.
+    for stations in the configured region (`core.ingest.region_mask`) and returning a GeoDataFrame with
+    geometries.
     
     :param dfr: The `dfr` parameter in the `preprop_lstat` function is a DataFrame containing the
     electric charging station data. It likely includes information such as postal codes, states,
     latitude, longitude, and charging station power ratings. The function preprocesses this data by
-    filtering for charging stations in Berlin within
-    :param dfg: The parameter `dfg` in the `preprop_lstat` function is a GeoDataFrame that contains
-    postal code geometries. This GeoDataFrame likely includes spatial information such as polygons or
-    points representing the boundaries or locations of postal code areas in a geographic area, such as
-    Berlin in this case
+    filtering for charging stations in the configured region
+    :param area_index: The `area_index` parameter is the index of `core.spatial.build_area_index`. Every
+    station is located in the PLZ and Bezirk polygons (`PLZ_geo`, `Bezirk`) and stations whose declared
+    PLZ disagrees with their location are flagged (`PLZ_mismatch`) and counted as `lstat_plz_mismatch`
+    (`core.metrics.count`). With
+    `pdict["plz_assignment"] == "location"` located stations are counted in the PLZ they lie in; the
+    declared code is kept as `PLZ_declared`.
     :param pdict: The `pdict` parameter in the `preprop_lstat` function is a dictionary containing
     mappings and other parameters, including geocode information. It likely holds key-value pairs that
     are used within the function for processing the electric charging station data. If you provide the
     contents of the `pdict`
-    :return: A GeoDataFrame with the charging stations data for Berlin within specified postal codes,
-    including geometries, is being returned.
+    :return: A GeoDataFrame with the charging stations data of the region, including geometries, is
+    being returned.
     """
 
-    dframe                  = dfr.copy()
-    df_geo                  = dfg.copy()
-    
-    dframe2               	= dframe.loc[:,['Postleitzahl', 'Bundesland', 'Breitengrad', 'Längengrad', 'Nennleistung Ladeeinrichtung [kW]']]
-    dframe2.rename(columns  = {"Nennleistung Ladeeinrichtung [kW]":"KW", "Postleitzahl": "PLZ"}, inplace = True)
+    # `Key` (the station key of `core.ingest`) is kept if present, so stations can be updated in place
+    keep_cols               = ['Postleitzahl', 'Bundesland', 'Breitengrad', 'Längengrad', 'Nennleistung Ladeeinrichtung [kW]',
+                               'Inbetriebnahmedatum']
+    dframe2               	= dfr.loc[:, keep_cols + [c for c in ['Key'] if c in dfr.columns]]
+    # Commissioning date for the time series of `core.timeseries`; unreadable dates become NaT
+    dframe2                 = dframe2.assign(Inbetriebnahmedatum=pd.to_datetime(
+                                  dframe2['Inbetriebnahmedatum'], format='%d.%m.%Y', errors='coerce'))
+    dframe2                 = sc.conform(dframe2.rename(columns={"Nennleistung Ladeeinrichtung [kW]": "KW",
+                                                                 "Postleitzahl": "PLZ"}))
+
+    # Float coordinates, bounding box check and station/area points
+    dframe2                 = normalise_coordinates(dframe2, pdict)
+
+    in_region               = ig.region_mask(dframe2["Bundesland"], dframe2["PLZ"], pdict)
 
-    # Convert to string
-    dframe2['Breitengrad']  = dframe2['Breitengrad'].astype(str)
-    dframe2['Längengrad']   = dframe2['Längengrad'].astype(str)
+    # Locate every station in the PLZ and Bezirk polygons and flag wrongly declared postal codes
+    dframe2                 = sp.assign_areas(dframe2, area_index)
+    mt.count("lstat_plz_mismatch", int(dframe2['PLZ_mismatch'].sum()))
 
-    # Now replace the commas with periods
-    dframe2['Breitengrad']  = dframe2['Breitengrad'].str.replace(',', '.')
-    dframe2['Längengrad']   = dframe2['Längengrad'].str.replace(',', '.')
+    if pdict["plz_assignment"] == "location":
+        dframe2['PLZ_declared'] = dframe2['PLZ']
+        dframe2['PLZ']          = dframe2['PLZ_geo'].fillna(dframe2['PLZ'])
+        in_region               = in_region | dframe2['PLZ_geo'].notna()
 
-    dframe3                 = dframe2[(dframe2["Bundesland"] == 'Berlin') & 
-                                            (dframe2["PLZ"] > 10115) &  
-                                            (dframe2["PLZ"] < 14200)]
+    # Stations without a (declared or located) postal code are dropped here
+    dframe3                 = sc.conform(dframe2[in_region.fillna(False).astype(bool)])
     
-    ret = sort_by_plz_add_geometry(dframe3, df_geo, pdict)
+    ret = sort_by_plz_add_geometry(dframe3, area_index, pdict)
     
     return ret
     
 
 # -----------------------------------------------------------------------------
-@ht.timer
+@mt.instrument("count_plz_occurrences")
 def count_plz_occurrences(df_lstat2):
     """
     The function `count_plz_occurrences` counts the number of charging stations per postal code in a
@@ -112,7 +152,7 @@ def count_plz_occurrences(df_lstat2):
     result_df = df_lstat2.groupby('PLZ').agg(
         Number=('PLZ', 'count'),
         geometry=('geometry', 'first')
-    ).reset_index()
+    ).reset_index().astype({'Number': sc.TOTALS['Number']})
     
     return result_df
     
@@ -158,121 +198,35 @@ def count_plz_occurrences(df_lstat2):
 #     return ret
     
 # -----------------------------------------------------------------------------
-@ht.timer
-def preprop_resid(dfr, dfg, pdict):
+@mt.instrument("preprop_resid")
+def preprop_resid(dfr, area_index, pdict):
     """
-    The function preprop_resid preprocesses resident data by filtering for postal codes in Berlin within
-    a specified range and returns a GeoDataFrame with geometries.
+    The function preprop_resid preprocesses resident data by filtering for postal codes in the open range
+    `pdict["resid_plz_range"]` of the region and returns a GeoDataFrame with geometries.
     
     :param dfr: The `dfr` parameter is a DataFrame containing resident data. It likely includes
     information such as postal codes, number of residents, latitude, and longitude for different
     locations
-    :param dfg: The `dfg` parameter in the `preprop_resid` function is a GeoDataFrame containing the
-    postal code geometries. It likely includes information about the shapes and locations of postal code
-    areas in a geographic region, such as Berlin in this case. This data is used to spatially join the
+    :param area_index: The `area_index` parameter is the index of `core.spatial.build_area_index`; it
+    provides the postal code polygons
     :param pdict: The `pdict` parameter in the `preprop_resid` function is a dictionary containing
     mappings and other parameters, including geocode information. It likely holds various settings,
     configurations, or data needed for processing the resident data
     :return: A GeoDataFrame with resident data, including geometries, is being returned.
     """
     
-    dframe                  = dfr.copy()
-    df_geo                  = dfg.copy()    
-    
-    dframe2               	= dframe.loc[:,['plz', 'einwohner', 'lat', 'lon']]
-    dframe2.rename(columns  = {"plz": "PLZ", "einwohner": "Einwohner", "lat": "Breitengrad", "lon": "Längengrad"}, inplace = True)
-
-    # Convert to string
-    dframe2['Breitengrad']  = dframe2['Breitengrad'].astype(str)
-    dframe2['Längengrad']   = dframe2['Längengrad'].astype(str)
+    dframe2               	= dfr.loc[:,['plz', 'einwohner', 'lat', 'lon']]
+    dframe2                 = sc.conform(dframe2.rename(columns={"plz": "PLZ", "einwohner": "Einwohner",
+                                                                 "lat": "Breitengrad", "lon": "Längengrad"}))
 
-    # Now replace the commas with periods
-    dframe2['Breitengrad']  = dframe2['Breitengrad'].str.replace(',', '.')
-    dframe2['Längengrad']   = dframe2['Längengrad'].str.replace(',', '.')
+    # Float coordinates, bounding box check and station/area points
+    dframe2                 = normalise_coordinates(dframe2, pdict)
 
+    plz_lo, plz_hi          = pdict["resid_plz_range"]
     dframe3                 = dframe2[ 
-                                            (dframe2["PLZ"] > 10000) &  
-                                            (dframe2["PLZ"] < 14200)]
+                                            ((dframe2["PLZ"] > plz_lo) &  
+                                            (dframe2["PLZ"] < plz_hi)).fillna(False)]
     
-    ret = sort_by_plz_add_geometry(dframe3, df_geo, pdict)
+    ret = sort_by_plz_add_geometry(dframe3, area_index, pdict)
     
     return ret
-
-
-# -----------------------------------------------------------------------------
-@ht.timer
-def make_streamlit_electric_Charging_resid(dfr1, dfr2):
-    """
-    This function is designed to create a Streamlit app for electric vehicle charging at residential
-    locations using two input dataframes.
-    
-    :param dfr1: It seems like you were about to ask for an explanation of the parameters `dfr1` and
-    `dfr2`. Could you please provide more context or finish your question so I can assist you better?
-    :param dfr2: It seems like your message got cut off. Could you please provide more information about
-    the parameters and what you would like to achieve with the function
-    `make_streamlit_electric_Charging_resid(dfr1, dfr2)`?
-    """
-    
-    dframe1 = dfr1.copy()
-    dframe2 = dfr2.copy()
-
-
-    # Streamlit app
-    st.title('Heatmaps: Electric Charging Stations and Residents')
-
-    # Create a radio button for layer selection
-    # layer_selection = st.radio("Select Layer", ("Number of Residents per PLZ (Postal code)", "Number of Charging Stations per PLZ (Postal code)"))
-
-    layer_selection = st.radio("Select Layer", ("Residents", "Charging_Stations"))
-
-    # Create a Folium map
-    m = folium.Map(location=[52.52, 13.40], zoom_start=10)
-
-    if layer_selection == "Residents":
-        
-        # Create a color map for Residents
-        color_map = LinearColormap(colors=['yellow', 'red'], vmin=dframe2['Einwohner'].min(), vmax=dframe2['Einwohner'].max())
-
-        # Add polygons to the map for Residents
-        for idx, row in dframe2.iterrows():
-            folium.GeoJson(
-                row['geometry'],
-                style_function=lambda x, color=color_map(row['Einwohner']): {
-                    'fillColor': color,
-                    'color': 'black',
-                    'weight': 1,
-                    'fillOpacity': 0.7
-                },
-                tooltip=f"PLZ: {row['PLZ']}, Einwohner: {row['Einwohner']}"
-            ).add_to(m)
-        
-        # Display the dataframe for Residents
-        # st.subheader('Residents Data')
-        # st.dataframe(gdf_residents2)
-
-    else:
-        # Create a color map for Numbers
-
-        color_map = LinearColormap(colors=['yellow', 'red'], vmin=dframe1['Number'].min(), vmax=dframe1['Number'].max())
-
-    # Add polygons to the map for Numbers
-        for idx, row in dframe1.iterrows():
-            folium.GeoJson(
-                row['geometry'],
-                style_function=lambda x, color=color_map(row['Number']): {
-                    'fillColor': color,
-                    'color': 'black',
-                    'weight': 1,
-                    'fillOpacity': 0.7
-                },
-                tooltip=f"PLZ: {row['PLZ']}, Number: {row['Number']}"
-            ).add_to(m)
-
-        # Display the dataframe for Numbers
-        # st.subheader('Numbers Data')
-        # st.dataframe(gdf_lstat3)
-
-    # Add color map to the map
-    color_map.add_to(m)
-    
-    folium_static(m, width=800, height=600)
\ No newline at end of file
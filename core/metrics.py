@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import functools
+import threading
+import tracemalloc
+
+
+# Instrumentation is off unless HEATMAP_METRICS is set (or `enable()` is called). When it is off, an
+# instrumented function costs one flag check per call.
+_enabled        = os.environ.get("HEATMAP_METRICS", "") not in ("", "0")
+
+_records        = []
+_records_lock   = threading.Lock()
+
+# Named counts reported by the stages, e.g. rows flagged by a check (see `count`)
+_counters       = {}
+
+# Peak traced memory of the enclosing stages of the current thread, innermost last (see `instrument`)
+_local          = threading.local()
+
+# Number of running stages that need tracemalloc; the stage that started it is not necessarily the
+# last one to finish when stages run in threads
+_tracing_users  = 0
+_tracing_owned  = False
+_tracing_lock   = threading.Lock()
+
+
+def enable(flag=True):
+    """Switch the instrumentation on or off at runtime."""
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled():
+    return _enabled
+
+
+def _peak_stack():
+    if not hasattr(_local, "peaks"):
+        _local.peaks = []
+    return _local.peaks
+
+
+def _start_tracing():
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_owned = True
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+
+
+def _rows(obj):
+    """Row count of a DataFrame-like object, None for anything else."""
+    return len(obj) if hasattr(obj, "columns") else None
+
+
+def instrument(stage):
+    """
+    The function `instrument` is a decorator recording one metrics entry per call of a pipeline stage:
+    wall time, CPU time, peak memory allocated by Python while the stage ran (tracemalloc) and the row
+    counts of its input and output.
+
+    :param stage: The `stage` parameter is the name under which the calls are recorded
+    :return: The decorator. The row count of the input is taken from the first positional argument that
+    is a DataFrame, the row count of the output from the return value.
+
+    CPU time and memory are measured for the whole process; stages running concurrently in threads
+    share them, so their peaks are only approximate.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            _start_tracing()
+            peaks = _peak_stack()
+            mem_start, peak_outer = tracemalloc.get_traced_memory()
+            # keep the peak of the enclosing stage before it is reset for this one
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak_outer)
+            peaks.append(0)
+            tracemalloc.reset_peak()
+
+            t_wall, t_cpu = time.perf_counter(), time.process_time()
+            try:
+                value = func(*args, **kwargs)
+            finally:
+                wall, cpu   = time.perf_counter() - t_wall, time.process_time() - t_cpu
+                peak        = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if peaks:
+                    peaks[-1] = max(peaks[-1], peak)
+                _stop_tracing()
+
+            rows_in = next((_rows(a) for a in args if _rows(a) is not None), None)
+            record = {
+                "stage":        stage,
+                "timestamp":    time.time(),
+                "wall_s":       wall,
+                "cpu_s":        cpu,
+                "peak_bytes":   max(peak - mem_start, 0),
+                "rows_in":      rows_in,
+                "rows_out":     _rows(value),
+            }
+            with _records_lock:
+                _records.append(record)
+            return value
+
+        return wrapper
+    return decorator
+
+
+def count(name, n=1):
+    """
+    The function `count` adds `n` to a named counter, for facts a stage observes about its data, e.g.
+    the number of rows failing a check. Like the stage entries, counts are only kept while the
+    instrumentation is enabled.
+
+    :param name: The `name` parameter is the name of the counter
+    :param n: The `n` parameter is the amount to add
+    """
+    if not _enabled:
+        return
+    with _records_lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def counters():
+    """A copy of all counters `{name: value}`."""
+    with _records_lock:
+        return dict(_counters)
+
+
+def records():
+    """A copy of all recorded entries, oldest first."""
+    with _records_lock:
+        return [dict(r) for r in _records]
+
+
+def reset():
+    """Drop all recorded entries and counters."""
+    with _records_lock:
+        _records.clear()
+        _counters.clear()
+
+
+def summary():
+    """
+    The function `summary` aggregates the recorded entries per stage.
+
+    :return: A dictionary `{stage: {"calls", "wall_s", "cpu_s", "peak_bytes", "rows_in", "rows_out"}}`
+    with summed times and row counts and the largest peak memory.
+    """
+    ret = {}
+    for r in records():
+        s = ret.setdefault(r["stage"], {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_bytes": 0,
+                                        "rows_in": 0, "rows_out": 0})
+        s["calls"]      += 1
+        s["wall_s"]     += r["wall_s"]
+        s["cpu_s"]      += r["cpu_s"]
+        s["peak_bytes"] = max(s["peak_bytes"], r["peak_bytes"])
+        s["rows_in"]    += r["rows_in"] or 0
+        s["rows_out"]   += r["rows_out"] or 0
+    return ret
+
+
+def to_json(indent=2):
+    """All recorded entries, the per-stage summary and the counters as a JSON document."""
+    return json.dumps({"records": records(), "summary": summary(), "counters": counters()}, indent=indent)
+
+
+# name, Prometheus type, help text, summary field
+_PROM_METRICS = [
+    ("heatmap_stage_calls_total",           "counter",  "Number of calls of the stage",             "calls"),
+    ("heatmap_stage_wall_seconds_total",    "counter",  "Wall time spent in the stage",             "wall_s"),
+    ("heatmap_stage_cpu_seconds_total",     "counter",  "Process CPU time spent in the stage",      "cpu_s"),
+    ("heatmap_stage_peak_memory_bytes",     "gauge",    "Largest Python memory peak of one call",   "peak_bytes"),
+    ("heatmap_stage_rows_in_total",         "counter",  "Input rows processed by the stage",        "rows_in"),
+    ("heatmap_stage_rows_out_total",        "counter",  "Output rows produced by the stage",        "rows_out"),
+]
+
+def to_prometheus():
+    """The per-stage summary in the Prometheus text exposition format."""
+    stages = summary()
+    lines = []
+    for name, kind, help_text, field in _PROM_METRICS:
+        lines.append("# HELP {} {}".format(name, help_text))
+        lines.append("# TYPE {} {}".format(name, kind))
+        for stage, s in sorted(stages.items()):
+            lines.append('{}{{stage="{}"}} {}'.format(name, stage, s[field]))
+    lines.append("# HELP heatmap_count_total Counts reported by the stages")
+    lines.append("# TYPE heatmap_count_total counter")
+    for name, value in sorted(counters().items()):
+        lines.append('heatmap_count_total{{name="{}"}} {}'.format(name, value))
+    return "\n".join(lines) + "\n"
+
+
+def export(path):
+    """Write the metrics to `path`, as Prometheus text for a `.prom` file and as JSON otherwise."""
+    text = to_prometheus() if path.endswith(".prom") else to_json()
+    with open(path, "w", encoding="utf-8") as f_out:
+        f_out.write(text)
@@ -0,0 +1,193 @@
+import numpy                         as np
+import pandas                        as pd
+import geopandas                     as gpd
+import shapely
+from pyproj                          import Transformer
+from scipy.spatial                   import cKDTree
+
+from core import metrics             as mt
+
+
+def project(lon, lat, pdict):
+    """
+    The function `project` converts WGS84 coordinates into the metric CRS of the region, in which
+    euclidean distances are distances in metres.
+
+    :param lon: The `lon` parameter is an array of longitudes
+    :param lat: The `lat` parameter is an array of latitudes
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["crs_metric"]` is the
+    projected CRS
+    :return: A float64 array of shape `(n, 2)`; points without coordinates are NaN.
+    """
+    to_metric   = Transformer.from_crs("EPSG:4326", pdict["crs_metric"], always_xy=True)
+    x, y        = to_metric.transform(np.asarray(lon, dtype="float64"), np.asarray(lat, dtype="float64"))
+    return np.column_stack([x, y])
+
+
+@mt.instrument("build_station_index")
+def build_station_index(gdf_lstat, pdict):
+    """
+    The function `build_station_index` builds a KD-tree over the station locations in projected
+    coordinates, for nearest-station and coverage queries in metres.
+
+    :param gdf_lstat: The `gdf_lstat` parameter is the station GeoDataFrame of `preprop_lstat` with the
+    columns `Breitengrad` and `Längengrad`; stations without coordinates are left out
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["crs_metric"]` is the
+    projected CRS
+    :return: A dictionary with the `tree`, the projected coordinates `xy` and the positions `rows` of the
+    indexed stations in `gdf_lstat`.
+    """
+    xy      = project(gdf_lstat['Längengrad'], gdf_lstat['Breitengrad'], pdict)
+    valid   = np.isfinite(xy).all(axis=1)
+    return {"tree": cKDTree(xy[valid]), "xy": xy[valid], "rows": np.flatnonzero(valid)}
+
+
+def nearest_stations(station_index, xy, k=1):
+    """
+    The function `nearest_stations` finds the `k` nearest stations of many points in one batch query,
+    using all CPU cores.
+
+    :param station_index: The `station_index` parameter is the index of `build_station_index`
+    :param xy: The `xy` parameter is an array of shape `(n, 2)` of projected points, see `project`
+    :param k: The `k` parameter is the number of stations per point
+    :return: A tuple `(dist, rows)` of arrays of shape `(n, k)`: the distances in metres, sorted, and the
+    positions of the stations in the station GeoDataFrame. Missing neighbours (fewer than `k` stations,
+    points without coordinates) have an infinite distance and the position -1.
+    """
+    xy          = np.asarray(xy, dtype="float64")
+    valid       = np.isfinite(xy).all(axis=1)
+    dist        = np.full((len(xy), k), np.inf)
+    rows        = np.full((len(xy), k), -1, dtype=np.int64)
+    if station_index["tree"].n == 0 or not valid.any():
+        return dist, rows
+
+    d, i        = station_index["tree"].query(xy[valid], k=k, workers=-1)
+    d, i        = d.reshape(-1, k), i.reshape(-1, k)
+    found       = i < station_index["tree"].n
+    dist[valid] = d
+    rows[valid] = np.where(found, station_index["rows"][np.minimum(i, station_index["tree"].n - 1)], -1)
+    return dist, rows
+
+
+def coverage(station_index, xy, radius, weights=None):
+    """
+    The function `coverage` tells which points have a station within `radius` metres.
+
+    :param station_index: The `station_index` parameter is the index of `build_station_index`
+    :param xy: The `xy` parameter is an array of shape `(n, 2)` of projected points
+    :param radius: The `radius` parameter is the distance in metres
+    :param weights: The optional `weights` parameter gives every point a weight, e.g. its residents
+    :return: A tuple `(covered, share)`: a boolean array per point and the (weighted) share of covered
+    points.
+    """
+    xy          = np.asarray(xy, dtype="float64")
+    valid       = np.isfinite(xy).all(axis=1)
+    covered     = np.zeros(len(xy), dtype=bool)
+    if station_index["tree"].n and valid.any():
+        # the search stops at `radius`, which is much cheaper than finding the nearest station
+        dist, _         = station_index["tree"].query(xy[valid], k=1, distance_upper_bound=radius, workers=-1)
+        covered[valid]  = dist <= radius
+    weights     = np.ones(len(covered)) if weights is None else np.asarray(weights, dtype="float64")
+    total       = weights.sum()
+    return covered, (weights[covered].sum() / total if total > 0 else np.nan)
+
+
+def sample_areas(geoms, n):
+    """
+    The function `sample_areas` places a regular grid of about `n` points inside every polygon, so that
+    measures over the area of a polygon can be taken as means over its points.
+
+    :param geoms: The `geoms` parameter is an array of polygons in a projected CRS
+    :param n: The `n` parameter is the number of points per polygon; the grid spacing of every polygon is
+    chosen from its area, so small and large areas get about the same number of points
+    :return: A tuple `(xy, area)`: the points as an array of shape `(m, 2)` and the position of the polygon
+    of every point. Polygons too small or too thin for the grid get their representative point.
+    """
+    geoms       = np.asarray(geoms, dtype=object)
+    shapely.prepare(geoms)
+    spacing     = np.sqrt(shapely.area(geoms) / n)
+    bounds      = shapely.bounds(geoms)
+    parts, pos  = [], []
+    for i, (geom, step, (x_min, y_min, x_max, y_max)) in enumerate(zip(geoms, spacing, bounds)):
+        if not step > 0:
+            continue
+        gx, gy  = np.meshgrid(np.arange(x_min + step / 2, x_max, step), np.arange(y_min + step / 2, y_max, step))
+        gx, gy  = gx.ravel(), gy.ravel()
+        inside  = shapely.contains_xy(geom, gx, gy)
+        if not inside.any():
+            point   = shapely.point_on_surface(geom)
+            gx, gy  = np.array([shapely.get_x(point)]), np.array([shapely.get_y(point)])
+            inside  = np.ones(1, dtype=bool)
+        parts.append(np.column_stack([gx[inside], gy[inside]]))
+        pos.append(np.full(inside.sum(), i))
+    if not parts:
+        return np.empty((0, 2)), np.empty(0, dtype=np.int64)
+    return np.concatenate(parts), np.concatenate(pos)
+
+
+@mt.instrument("proximity_plz")
+def proximity_plz(gdf_lstat, gdf_resid, agg_plz, pdict):
+    """
+    The function `proximity_plz` measures how far the residents of every postal code area are from a
+    charging station: the distances from a representative point of the area to its nearest stations and
+    the residents living within `pdict["coverage_radius"]` metres of a station. The register gives the
+    residents per area only, so they are taken as evenly spread over it: the covered share of an area is
+    the share of its sample points (`sample_areas`) within the radius of a station.
+
+    :param gdf_lstat: The `gdf_lstat` parameter is the station GeoDataFrame of `preprop_lstat`
+    :param gdf_resid: The `gdf_resid` parameter is the resident GeoDataFrame of `preprop_resid` with the
+    residents (`Einwohner`) per postal code
+    :param agg_plz: The `agg_plz` parameter is the GeoDataFrame of `aggregate_plz`, which provides one row
+    and polygon per area
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["nearest_k"]` is the number
+    of nearest stations, `pdict["coverage_radius"]` the radius in metres and `pdict["coverage_samples"]`
+    the number of sample points per area
+    :return: A DataFrame with one row per area of `agg_plz`: `PLZ`, the distance in metres to the nearest
+    (`Dist_1`) up to the k-th station (`Dist_<k>`), `Residents_covered` and `Coverage_share` (missing for
+    areas without residents).
+    """
+    k, radius   = pdict["nearest_k"], pdict["coverage_radius"]
+    index       = build_station_index(gdf_lstat, pdict)
+
+    points      = shapely.point_on_surface(np.asarray(agg_plz.geometry.values))
+    dist, _     = nearest_stations(index, project(shapely.get_x(points), shapely.get_y(points), pdict), k)
+
+    areas       = gpd.GeoSeries(agg_plz.geometry.values, crs="EPSG:4326").to_crs(pdict["crs_metric"]).values
+    sample_xy, sample_area = sample_areas(areas, pdict["coverage_samples"])
+    covered, _  = coverage(index, sample_xy, radius)
+    share       = np.bincount(sample_area, weights=covered, minlength=len(areas)) / \
+                  np.maximum(np.bincount(sample_area, minlength=len(areas)), 1)
+    residents   = gdf_resid['Einwohner'].astype('float64').fillna(0).groupby(gdf_resid['PLZ'].values).sum()
+    residents   = residents.reindex(agg_plz['PLZ'].values).to_numpy()
+
+    ret         = pd.DataFrame({'PLZ': agg_plz['PLZ'].values})
+    for j in range(k):
+        ret['Dist_{}'.format(j + 1)] = np.where(np.isfinite(dist[:, j]), dist[:, j], np.nan)
+    ret['Residents_covered']    = residents * share
+    ret['Coverage_share']       = np.where(residents > 0, share, np.nan)
+    return ret
+
+
+def add_coverage(gap_plz, gap_bezirk, prox_plz):
+    """
+    The function `add_coverage` attaches the measures of `proximity_plz` to the gap layers, so that the
+    coverage can be shown like the other measures of an area. Districts get the covered residents of
+    their postal codes and the share of their residents these make up.
+
+    :param gap_plz: The `gap_plz` parameter is the GeoDataFrame of `core.gap.gap_analysis` per PLZ
+    :param gap_bezirk: The `gap_bezirk` parameter is the GeoDataFrame of `core.gap.gap_analysis` per Bezirk
+    :param prox_plz: The `prox_plz` parameter is the DataFrame of `proximity_plz` for the same areas and in
+    the same order as `gap_plz`; it is computed for all stations of the current register
+    :return: A tuple `(gap_plz, gap_bezirk)` of copies with the added columns.
+    """
+    plz         = gap_plz.copy()
+    for col in prox_plz.columns.drop('PLZ'):
+        plz[col] = prox_plz[col].values
+    known       = plz['Coverage_share'].notna()
+    by_bezirk   = pd.DataFrame({'Covered': plz['Residents_covered'].where(known, 0.0).values,
+                                'Total': plz['Einwohner'].where(known, 0).astype('float64').values}) \
+                    .groupby(plz['Bezirk'].values).sum().reindex(gap_bezirk['Bezirk'].values)
+    bezirk      = gap_bezirk.copy()
+    bezirk['Residents_covered'] = by_bezirk['Covered'].fillna(0.0).values
+    bezirk['Coverage_share']    = (by_bezirk['Covered'] / by_bezirk['Total'].where(by_bezirk['Total'] > 0)).values
+    return plz, bezirk
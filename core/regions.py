@@ -0,0 +1,25 @@
+import os
+
+
+def region_pdict(pdict, region):
+    """
+    The function `region_pdict` returns a copy of `pdict` for one entry of `pdict["regions"]`. The
+    settings of the region (filters, geometry files, bounding box) replace those of the selected region;
+    its artifacts are stored in their own folder, see `core.artifacts.artifact_paths`.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary
+    :param region: The `region` parameter is a key of `pdict["regions"]`
+    :return: The configuration dictionary of the region.
+    """
+    if region not in pdict["regions"]:
+        raise KeyError("Unknown region {!r}, configured: {}".format(region, ", ".join(pdict["regions"])))
+    cfg = dict(pdict)
+    cfg.update(pdict["regions"][region])
+    cfg["region"] = region
+    return cfg
+
+
+def available_regions(pdict):
+    """Regions of `pdict["regions"]` whose geometry files exist; `export.py` offers only these."""
+    return [r for r, settings in pdict["regions"].items()
+            if all(os.path.exists(settings[k]) for k in ("file_geodat_plz", "file_geodat_dis"))]
@@ -0,0 +1,202 @@
+import folium
+from branca.colormap import LinearColormap
+
+from core import layers              as ly
+from core import gap                 as gp
+from core import metrics             as mt
+
+
+# Last position of the period slider: the stations of the current register, with or without a date
+CURRENT_REGISTER = "current register"
+
+
+def make_color_map(gdf, value_col):
+    """The `LinearColormap` of `core.layers.color_scale` for a layer, as shown in the legend."""
+    scale = ly.color_scale(gdf, value_col)
+    return LinearColormap(colors=scale.colors, index=scale.index, vmin=scale.vmin, vmax=scale.vmax)
+
+
+def build_map(gdf, value_col, key_col='PLZ', zoom_start=ly.MAP_ZOOM, location=ly.MAP_LOCATION):
+    """
+    The function `build_map` creates a Folium map showing one layer as a single precomputed GeoJSON
+    FeatureCollection together with its colour legend. It does not depend on Streamlit, so the same
+    map can be displayed in the app or saved as standalone HTML.
+
+    :param gdf: The `gdf` parameter is the GeoDataFrame of the layer
+    :param value_col: The `value_col` parameter is the column the areas are coloured by
+    :param key_col: The `key_col` parameter is the column identifying the areas, `PLZ` or `Bezirk`
+    :param zoom_start: The `zoom_start` parameter is the initial zoom level; it also sets the
+    simplification of the polygons
+    :param location: The `location` parameter is the initial map centre as `[lat, lon]`
+    :return: The `folium.Map`.
+    """
+    m = folium.Map(location=location, zoom_start=zoom_start)
+
+    color_map = make_color_map(gdf, value_col)
+    folium.GeoJson(
+        ly.layer_geojson(gdf, value_col, color_map, zoom=zoom_start, key_col=key_col),
+        style_function=ly.style_feature,
+        tooltip=folium.GeoJsonTooltip(fields=[key_col, value_col], aliases=[key_col + ':', value_col + ':'])
+    ).add_to(m)
+
+    # Add color map to the map
+    color_map.add_to(m)
+    return m
+
+
+def map_html(m):
+    """HTML of a map as `streamlit_folium.folium_static` embeds it, e.g. to serve a prerendered map."""
+    return folium.Figure().add_child(m).render()
+
+
+def build_tile_map(tiles_url, legend, value_col, key_col='PLZ', zoom_start=ly.MAP_ZOOM, location=ly.MAP_LOCATION,
+                   max_native_zoom=None):
+    """
+    The function `build_tile_map` creates a Folium map showing one layer from the vector tiles of
+    `core.tiles`. The browser only loads the tiles in view, and the fill colours are read from the
+    precomputed `fill_<value_col>` attribute of each feature.
+
+    :param tiles_url: The `tiles_url` parameter is the tile endpoint, e.g.
+    `http://localhost:8765/tiles/{z}/{x}/{y}.pbf`
+    :param legend: The `legend` parameter is the `legend` entry of the MBTiles metadata: the value range
+    `[vmin, vmax]` per level and column
+    :param value_col: The `value_col` parameter is the column the areas are coloured by
+    :param key_col: The `key_col` parameter is the tile layer to show, `PLZ` or `Bezirk`
+    :param zoom_start: The `zoom_start` parameter is the initial zoom level
+    :param location: The `location` parameter is the initial map centre as `[lat, lon]`
+    :param max_native_zoom: The optional `max_native_zoom` parameter is the highest zoom level of the tile
+    set; tiles of that level are scaled up when zooming in further
+    :return: The `folium.Map`.
+    """
+    from folium.plugins import VectorGridProtobuf
+
+    m = folium.Map(location=location, zoom_start=zoom_start)
+
+    # every tile carries both levels; the other one is hidden with an empty style
+    styles = ",\n".join(
+        '"{}": function(p) {{ return {{fill: true, fillColor: p["fill_{}"], fillOpacity: 0.7, '
+        'color: "black", weight: 1}}; }}'.format(level, value_col) if level == key_col
+        else '"{}": []'.format(level)
+        for level in ("PLZ", "Bezirk"))
+    options = "{{vectorTileLayerStyles: {{{}}}, interactive: true{}}}".format(
+        styles, ", maxNativeZoom: {}".format(max_native_zoom) if max_native_zoom else "")
+    VectorGridProtobuf(tiles_url, "{} per {}".format(value_col, key_col), options).add_to(m)
+
+    vmin, vmax = legend[key_col][value_col]
+    LinearColormap(colors=ly.DIVERGING_COLORS.get(value_col, ly.SEQUENTIAL_COLORS), vmin=vmin, vmax=vmax).add_to(m)
+    return m
+
+
+# -----------------------------------------------------------------------------
+@mt.instrument("render")
+def make_streamlit_electric_Charging_resid(dfr1, dfr2, dfr_dis=None, tiles=None, bbox=None, gaps=None,
+                                           power=None, series=None, maps=None):
+    """
+    This function is designed to create a Streamlit app for electric vehicle charging at residential
+    locations using two input dataframes.
+    
+    :param dfr1: The `dfr1` parameter is the GeoDataFrame with the number of charging stations per postal
+    code (`PLZ`, `Number`, `geometry`), e.g. the output of `count_plz_occurrences`
+    :param dfr2: The `dfr2` parameter is the GeoDataFrame with the residents per postal code (`PLZ`,
+    `Einwohner`, `geometry`), e.g. the output of `preprop_resid`
+    :param dfr_dis: The optional `dfr_dis` parameter is the GeoDataFrame of `core.aggregate.rollup_bezirk`.
+    If given, the user can switch both layers between postal code and district (Bezirk) level; all
+    levels are prepared beforehand, so switching only redraws the map.
+    :param tiles: The optional `tiles` parameter is a tuple `(tiles_url, metadata)` of a running tile
+    endpoint and the metadata of its MBTiles file (`core.tiles.read_metadata`). If given, the map loads
+    vector tiles instead of embedding the polygons of the layer.
+    :param bbox: The optional `bbox` parameter is the bounding box of the region (`pdict["bbox"]`); the map
+    is centred and zoomed to it. By default the map shows Berlin.
+    :param gaps: The optional `gaps` parameter is a tuple with the GeoDataFrames of `core.gap.gap_analysis`
+    per PLZ and per Bezirk. If given, the installed power and the supply gap can be shown as well, the
+    latter together with the table of the most underserved areas, and the coverage of
+    `core.proximity.add_coverage` if the gap layers carry it.
+    :param power: The optional `power` parameter is a tuple `(buckets, filter_layers)`: the charger classes
+    and a function returning the layers of `core.dataloader.filter_layers` for a selection of them. If
+    given (and the map is not drawn from vector tiles), the stations can be filtered by charger class.
+    :param series: The optional `series` parameter is a tuple `(periods, period_layers)`: the periods of
+    the time series by commissioning date and a function returning the layers of
+    `core.dataloader.period_layers` for one of them. If given (and the map is not drawn from vector
+    tiles), a slider shows the stations as of an earlier period; the charger class then cannot be
+    filtered.
+    :param maps: The optional `maps` parameter is a function returning the prerendered HTML of a layer at
+    a level (`core.serving.map_html` of a shared store). If given, maps of the current register and
+    the residents are served from it instead of being built in the session; only filtered and earlier
+    station layers are drawn from `dfr1`, `dfr_dis` and `gaps`, so the frames of the store need no
+    geometry otherwise.
+    """
+    # Streamlit is only needed here; `build_map` and the batch export work without it
+    import streamlit as st
+    import streamlit.components.v1 as components
+    from streamlit_folium import folium_static
+
+    # Streamlit app
+    st.title('Heatmaps: Electric Charging Stations and Residents')
+
+    # Create a radio button for layer selection
+    # layer_selection = st.radio("Select Layer", ("Number of Residents per PLZ (Postal code)", "Number of Charging Stations per PLZ (Postal code)"))
+
+    layer_selection = st.radio("Select Layer", ("Residents", "Charging_Stations") +
+                               (("Charging_Power", "Supply_Gap") if gaps is not None else ()) +
+                               (("Coverage",) if gaps is not None and "Coverage_share" in gaps[0] else ()))
+
+    # Earlier periods are slices of the precomputed time series
+    period = CURRENT_REGISTER
+    changed = False
+    if series is not None and tiles is None and len(series[0]):
+        periods, period_layers = series
+        period = st.select_slider("Commissioned until", options=list(periods) + [CURRENT_REGISTER],
+                                  value=CURRENT_REGISTER,
+                                  format_func=lambda p: p if isinstance(p, str) else p.strftime('%Y-%m'))
+        if period != CURRENT_REGISTER:
+            past        = period_layers(period)
+            dfr1        = past["lstat"]
+            dfr_dis     = past["agg_bezirk"]
+            gaps        = (past["gap_plz"], past["gap_bezirk"])
+            changed     = True
+
+    # Filters on the charger class are slices of the pre-aggregated station cube
+    if power is not None and tiles is None:
+        buckets, filter_layers = power
+        selected = st.multiselect("Charger class", buckets, default=buckets,
+                                  disabled=period != CURRENT_REGISTER,
+                                  help="Charger classes are filtered for the current register only")
+        if period == CURRENT_REGISTER and set(selected) != set(buckets):
+            filtered    = filter_layers(selected)
+            dfr1        = filtered["lstat"]
+            dfr_dis     = filtered["agg_bezirk"]
+            gaps        = (filtered["gap_plz"], filtered["gap_bezirk"])
+            changed     = True
+
+    level_selection = "PLZ"
+    if dfr_dis is not None:
+        level_selection = st.radio("Select Level", ("PLZ", "Bezirk"))
+
+    # Create a Folium map with the selected layer as one precomputed FeatureCollection
+    gdf, value_col, key_col = ly.layer_frame(dfr1, dfr2, dfr_dis, layer_selection, level_selection, gaps)
+    location, zoom = ly.map_view(bbox) if bbox is not None else (ly.MAP_LOCATION, ly.MAP_ZOOM)
+    if tiles is not None:
+        tiles_url, metadata = tiles
+        m = build_tile_map(tiles_url, metadata["json"]["legend"], value_col, key_col, zoom, location,
+                           max_native_zoom=int(metadata["maxzoom"]))
+    elif maps is not None and (not changed or layer_selection in ("Residents", "Coverage")):
+        # residents and coverage do not depend on the station filters, so their map is always the stored one
+        m = None
+        components.html(maps(layer_selection, level_selection), height=ly.MAP_HEIGHT + 10, width=ly.MAP_WIDTH)
+    else:
+        m = build_map(gdf, value_col, key_col, zoom, location)
+
+    # Display the dataframe for the layer
+    # st.subheader('Layer Data')
+    # st.dataframe(gdf)
+
+    if m is not None:
+        folium_static(m, width=ly.MAP_WIDTH, height=ly.MAP_HEIGHT)
+
+    if layer_selection == "Coverage":
+        st.caption("Share of the residents within the coverage radius of a charging station, for all stations of "
+                   "the current register; the residents are taken as evenly spread over their area")
+
+    if layer_selection == "Supply_Gap":
+        st.subheader('Most underserved areas')
+        st.dataframe(gp.rank_underserved(gdf, key_col, n=15))
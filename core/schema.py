@@ -0,0 +1,59 @@
+import numpy                         as np
+import pandas                        as pd
+
+
+# Canonical column types of the station and resident tables
+PLZ_DTYPE       = 'Int32'           # postal code as an integer code, '01067' -> 1067; nullable
+COORD_DTYPE     = 'float32'         # WGS84 degrees, about 0.5 m resolution in Germany
+KW_DTYPE        = 'float32'
+COUNT_DTYPE     = 'Int32'
+DATE_DTYPE      = 'datetime64[ms]'  # missing dates are NaT; the coarsest unit Parquet stores
+
+COLUMNS = {
+    'PLZ':                     PLZ_DTYPE,
+    'PLZ_declared':            PLZ_DTYPE,
+    'PLZ_geo':                 PLZ_DTYPE,
+    'Breitengrad':             COORD_DTYPE,
+    'Längengrad':              COORD_DTYPE,
+    'KW':                      KW_DTYPE,
+    'Einwohner':               COUNT_DTYPE,
+    'Inbetriebnahmedatum':     DATE_DTYPE,
+}
+
+# Types of the additive measures per area (`core.aggregate`); they have no missing values
+TOTALS = {
+    'Number':           'int32',
+    'KW_total':         'float64',
+    'KW_n':             'int32',
+    'Einwohner':        'int32',
+}
+
+
+def plz_code(values):
+    """
+    The function `plz_code` converts postal codes given as numbers or as (zero-padded) strings into
+    the integer code of `PLZ_DTYPE`.
+
+    :param values: The `values` parameter is a Series of postal codes, e.g. `1067`, `'01067'` or `'1067'`
+    :return: A Series of `PLZ_DTYPE`; values that are not a postal code become missing.
+    """
+    if pd.api.types.is_integer_dtype(values):
+        return values.astype(PLZ_DTYPE)
+    if pd.api.types.is_float_dtype(values):
+        return values.where(values == np.floor(values)).astype(PLZ_DTYPE)
+    return pd.to_numeric(values.astype('str').str.strip(), errors='coerce').astype(PLZ_DTYPE)
+
+
+def conform(dframe):
+    """
+    The function `conform` casts the columns of `COLUMNS` present in a dataframe to their canonical
+    type. Other columns and columns that already have their type are not copied.
+
+    :param dframe: The `dframe` parameter is a station or resident DataFrame
+    :return: The dataframe with canonical column types.
+    """
+    dtypes = {c: t for c, t in COLUMNS.items() if c in dframe.columns and dframe[c].dtype != t}
+    if 'PLZ' in dtypes:
+        dframe['PLZ'] = plz_code(dframe['PLZ'])
+        del dtypes['PLZ']
+    return dframe.astype(dtypes) if dtypes else dframe
@@ -0,0 +1,248 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections.abc import Mapping
+
+import pandas                        as pd
+import geopandas                     as gpd
+import pyarrow                       as pa
+import shapely
+
+from core import artifacts           as ar
+from core import dataloader          as dl
+from core import geosource           as gs
+from core import layers              as ly
+from core import render              as rd
+from core import metrics             as mt
+
+
+# Layout of a layer store. Bump it when the files or the prerendered maps change.
+STORE_VERSION   = 1
+
+# Schema metadata entry describing the geometry columns of a table
+META_KEY        = b"heatmap"
+
+# Levels the maps are prerendered for
+MAP_LEVELS      = ("PLZ", "Bezirk")
+
+# Opened stores of the current process, keyed by their folder. The files are memory-mapped, so all
+# processes opening the same store share its pages.
+_stores         = {}
+_stores_lock    = threading.Lock()
+
+
+def store_key(pdict):
+    """
+    The function `store_key` identifies the layers a store holds: the content hashes of the input files,
+    the settings the stored stages depend on and the code versions of the stages and of the store.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary of one region
+    :return: A hex digest; only the settings of `core.artifacts.STAGE_SETTINGS` and the region change it.
+    """
+    keys     = sorted(set().union(*ar.STAGE_SETTINGS.values(), ("region",)))
+    settings = {k: pdict[k] for k in keys}
+    content  = {
+        "store_version":    STORE_VERSION,
+        "stage_versions":   ar.STAGE_VERSIONS,
+        "sources":          {k: gs.dataset_digest(pdict[k])[2] for k in dl.SOURCE_KEYS},
+        "settings":         settings,
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def store_path(pdict):
+    """Folder of the store for the current inputs: `serve_folder/<region>/<key>`; one folder per version."""
+    return os.path.join(pdict["serve_folder"], pdict["region"], store_key(pdict)[:16])
+
+
+def to_arrow(df):
+    """
+    The function `to_arrow` converts a (Geo)DataFrame into an Arrow table. Geometry columns are stored as
+    WKB; their names, the active geometry and the CRS are kept in the schema metadata.
+
+    :param df: The `df` parameter is a DataFrame or GeoDataFrame
+    :return: A `pyarrow.Table` without the index.
+    """
+    geom_cols   = [c for c in df.columns if isinstance(df[c].dtype, gpd.array.GeometryDtype)]
+    active      = df.geometry.name if isinstance(df, gpd.GeoDataFrame) and geom_cols else None
+    crs         = df.crs.to_json() if active and df.crs is not None else None
+    plain       = pd.DataFrame({c: shapely.to_wkb(df[c].values) if c in geom_cols else df[c]
+                                for c in df.columns})
+    table       = pa.Table.from_pandas(plain, preserve_index=False)
+    meta        = json.dumps({"geometry_columns": geom_cols, "geometry": active, "crs": crs}).encode()
+    return table.replace_schema_metadata({**table.schema.metadata, META_KEY: meta})
+
+
+def from_arrow(table, geometry=True):
+    """
+    The function `from_arrow` converts a table of `to_arrow` back into a (Geo)DataFrame. Numeric and
+    string columns without missing values are views of the table, so a memory-mapped table is not
+    copied; only the geometries are decoded.
+
+    :param table: The `table` parameter is a `pyarrow.Table` written by `to_arrow`
+    :param geometry: The `geometry` parameter tells whether to decode the geometry columns; without them
+    the result is a plain DataFrame
+    :return: A GeoDataFrame if the table has an active geometry and `geometry` is True, else a DataFrame.
+    """
+    meta        = json.loads(table.schema.metadata[META_KEY])
+    geom_cols   = meta["geometry_columns"]
+    plain       = table.drop_columns(geom_cols).to_pandas(split_blocks=True)
+    if not geometry or not geom_cols:
+        return plain
+    cols        = {c: gpd.GeoSeries(shapely.from_wkb(table.column(c).to_numpy(zero_copy_only=False)))
+                   if c in geom_cols else plain[c] for c in table.column_names}
+    ret         = pd.DataFrame(cols, copy=False)
+    return gpd.GeoDataFrame(ret, geometry=meta["geometry"], crs=meta["crs"]) if meta["geometry"] else ret
+
+
+def _write_table(table, path):
+    # uncompressed, so the buffers of the file can be used in place when it is memory-mapped
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_table(path):
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def render_maps(layers, pdict):
+    """
+    The function `render_maps` renders the map of every layer and level of the app as the HTML
+    `streamlit_folium.folium_static` would embed.
+
+    :param layers: The `layers` parameter is the dictionary of `core.dataloader.build_layers`
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["bbox"]` sets the view
+    :return: A table with the columns `layer`, `level` and `html`, one row per map.
+    """
+    location, zoom  = ly.map_view(pdict["bbox"])
+    gaps            = (layers["gap_plz"], layers["gap_bezirk"])
+    rows            = {"layer": [], "level": [], "html": []}
+    for layer in ly.LAYER_COLUMNS:
+        for level in MAP_LEVELS:
+            gdf, value_col, key_col = ly.layer_frame(layers["lstat"], layers["resid"], layers["agg_bezirk"],
+                                                     layer, level, gaps)
+            rows["layer"].append(layer)
+            rows["level"].append(level)
+            rows["html"].append(rd.map_html(rd.build_map(gdf, value_col, key_col, zoom, location)))
+    return pa.table({"layer": rows["layer"], "level": rows["level"],
+                     "html": pa.array(rows["html"], type=pa.large_string())})
+
+
+@mt.instrument("write_store")
+def write_store(layers, path, pdict):
+    """
+    The function `write_store` writes the prepared layers and their prerendered maps into a read-only
+    store of Arrow IPC files: one `<layer>.arrow` per layer, `maps.arrow` and a `manifest.json`. The
+    folder is written under a temporary name and renamed when complete; if another process finished the
+    same store first, its copy is kept.
+
+    :param layers: The `layers` parameter is the dictionary of `core.dataloader.build_layers`
+    :param path: The `path` parameter is the store folder, e.g. `store_path(pdict)`
+    :param pdict: The `pdict` parameter is the configuration dictionary the layers were built with
+    :return: The store folder.
+    """
+    parent  = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp     = tempfile.mkdtemp(prefix=".tmp_", dir=parent)
+    try:
+        for name, frame in layers.items():
+            _write_table(to_arrow(frame), os.path.join(tmp, name + ".arrow"))
+        _write_table(render_maps(layers, pdict), os.path.join(tmp, "maps.arrow"))
+        manifest = {"store_version": STORE_VERSION, "key": store_key(pdict), "region": pdict["region"],
+                    "layers": list(layers)}
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f_out:
+            json.dump(manifest, f_out, indent=2)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            if not os.path.exists(os.path.join(path, "manifest.json")):
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return path
+
+
+class StoreLayers(Mapping):
+    """
+    Read-only mapping of layer names to the (Geo)DataFrames of a store, converted on first access and
+    kept afterwards (see `from_arrow`). With `geometry=False` the frames carry no geometry columns and
+    are views of the memory-mapped files.
+    """
+
+    def __init__(self, tables, geometry=True):
+        self._tables    = tables
+        self._geometry  = geometry
+        self._frames    = {}
+        self._lock      = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._frames:
+                self._frames[name] = from_arrow(self._tables[name], self._geometry)
+            return self._frames[name]
+
+    def __iter__(self):
+        return iter(self._tables)
+
+    def __len__(self):
+        return len(self._tables)
+
+
+def open_store(path):
+    """
+    The function `open_store` memory-maps a store written by `write_store`. Every process opens a store
+    once; the pages of the files are shared by all processes through the OS page cache.
+
+    :param path: The `path` parameter is the store folder
+    :return: A dictionary with the `manifest`, the memory-mapped `tables`, the `maps` table, the
+    `layers` (`StoreLayers` with geometry) and the `frames` (`StoreLayers` without geometry).
+    """
+    with _stores_lock:
+        if path in _stores:
+            return _stores[path]
+    with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f_in:
+        manifest = json.load(f_in)
+    tables  = {name: _read_table(os.path.join(path, name + ".arrow")) for name in manifest["layers"]}
+    maps    = _read_table(os.path.join(path, "maps.arrow"))
+    store   = {
+        "manifest": manifest,
+        "tables":   tables,
+        "maps":     maps,
+        "index":    {(a, b): i for i, (a, b) in enumerate(zip(maps.column("layer").to_pylist(),
+                                                              maps.column("level").to_pylist()))},
+        "layers":   StoreLayers(tables),
+        "frames":   StoreLayers(tables, geometry=False),
+    }
+    with _stores_lock:
+        return _stores.setdefault(path, store)
+
+
+def map_html(store, layer, level):
+    """HTML of the prerendered map of a layer at a level (`PLZ` or `Bezirk`)."""
+    return store["maps"].column("html")[store["index"][(layer, level)]].as_py()
+
+
+def load_store(pdict):
+    """
+    The function `load_store` opens the store of the current inputs and settings, and builds it first if
+    it does not exist yet (from the artifacts of `core.dataloader.build_layers`). The layers built for it
+    are not kept in the cache of `core.dataloader.load_layers`; the process uses the store instead.
+
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["serve_folder"]` is the
+    root folder of the stores
+    :return: The store of `open_store`.
+    """
+    path = store_path(pdict)
+    if not os.path.exists(os.path.join(path, "manifest.json")):
+        write_store(dl.build_layers(pdict), path, pdict)
+    return open_store(path)
+
+
+def clear_cache():
+    """Forget the opened stores; their memory maps are released once no frame refers to them."""
+    with _stores_lock:
+        _stores.clear()
@@ -0,0 +1,224 @@
+import os
+import multiprocessing
+from concurrent.futures              import ProcessPoolExecutor
+
+import numpy                         as np
+import pandas                        as pd
+import geopandas                     as gpd
+import shapely
+from shapely                         import STRtree
+
+from core import metrics             as mt
+from core import schema              as sc
+
+
+# Total WKT length from which `parse_geometry` splits the parsing across worker processes; below it
+# starting the workers costs more than it saves (Berlin: 1.5 MB, parsed in 25 ms)
+PARALLEL_WKT_CHARS = 50_000_000
+
+# Start method of these workers. `parse_geometry` runs in the loader threads of `core.dataloader`, and a
+# process forked from a threaded process can inherit locks held by other threads and hang.
+WKT_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def repair_geometry(geoms):
+    """Repair the invalid geometries of an object array in place, keeping the polygonal part of the shapes."""
+    invalid         = ~shapely.is_valid(geoms) & ~shapely.is_missing(geoms)
+    if invalid.any():
+        # drop collapsed edges, so that a repaired polygon stays a (multi)polygon
+        geoms[invalid] = shapely.make_valid(geoms[invalid], method="structure", keep_collapsed=False)
+    return geoms
+
+
+def _parse_chunk(wkt):
+    """Parse WKT strings and repair the invalid geometries; runs in a worker process for large inputs."""
+    return repair_geometry(shapely.from_wkt(wkt))
+
+
+@mt.instrument("parse_geometry")
+def parse_geometry(wkt, workers=None):
+    """
+    The function `parse_geometry` parses a column of WKT geometries. Each distinct string is parsed and
+    repaired only once; rows with the same WKT share one geometry object. Large inputs (at least
+    `PARALLEL_WKT_CHARS` characters, e.g. nationwide postal code shapes) are split into chunks of
+    similar length that are parsed in worker processes (started with `WKT_START_METHOD`), as GEOS holds
+    the GIL while parsing.
+
+    :param wkt: The `wkt` parameter is an array or Series of WKT strings; missing values are allowed
+    :param workers: The `workers` parameter is the number of worker processes for large inputs (default:
+    the CPU count); 1 parses in the calling process
+    :return: An object array of shapely geometries, None for missing values. Invalid polygons are
+    repaired by `repair_geometry`.
+    """
+    codes, unique   = pd.factorize(np.asarray(wkt, dtype=object))
+    unique          = np.asarray(unique, dtype=object)
+    lengths         = np.fromiter(map(len, unique), dtype=np.int64, count=len(unique))
+    workers         = min(workers or os.cpu_count() or 1, len(unique))
+
+    if workers <= 1 or lengths.sum() < PARALLEL_WKT_CHARS:
+        geoms       = _parse_chunk(unique)
+    else:
+        # chunk borders at equal shares of the total length, so that the workers get similar work
+        bounds      = np.searchsorted(np.cumsum(lengths), lengths.sum() * np.arange(1, workers) / workers)
+        context     = multiprocessing.get_context(WKT_START_METHOD)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            geoms   = np.concatenate(list(pool.map(_parse_chunk, np.split(unique, bounds))))
+
+    ret             = np.empty(len(codes), dtype=object)
+    ret[codes >= 0] = geoms[codes[codes >= 0]]
+    return ret
+
+
+def _area_level(keys, geoms, pdict):
+    """Polygons of one level (PLZ or Bezirk), their keys, a key lookup, their area and an STRtree."""
+    geoms = np.asarray(geoms, dtype=object)
+    shapely.prepare(geoms)
+    area  = gpd.GeoSeries(geoms, crs="EPSG:4326").to_crs(pdict["crs_metric"]).area.values / 1e6
+    return {"keys": np.asarray(keys), "lookup": pd.Index(np.asarray(keys)), "geoms": geoms,
+            "area_km2": area, "tree": STRtree(geoms)}
+
+
+def neighbours(level):
+    """
+    The function `neighbours` finds the areas of a level that share a border or a corner with each
+    area.
+
+    :param level: The `level` parameter is one entry of the index built by `build_area_index`
+    :return: The adjacency in compressed sparse row form, a tuple `(indptr, indices)`: the neighbours of
+    the area at position `i` are at the positions `indices[indptr[i]:indptr[i + 1]]`.
+    """
+    src, dst    = level["tree"].query(level["geoms"], predicate="intersects")
+    keep        = src != dst
+    src, dst    = src[keep], dst[keep]
+    order       = np.lexsort((dst, src))
+    indptr      = np.searchsorted(src[order], np.arange(len(level["geoms"]) + 1))
+    return indptr, dst[order]
+
+
+def adjacency_table(adjacency):
+    """The adjacency of `neighbours` as a table to be stored: one row (`src`, `dst`) per pair of neighbours."""
+    indptr, indices = adjacency
+    return pd.DataFrame({'src': np.repeat(np.arange(len(indptr) - 1), np.diff(indptr)).astype('int32'),
+                         'dst': np.asarray(indices, dtype='int32')})
+
+
+def table_adjacency(table, n):
+    """
+    The function `table_adjacency` turns a table of `adjacency_table` back into the compressed sparse
+    row form of `neighbours`, without querying the polygons again.
+
+    :param table: The `table` parameter is a DataFrame of `adjacency_table`, sorted by `src`
+    :param n: The `n` parameter is the number of areas
+    :return: A tuple `(indptr, indices)`.
+    """
+    src     = table['src'].to_numpy()
+    return np.searchsorted(src, np.arange(n + 1)), table['dst'].to_numpy()
+
+
+def lookup(level, keys):
+    """
+    The function `lookup` finds the positions of area keys in a level with one hash lookup, e.g. to
+    attach the polygons of the postal codes to stations or residents.
+
+    :param level: The `level` parameter is one entry of the index built by `build_area_index`
+    :param keys: The `keys` parameter is an array or Series of area keys; missing values are allowed
+    :return: An integer array with the position of each key in `level["keys"]`, or -1 for unknown keys.
+    """
+    return level["lookup"].get_indexer(keys)
+
+
+@mt.instrument("build_area_index")
+def build_area_index(df_geodat_plz, df_geodat_dis, pdict):
+    """
+    The function `build_area_index` builds an STRtree over the postal code and the district polygons,
+    so that many points can be assigned to their areas in bulk. The postal code level also gets a
+    table of per-area attributes, so that later stages look them up instead of merging against the
+    geometry table.
+
+    :param df_geodat_plz: The `df_geodat_plz` parameter is the DataFrame of `core.geosource.read_areas`
+    for the `"PLZ"` level, with the postal codes and their parsed `geometry`
+    :param df_geodat_dis: The `df_geodat_dis` parameter is the DataFrame of `core.geosource.read_areas`
+    for the `"Bezirk"` level, with the columns `Bezirk` and `geometry`
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["geocode"]` names the
+    postal code column and `pdict["crs_metric"]` is the projected CRS areas are measured in
+    :return: A dictionary with one entry per level (`"PLZ"`, `"Bezirk"`), each holding the area keys,
+    a `pd.Index` over them (`lookup`), the prepared polygons, their area in km², the STRtree and the
+    `adjacency` (see `neighbours`). The `"PLZ"` level additionally holds a `table` indexed by PLZ
+    with the columns `Bezirk` (containing the representative point), `centroid_lon`, `centroid_lat`,
+    `area_km2` and `neighbours` (tuple of PLZ).
+    """
+    ret = {
+        "PLZ":      _area_level(df_geodat_plz[pdict["geocode"]], df_geodat_plz['geometry'], pdict),
+        "Bezirk":   _area_level(df_geodat_dis['Bezirk'], df_geodat_dis['geometry'], pdict),
+    }
+    for level in ret.values():
+        level["adjacency"] = neighbours(level)
+    plz                 = ret["PLZ"]
+    indptr, indices     = plz["adjacency"]
+
+    # Areas crossing a district border are given to the district containing their representative point
+    pos                 = locate_points(shapely.point_on_surface(plz["geoms"]), ret["Bezirk"])
+    centroids           = shapely.centroid(plz["geoms"])
+    plz["table"]        = pd.DataFrame({
+        'Bezirk':           pd.Series(np.where(pos >= 0, ret["Bezirk"]["keys"][pos], None), dtype='str').values,
+        'centroid_lon':     shapely.get_x(centroids),
+        'centroid_lat':     shapely.get_y(centroids),
+        'area_km2':         plz["area_km2"],
+        'neighbours':       [tuple(plz["keys"][indices[a:b]].tolist()) for a, b in zip(indptr[:-1], indptr[1:])],
+    }, index=pd.Index(plz["keys"], name='PLZ'))
+    return ret
+
+
+def locate_points(points, level):
+    """
+    The function `locate_points` finds the area containing each point with one bulk query against the
+    STRtree of a level. Points on a shared border are given to the first matching area.
+
+    :param points: The `points` parameter is an array or GeoSeries of shapely points; missing or empty
+    points are allowed
+    :param level: The `level` parameter is one entry of the index built by `build_area_index`
+    :return: An integer array with the position of the containing area in `level["keys"]`, or -1 where
+    no area contains the point.
+    """
+    points          = np.asarray(points, dtype=object)
+    pos             = np.full(len(points), -1, dtype=np.int64)
+
+    # Bounding box candidates from the tree, then the exact test against the prepared polygons.
+    # Passing the predicate to `query` would prepare the points instead of the polygons.
+    pt_idx, area_idx = level["tree"].query(points)
+    hit             = shapely.intersects(level["geoms"][area_idx], points[pt_idx])
+    pt_idx, area_idx = pt_idx[hit], area_idx[hit]
+
+    # keep the first hit per point (query results are sorted by point)
+    first, at       = np.unique(pt_idx, return_index=True)
+    pos[first]      = area_idx[at]
+    return pos
+
+
+@mt.instrument("assign_areas")
+def assign_areas(dframe, area_index, point_col='point', plz_col='PLZ'):
+    """
+    The function `assign_areas` assigns every row to the postal code area and the district its point
+    lies in, and flags rows whose declared postal code disagrees with that location.
+
+    :param dframe: The `dframe` parameter is a DataFrame with a point geometry column, e.g. the output of
+    `normalise_coordinates`
+    :param area_index: The `area_index` parameter is the index built by `build_area_index`
+    :param point_col: The `point_col` parameter is the name of the point column
+    :param plz_col: The `plz_col` parameter is the name of the declared postal code column
+    :return: The dataframe with the added columns `PLZ_geo` (nullable int), `Bezirk` and the boolean
+    `PLZ_mismatch`. Rows outside all areas get missing values and are not flagged.
+    """
+    points          = dframe[point_col].values
+
+    for level, col, dtype in (("PLZ", "PLZ_geo", sc.PLZ_DTYPE), ("Bezirk", "Bezirk", "str")):
+        pos         = locate_points(points, area_index[level])
+        keys        = pd.Series(area_index[level]["keys"]).astype(dtype)
+        found       = pos >= 0
+        values      = pd.Series(pd.NA, index=dframe.index, dtype=keys.dtype)
+        values[found] = keys.values[pos[found]]
+        dframe[col] = values
+
+    dframe['PLZ_mismatch'] = (dframe['PLZ_geo'].notna() & (dframe['PLZ_geo'] != dframe[plz_col])) \
+        .fillna(False).astype(bool)
+    return dframe
@@ -0,0 +1,270 @@
+import os
+import gzip
+import json
+import math
+import sqlite3
+import threading
+from http.server                     import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy                         as np
+import pandas                        as pd
+import geopandas                     as gpd
+import shapely
+from shapely                         import STRtree
+
+from core import layers              as ly
+from core import metrics             as mt
+
+
+# Half the width of the Web Mercator world in metres
+MERCATOR_HALF   = 20037508.342789244
+
+# Tile resolution and the buffer around every tile, in tile units; the buffer hides the tile borders
+# when polygons are stroked
+EXTENT          = 4096
+BUFFER          = 64
+
+
+def tile_bounds(z, x, y):
+    """
+    The function `tile_bounds` returns the Web Mercator bounds of a tile in the XYZ scheme used by
+    Leaflet.
+
+    :param z: The `z` parameter is the zoom level
+    :param x: The `x` parameter is the tile column
+    :param y: The `y` parameter is the tile row, counted from the north
+    :return: A tuple `(minx, miny, maxx, maxy)` in metres (EPSG:3857).
+    """
+    size = 2 * MERCATOR_HALF / 2 ** z
+    minx = -MERCATOR_HALF + x * size
+    maxy = MERCATOR_HALF - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tile_range(bounds, z):
+    """Columns and rows `(x0, y0, x1, y1)` (inclusive) of the tiles covering Web Mercator bounds at zoom z."""
+    size    = 2 * MERCATOR_HALF / 2 ** z
+    last    = 2 ** z - 1
+    clip    = lambda v: min(max(int(math.floor(v)), 0), last)
+    minx, miny, maxx, maxy = bounds
+    return (clip((minx + MERCATOR_HALF) / size), clip((MERCATOR_HALF - maxy) / size),
+            clip((maxx + MERCATOR_HALF) / size), clip((MERCATOR_HALF - miny) / size))
+
+
+def tile_properties(gdf, key_col, fill_cols):
+    """
+    The function `tile_properties` prepares the attributes every feature of a tile layer carries: the
+    area key, the measures of `core.aggregate` and a precomputed fill colour per map layer.
+
+    :param gdf: The `gdf` parameter is the GeoDataFrame of `aggregate_plz` or `rollup_bezirk`
+    :param key_col: The `key_col` parameter is the column identifying the areas, `PLZ` or `Bezirk`
+    :param fill_cols: The `fill_cols` parameter lists the columns that get a fill colour `fill_<column>`
+    :return: A tuple `(properties, legend)`: one dictionary per row (missing values left out) and the
+    value range `[vmin, vmax]` of each column in `fill_cols`.
+    """
+    props   = pd.DataFrame(gdf.drop(columns=gdf.geometry.name))
+    legend  = {}
+    for col in fill_cols:
+        color_map               = ly.color_scale(gdf, col)
+        props['fill_' + col]    = ly.color_column(gdf[col], color_map)
+        legend[col]             = [float(color_map.vmin), float(color_map.vmax)]
+    records = [{k: v for k, v in r.items() if v is not None and v == v} for r in props.to_dict('records')]
+    records = [{k: (v.item() if isinstance(v, np.generic) else v) for k, v in r.items()} for r in records]
+    return records, legend
+
+
+@mt.instrument("build_tiles")
+def build_tiles(levels, minzoom, maxzoom):
+    """
+    The function `build_tiles` cuts the area layers into Mapbox vector tiles. For every zoom level the
+    polygons are simplified to half a screen pixel (shared borders once, see
+    `core.layers.simplify_coverage`) and clipped to each tile with a small buffer.
+
+    :param levels: The `levels` parameter maps the tile layer names to tuples `(gdf, properties)`, with
+    `gdf` in EPSG:4326 and `properties` as returned by `tile_properties`
+    :param minzoom: The `minzoom` parameter is the lowest zoom level to build
+    :param maxzoom: The `maxzoom` parameter is the highest zoom level to build
+    :return: A generator of `(z, x, y, data)` with the encoded (uncompressed) tile; tiles without any
+    feature are skipped.
+    """
+    import mapbox_vector_tile
+
+    projected = {name: (gpd.GeoSeries(gdf.geometry.values, crs=gdf.crs or "EPSG:4326").to_crs(3857), props)
+                 for name, (gdf, props) in levels.items()}
+    bounds    = np.array([g.total_bounds for g, _ in projected.values()])
+    bounds    = (*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0))
+
+    for z in range(minzoom, maxzoom + 1):
+        pixel   = 2 * MERCATOR_HALF / (256 * 2 ** z)
+        zoomed  = {}
+        for name, (geoms, props) in projected.items():
+            simplified      = np.asarray(ly.simplify_coverage(geoms, pixel / 2).values)
+            zoomed[name]    = (simplified, STRtree(simplified), props)
+
+        x0, y0, x1, y1 = tile_range(bounds, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                minx, miny, maxx, maxy = box = tile_bounds(z, x, y)
+                pad     = (maxx - minx) * BUFFER / EXTENT
+                layers  = []
+                for name, (geoms, tree, props) in zoomed.items():
+                    cand    = tree.query(shapely.box(minx - pad, miny - pad, maxx + pad, maxy + pad))
+                    clipped = shapely.clip_by_rect(geoms[cand], minx - pad, miny - pad, maxx + pad, maxy + pad)
+                    feats   = [{"geometry": g, "properties": props[i]}
+                               for i, g in zip(cand, clipped) if not g.is_empty]
+                    if feats:
+                        layers.append({"name": name, "features": feats})
+                if layers:
+                    yield z, x, y, mapbox_vector_tile.encode(
+                        layers, default_options={"quantize_bounds": box, "extents": EXTENT})
+
+
+def write_mbtiles(path, tiles, metadata):
+    """
+    The function `write_mbtiles` stores vector tiles in an MBTiles (SQLite) file. Tiles are gzip
+    compressed and stored in the TMS row order of the MBTiles specification. The file is replaced
+    atomically.
+
+    :param path: The `path` parameter is the output file
+    :param tiles: The `tiles` parameter is an iterable of `(z, x, y, data)`, e.g. from `build_tiles`
+    :param metadata: The `metadata` parameter is a dictionary of metadata entries; dictionaries and lists
+    are stored as JSON
+    :return: The number of tiles written.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.exists(path + ".tmp"):
+        os.remove(path + ".tmp")
+
+    n = 0
+    with sqlite3.connect(path + ".tmp") as con:
+        con.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+        con.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, "
+                    "tile_data BLOB)")
+        for z, x, y, data in tiles:
+            con.execute("INSERT INTO tiles VALUES (?, ?, ?, ?)", (z, x, 2 ** z - 1 - y, gzip.compress(data)))
+            n += 1
+        con.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+        con.executemany("INSERT INTO metadata VALUES (?, ?)",
+                        [(k, json.dumps(v) if isinstance(v, (dict, list)) else str(v)) for k, v in metadata.items()])
+    con.close()
+    os.replace(path + ".tmp", path)
+    return n
+
+
+def read_metadata(path):
+    """Metadata of an MBTiles file; the `json` entry is decoded."""
+    con = sqlite3.connect("file:{}?mode=ro".format(path), uri=True)
+    try:
+        ret = dict(con.execute("SELECT name, value FROM metadata").fetchall())
+    finally:
+        con.close()
+    if "json" in ret:
+        ret["json"] = json.loads(ret["json"])
+    return ret
+
+
+def export_mbtiles(layers, path, minzoom=8, maxzoom=14, name="heatmap"):
+    """
+    The function `export_mbtiles` builds the vector tiles of the PLZ and Bezirk aggregates, including
+    their supply gaps, and writes them to an MBTiles file together with the legend ranges of the map
+    layers.
+
+    :param layers: The `layers` parameter is the dictionary of `core.dataloader.build_layers`
+    :param path: The `path` parameter is the output file
+    :param minzoom: The `minzoom` parameter is the lowest zoom level
+    :param maxzoom: The `maxzoom` parameter is the highest zoom level
+    :param name: The `name` parameter is the name of the tile set
+    :return: The number of tiles written.
+    """
+    levels, legend, fields = {}, {}, []
+    for level, gdf in (("PLZ", layers["gap_plz"]), ("Bezirk", layers["gap_bezirk"])):
+        fill_cols           = [c for c in ly.LAYER_COLUMNS.values() if c in gdf.columns]
+        props, legend[level] = tile_properties(gdf, level, fill_cols)
+        levels[level]       = (gdf, props)
+        fields.append({"id": level, "minzoom": minzoom, "maxzoom": maxzoom,
+                       "fields": {c: "String" if gdf[c].dtype == 'str' else "Number"
+                                  for c in gdf.columns if c != gdf.geometry.name}})
+
+    w, s, e, n  = pd.concat([layers["gap_plz"].geometry, layers["gap_bezirk"].geometry]).total_bounds
+    metadata    = {
+        "name":         name,
+        "format":       "pbf",
+        "type":         "overlay",
+        "minzoom":      minzoom,
+        "maxzoom":      maxzoom,
+        "bounds":       "{},{},{},{}".format(w, s, e, n),
+        "center":       "{},{},{}".format((w + e) / 2, (s + n) / 2, minzoom),
+        "json":         {"vector_layers": fields, "legend": legend},
+    }
+    return write_mbtiles(path, build_tiles(levels, minzoom, maxzoom), metadata)
+
+
+# -----------------------------------------------------------------------------
+class TileHandler(BaseHTTPRequestHandler):
+    """Serves `/tiles/{z}/{x}/{y}.pbf` and `/tiles.json` from the MBTiles file of the server."""
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts == ["tiles.json"]:
+            meta = read_metadata(self.server.mbtiles)
+            return self.send(200, json.dumps(meta).encode(), "application/json")
+        try:
+            prefix, z, x, y = parts
+            z, x, y = int(z), int(x), int(y.split(".")[0])
+            assert prefix == "tiles"
+        except (ValueError, AssertionError):
+            return self.send(404, b"", "text/plain")
+
+        row = self.server.connection().execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, 2 ** z - 1 - y)).fetchone()
+        if row is None:
+            return self.send(204, b"", "application/x-protobuf")
+        self.send(200, row[0], "application/x-protobuf", {"Content-Encoding": "gzip"})
+
+    def send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Cache-Control", "public, max-age=3600")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TileServer(ThreadingHTTPServer):
+    """Threaded HTTP server with one read-only SQLite connection per thread."""
+    daemon_threads = True
+
+    def __init__(self, mbtiles, address):
+        super().__init__(address, TileHandler)
+        self.mbtiles    = mbtiles
+        self._local     = threading.local()
+
+    def connection(self):
+        if not hasattr(self._local, "con"):
+            self._local.con = sqlite3.connect("file:{}?mode=ro".format(self.mbtiles), uri=True)
+        return self._local.con
+
+
+def serve(mbtiles, host="127.0.0.1", port=8765):
+    """
+    The function `serve` starts a local tile endpoint for an MBTiles file and blocks until interrupted.
+
+    :param mbtiles: The `mbtiles` parameter is the path of the MBTiles file
+    :param host: The `host` parameter is the interface to listen on
+    :param port: The `port` parameter is the port to listen on
+    """
+    server = TileServer(mbtiles, (host, port))
+    print(" ====> Serving {} at http://{}:{}/tiles/{{z}}/{{x}}/{{y}}.pbf".format(mbtiles, host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
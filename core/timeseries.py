@@ -0,0 +1,130 @@
+import numpy                         as np
+import pandas                        as pd
+
+from core import metrics             as mt
+from core import schema              as sc
+from core import aggregate           as ag
+
+
+def period_index(dates, pdict):
+    """
+    The function `period_index` lists the periods from the first to the last commissioning date.
+
+    :param dates: The `dates` parameter is a Series of commissioning dates; missing dates are ignored
+    :param pdict: The `pdict` parameter is the configuration dictionary; `pdict["series_freq"]` is the
+    pandas frequency of the periods, e.g. `"MS"` for months
+    :return: A `pd.DatetimeIndex` named `Period` with the start of every period, empty without dates.
+    """
+    dates   = dates.dropna()
+    if dates.empty:
+        return pd.DatetimeIndex([], name='Period', dtype=sc.DATE_DTYPE)
+    freq    = pd.tseries.frequencies.to_offset(pdict["series_freq"])
+    return pd.date_range(freq.rollback(dates.min().normalize()), dates.max(), freq=freq,
+                         name='Period').astype(sc.DATE_DTYPE)
+
+
+def _dense(periods, keys, key_col, matrices):
+    """Long DataFrame of `(n_periods, n_keys)` matrices, sorted by period and key with one row per pair."""
+    keys = pd.Index(keys)
+    ret  = pd.DataFrame({'Period': np.repeat(periods.values, len(keys)),
+                         key_col: keys.take(np.tile(np.arange(len(keys)), len(periods))).values})
+    for col, values in matrices.items():
+        ret[col] = values.ravel().astype(sc.TOTALS[col])
+    return ret
+
+
+@mt.instrument("station_series")
+def station_series(gdf_lstat, plz, pdict):
+    """
+    The function `station_series` bins the stations by commissioning date and accumulates the station
+    measures per postal code over the periods, so that the state of any period is a slice of the result
+    instead of a groupby over the stations.
+
+    :param gdf_lstat: The `gdf_lstat` parameter is the station GeoDataFrame of `preprop_lstat` with the
+    columns `PLZ`, `KW` and `Inbetriebnahmedatum`; stations without a commissioning date are left out
+    :param plz: The `plz` parameter lists the postal codes of the region, e.g. `agg_plz['PLZ']`; every
+    code gets a row per period, also without stations
+    :param pdict: The `pdict` parameter is the configuration dictionary; it provides `series_freq` and
+    `series_start`. Stations dated before `series_start` are counted from its period on, so that a
+    mistyped year does not add decades of empty periods; their number is recorded as the
+    `series_dates_clamped` counter of `core.metrics`.
+    :return: A dense DataFrame with the columns `Period`, `PLZ` and the cumulative `STATION_COLS` of
+    `core.aggregate`, sorted by period and then in the order of `plz`: the measures of the stations
+    commissioned until the end of each period.
+    """
+    start       = pd.Timestamp(pdict["series_start"])
+    dates       = gdf_lstat['Inbetriebnahmedatum']
+    early       = (dates < start).to_numpy()
+    mt.count("series_dates_clamped", int(early.sum()))
+    dates       = dates.mask(early, start)
+    periods     = period_index(dates, pdict)
+    plz         = pd.Index(plz)
+
+    # period and postal code position of every dated station inside the region
+    p_pos       = periods.searchsorted(dates.values, side='right') - 1
+    a_pos       = plz.get_indexer(gdf_lstat['PLZ'])
+    valid       = dates.notna().values & (a_pos >= 0)
+    cell        = p_pos[valid] * len(plz) + a_pos[valid]
+    kw          = gdf_lstat['KW'].values[valid].astype('float64')
+
+    size        = len(periods) * len(plz)
+    per_period  = {
+        'Number':   np.bincount(cell, minlength=size),
+        'KW_total': np.bincount(cell, weights=np.nan_to_num(kw), minlength=size),
+        'KW_n':     np.bincount(cell, weights=~np.isnan(kw), minlength=size),
+    }
+    cumulative  = {c: v.reshape(len(periods), len(plz)).cumsum(axis=0) for c, v in per_period.items()}
+    return _dense(periods, plz, 'PLZ', cumulative)
+
+
+@mt.instrument("rollup_series")
+def rollup_series(series_plz, agg_plz, agg_bezirk):
+    """
+    The function `rollup_series` rolls the postal code series of `station_series` up to districts, with
+    the district of every postal code taken from `agg_plz` as in `core.aggregate.rollup_bezirk`.
+
+    :param series_plz: The `series_plz` parameter is the DataFrame of `station_series` for `agg_plz['PLZ']`
+    :param agg_plz: The `agg_plz` parameter is the GeoDataFrame of `aggregate_plz`
+    :param agg_bezirk: The `agg_bezirk` parameter is the GeoDataFrame of `rollup_bezirk`
+    :return: A dense DataFrame with the columns `Period`, `Bezirk` and `STATION_COLS`, sorted by period and
+    then in the order of `agg_bezirk`.
+    """
+    periods     = pd.DatetimeIndex(series_plz['Period'].iloc[::len(agg_plz)], name='Period')
+    bezirk      = pd.Index(agg_bezirk['Bezirk'])
+    b_pos       = bezirk.get_indexer(agg_plz['Bezirk'])
+    inside      = b_pos >= 0
+
+    # summing over the postal codes of a district is a product with the postal code x district matrix
+    member      = np.zeros((len(agg_plz), len(bezirk)), dtype=np.int64)
+    member[np.flatnonzero(inside), b_pos[inside]] = 1
+    matrices    = {}
+    for col in ag.STATION_COLS:
+        values          = series_plz[col].to_numpy().reshape(len(periods), len(agg_plz))
+        matrices[col]   = values @ member.astype(values.dtype)
+    return _dense(periods, bezirk, 'Bezirk', matrices)
+
+
+def series_periods(series, n_keys):
+    """The periods of a series of `station_series` or `rollup_series` with `n_keys` areas, in order."""
+    return pd.DatetimeIndex(series['Period'].iloc[::n_keys]) if n_keys else pd.DatetimeIndex([])
+
+
+def at_period(agg, series, period):
+    """
+    The function `at_period` sets the station measures of an aggregate to their state at the end of a
+    period. The measures are one row block of the dense series; residents, areas and geometry are kept
+    and the ratios derived again.
+
+    :param agg: The `agg` parameter is the GeoDataFrame of `aggregate_plz` or `rollup_bezirk`
+    :param series: The `series` parameter is the series of `station_series` or `rollup_series` for the
+    areas of `agg`, in the same order
+    :param period: The `period` parameter is a period of the series (its start)
+    :return: A copy of `agg` with the measures of the period.
+    """
+    n_keys      = len(agg)
+    pos         = series_periods(series, n_keys).get_loc(pd.Timestamp(period))
+    block       = slice(pos * n_keys, (pos + 1) * n_keys)
+    ret         = agg.copy()
+    for col in ag.STATION_COLS:
+        ret[col] = series[col].to_numpy()[block].astype(ret[col].dtype)
+    return ag.add_ratios(ret)
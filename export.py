@@ -0,0 +1,162 @@
+"""Headless batch export of the heatmaps, without Streamlit
+
+Runs the same pipeline as `main.py` and writes every requested layer as standalone HTML, GeoJSON
+and PNG. Several register snapshots, regions and layers are processed in parallel with a process pool.
+
+    python export.py --out reports
+    python export.py --out reports --regions Berlin Deutschland     # regions whose geometry files exist
+    python export.py --out reports --snapshot data/Ladesaeulenregister_2024-01.csv data/Ladesaeulenregister_2024-07.csv \\
+                     --levels PLZ Bezirk --formats html png --workers 4
+
+Output files are named `<snapshot>_<level>_<layer>.<ext>`, prefixed with `<region>_` if several regions
+are exported. Snapshots whose files share a name get the hash of their path appended.
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from config                          import pdict
+from core import regions             as rg
+
+
+LAYERS  = ("Residents", "Charging_Stations", "Charging_Power", "Supply_Gap", "Coverage")
+LEVELS  = ("PLZ", "Bezirk")
+FORMATS = ("html", "geojson", "png")
+
+# Layers of the snapshots a worker process has exported, keyed by their artifact folder
+_snapshot_layers = {}
+
+
+def snapshot_pdict(snapshot, base=pdict):
+    """
+    The function `snapshot_pdict` returns a copy of `pdict` for one register snapshot. Every snapshot
+    gets its own artifact folder, so snapshots can be prepared concurrently.
+
+    :param snapshot: The `snapshot` parameter is the path of a charging register CSV
+    :param base: The `base` parameter is the configuration to start from, e.g. that of a region
+    :return: A tuple `(name, pdict)`; the name is the file name without extension. The artifact folder
+    also carries the hash of the absolute path, so snapshots with the same file name in different folders
+    do not share it.
+    """
+    name    = os.path.splitext(os.path.basename(snapshot))[0]
+    cfg     = dict(base)
+    cfg["file_lstations"]   = snapshot
+    if snapshot != pdict["file_lstations"]:
+        cfg["picklefolder"] = os.path.join(pdict["picklefolder"], "snapshots",
+                                           "{}_{}".format(name, path_hash(snapshot)))
+    return name, cfg
+
+
+def path_hash(path):
+    """First 8 hex digits of the SHA-1 of the absolute path of a file."""
+    return hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+
+
+def prepare_snapshot(cfg):
+    """Build (or reuse) the stored artifacts of one snapshot; runs in a worker process."""
+    snapshot_layers(cfg)
+
+
+def snapshot_layers(cfg):
+    """The layers of one snapshot, loaded from its artifacts once per worker process."""
+    from core import dataloader          as dl
+
+    if cfg["picklefolder"] not in _snapshot_layers:
+        _snapshot_layers[cfg["picklefolder"]] = dl.build_layers(cfg)
+    return _snapshot_layers[cfg["picklefolder"]]
+
+
+def export_layer(cfg, name, level, layer, formats, out, zoom):
+    """
+    The function `export_layer` writes one layer of one snapshot in the requested formats; runs in a
+    worker process. Folium and matplotlib are only imported if their format is requested.
+
+    :return: The list of written files.
+    """
+    from core import layers              as ly
+
+    layers  = snapshot_layers(cfg)
+    gdf, value_col, key_col = ly.layer_frame(layers["lstat"], layers["resid"], layers["agg_bezirk"],
+                                             layer, level, (layers["gap_plz"], layers["gap_bezirk"]))
+    base    = os.path.join(out, "{}_{}_{}".format(name, level, layer))
+    written = []
+
+    location, fit_zoom = ly.map_view(cfg["bbox"])
+    zoom    = zoom or fit_zoom
+    if "html" in formats:
+        from core import render              as rd
+        rd.build_map(gdf, value_col, key_col, zoom_start=zoom, location=location).save(base + ".html")
+        written.append(base + ".html")
+
+    if "geojson" in formats:
+        with open(base + ".geojson", "w", encoding="utf-8") as f_out:
+            f_out.write(ly.layer_geojson(gdf, value_col, ly.color_scale(gdf, value_col), zoom=zoom,
+                                         key_col=key_col))
+        written.append(base + ".geojson")
+
+    if "png" in formats:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        from matplotlib.colors import LinearSegmentedColormap
+
+        scale   = ly.color_scale(gdf, value_col)
+        fig, ax = plt.subplots(figsize=(10, 8))
+        gdf.plot(column=value_col, ax=ax, legend=True, edgecolor='black', linewidth=0.3,
+                 vmin=scale.vmin, vmax=scale.vmax,
+                 cmap=LinearSegmentedColormap.from_list(value_col, [c[:3] for c in scale.colors]))
+        ax.set_title("{} per {}".format(layer.replace("_", " "), level))
+        ax.set_axis_off()
+        fig.savefig(base + ".png", dpi=150, bbox_inches="tight")
+        plt.close(fig)
+        written.append(base + ".png")
+
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", default="export", help="output folder (default: export)")
+    parser.add_argument("--snapshot", nargs="+", default=[pdict["file_lstations"]],
+                        help="charging register CSV files (default: pdict['file_lstations'])")
+    parser.add_argument("--regions", nargs="+", choices=rg.available_regions(pdict), default=[pdict["region"]],
+                        help="regions of pdict['regions'] with geometry files (default: pdict['region'])")
+    parser.add_argument("--layers", nargs="+", choices=LAYERS, default=list(LAYERS))
+    parser.add_argument("--levels", nargs="+", choices=LEVELS, default=["PLZ"])
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--zoom", type=int, default=None,
+                        help="zoom level the polygons are simplified for (default: fit the region)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    t_start = time.perf_counter()
+    os.makedirs(args.out, exist_ok=True)
+    snapshots = []
+    names     = [os.path.splitext(os.path.basename(s))[0] for s in args.snapshot]
+    for region in args.regions:
+        for snapshot in args.snapshot:
+            name, cfg = snapshot_pdict(snapshot, rg.region_pdict(pdict, region))
+            if names.count(name) > 1:
+                name += "_" + path_hash(snapshot)
+            snapshots.append((region + "_" + name if len(args.regions) > 1 else name, cfg))
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # 1. prepare every (region, snapshot) once, 2. render all (snapshot, level, layer) combinations
+        for f in [pool.submit(prepare_snapshot, cfg) for _, cfg in snapshots]:
+            f.result()
+
+        jobs = [pool.submit(export_layer, cfg, name, level, layer, args.formats, args.out, args.zoom)
+                for name, cfg in snapshots for level in args.levels for layer in args.layers]
+        for f in jobs:
+            for path in f.result():
+                print(path)
+
+    print(" ====> Exported {} layer(s) in {:.2f} secs".format(len(jobs), time.perf_counter() - t_start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
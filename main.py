@@ -9,8 +9,11 @@ os.chdir(currentWorkingDirectory)
 print("Current working directory\n" + os.getcwd())
 
 import pandas                        as pd
-from core import methods             as m1
+from core import render              as rd
+from core import dataloader          as dl
 from core import HelperTools         as ht
+from core import metrics             as mt
+from core import timeseries          as ts
 
 from config                          import pdict
 
@@ -23,37 +26,51 @@ def main():
     
     1. Load geospatial data for postal codes and districts in Berlin from CSV files.
     2. Load electric charging station data, preprocess it, and merge it with geospatial data.
-    3. Count the number of charging stations in each postal code and district.
+    3. Count the number of charging stations in each postal code and district (district totals are
+       rolled up from the postal code totals).
     4. Load resident data and preprocess it similarly, merging with geospatial data.
     5. Generate a Streamlit-based visualization that maps electric charging stations alongside 
        resident distribution.
     """
 
-    # Load geospatial data for postal codes and districts
-
-    df_geodat_plz = pd.read_csv(pdict["file_geodat_plz"], sep=';')
-    df_geodat_dis = pd.read_csv(pdict["file_geodat_dis"], sep=';')
-
-
-    # Load and preprocess electric charging station data
-
-    df_lstat = pd.read_csv(pdict["file_lstations"], sep=';', skiprows=10)
-    df_lstat.columns = df_lstat.columns.str.strip()
-    # print(df_lstat.columns)
-    # print(df_lstat.head())
-
-    gdf_lstat2 = m1.preprop_lstat(df_lstat, df_geodat_plz, pdict)
-    gdf_lstat3 = m1.count_plz_occurrences(gdf_lstat2)
-
-
-    # Load and preprocess resident data
-
-    df_residents = pd.read_csv(pdict["file_residents"], sep=',')
-    # print(df_residents.columns)
-    gdf_residents2 = m1.preprop_resid(df_residents, df_geodat_plz, pdict)
+    # In serving mode every session and worker process reads one memory-mapped store (`core.serving`):
+    # maps of the current register are prerendered, and the frames of the page carry no geometry.
+    # Layers with geometry are only decoded for the charger filter and the period slider.
+    if pdict["serve_folder"]:
+        from core import serving as sv
+        store   = sv.load_store(pdict)
+        layers  = store["layers"]
+        frames  = store["frames"]
+        maps    = lambda layer, level: sv.map_html(store, layer, level)
+
+    else:
+        # Load (or reuse) the prepared station and resident data. The layers are cached across
+        # Streamlit reruns and rebuilt only when an input file or a setting in `pdict` changes.
+        layers = frames = dl.load_layers(pdict)
+        maps   = None
+
+    # Vector tiles are built and served by `tiles.py`; the map only needs their endpoint and legend
+    tiles = None
+    if pdict["map_mode"] == "tiles":
+        from core import tiles as tl
+        tiles = (pdict["tiles_url"], tl.read_metadata(pdict["tiles_file"]))
+
+    # Charger classes and the layers restricted to a selection of them
+    power = (list(frames["cube_plz"]['Bucket'].cat.categories),
+             lambda buckets: dl.filter_layers(layers, buckets, pdict))
+
+    # Periods of the time series by commissioning date and the layers as of one of them
+    series = (ts.series_periods(frames["series_plz"], len(frames["agg_plz"])),
+              lambda period: dl.period_layers(layers, period, pdict))
 
     # Generate the Streamlit visualization
-    m1.make_streamlit_electric_Charging_resid(gdf_lstat3, gdf_residents2)
+    rd.make_streamlit_electric_Charging_resid(frames["lstat"], frames["resid"], frames["agg_bezirk"], tiles,
+                                              pdict["bbox"], (frames["gap_plz"], frames["gap_bezirk"]), power,
+                                              series, maps)
+
+    # Export the stage metrics (enabled with HEATMAP_METRICS=1) as JSON, or Prometheus text for *.prom
+    if mt.is_enabled() and os.environ.get("HEATMAP_METRICS_FILE"):
+        mt.export(os.environ["HEATMAP_METRICS_FILE"])
 
     
 # -----------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,41 @@
+"""Shared, memory-mapped layer store for serving the app to many sessions
+
+Builds the prepared layers and the prerendered maps of the current inputs into Arrow IPC files under
+`pdict["serve_folder"]`. With `serve_folder` set, every Streamlit session and server process maps the
+same files instead of loading its own copy of the layers.
+
+    python serving.py build
+    python serving.py build --folder /srv/heatmap/store
+
+The app builds a missing store on its first run as well; building it beforehand keeps that off the
+first session. A store is never changed after it is written: new inputs or settings get a new folder.
+"""
+import sys
+import time
+import argparse
+
+from config                          import pdict
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub    = parser.add_subparsers(dest="command", required=True)
+    build  = sub.add_parser("build", help="build the store of the current inputs and settings")
+    build.add_argument("--folder", default=pdict["serve_folder"],
+                       help="root folder of the stores (default: pdict['serve_folder'])")
+    args   = parser.parse_args(argv)
+    if not args.folder:
+        parser.error("no store folder, set pdict['serve_folder'] or pass --folder")
+
+    from core import serving             as sv
+
+    t_start = time.perf_counter()
+    cfg     = dict(pdict, serve_folder=args.folder)
+    store   = sv.load_store(cfg)
+    print(" ====> Store {} with {} layers and {} maps ready in {:.2f} secs".format(
+        sv.store_path(cfg), len(store["tables"]), store["maps"].num_rows, time.perf_counter() - t_start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
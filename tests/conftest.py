@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+import config
+
+
+ROOT        = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Lines of the charging register before the first station: meta lines and the column header
+REGISTER_HEAD = 11
+
+
+@pytest.fixture(autouse=True)
+def in_root(monkeypatch):
+    # the paths in `config.pdict` are relative to the repository root
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture
+def pdict(tmp_path):
+    """`config.pdict` with its own artifact folder."""
+    return dict(config.pdict, picklefolder=str(tmp_path / "pickles"), serve_folder=None)
+
+
+@pytest.fixture
+def register(tmp_path):
+    """
+    Writes a copy of the charging register of `config.pdict` with some stations edited. The function
+    takes a callable mapping the list of station rows (split into fields) to the new list and returns
+    the path of the written file.
+    """
+    with open(os.path.join(ROOT, config.pdict["file_lstations"]), encoding="utf-8") as f_in:
+        lines = f_in.read().splitlines()
+
+    def write(edit, name="register.csv"):
+        rows = edit([line.split(';') for line in lines[REGISTER_HEAD:]])
+        path = tmp_path / name
+        path.write_text("\n".join(lines[:REGISTER_HEAD] + [';'.join(r) for r in rows]) + "\n", encoding="utf-8")
+        return str(path)
+
+    return write
@@ -0,0 +1,58 @@
+import pytest
+
+from core import artifacts           as ar
+from core import dataloader          as dl
+from core import delta               as dt
+
+
+# Fields of a register row
+HAUSNUMMER, BUNDESLAND, KW = 2, 5, 9
+
+
+def berlin_rows(rows, n, skip=0):
+    """Positions of `n` rows of Berlin stations, after the first `skip` ones."""
+    return [i for i, r in enumerate(rows) if r[BUNDESLAND].strip() == "Berlin"][skip:skip + n]
+
+
+def add_stations(rows):
+    added = [list(rows[i]) for i in berlin_rows(rows, 5)]
+    for r in added:
+        r[HAUSNUMMER] = "999"
+    return rows + added
+
+
+def change_stations(rows):
+    for i in berlin_rows(rows, 5):
+        rows[i][KW] = "350,0"
+    return rows
+
+
+def remove_stations(rows, skip=0):
+    removed = set(berlin_rows(rows, 5, skip))
+    return [r for i, r in enumerate(rows) if i not in removed]
+
+
+def all_edits(rows):
+    return remove_stations(change_stations(add_stations(rows)), skip=5)
+
+
+@pytest.mark.parametrize("edit", [add_stations, change_stations, remove_stations, all_edits])
+def test_delta_matches_full_rebuild(pdict, register, tmp_path, monkeypatch, edit):
+    applied = []
+    update  = dt.update_stations
+    monkeypatch.setattr(dt, "update_stations", lambda *args: applied.append(update(*args)) or applied[-1])
+
+    base    = dl.build_layers(pdict)
+    new     = dict(pdict, file_lstations=register(edit))
+    delta   = dl.build_layers(new)
+    full_pd = dict(new, picklefolder=str(tmp_path / "full"), lstat_update="full")
+    full    = dl.build_layers(full_pd)
+
+    assert applied and applied[-1] is not None
+    assert not full["agg_plz"].equals(base["agg_plz"])
+    assert set(delta) == set(full)
+    for name in full:
+        assert delta[name].equals(full[name]), name
+    # the stored station tables, row order included
+    for stage in dt.STATION_STAGES:
+        assert ar.load_artifact(new, stage)[0].equals(ar.load_artifact(full_pd, stage)[0]), stage
@@ -0,0 +1,56 @@
+import pandas                        as pd
+import pytest
+
+from core import ingest              as ig
+
+
+# Fields of a register row
+BUNDESLAND, POSTLEITZAHL = 5, 3
+
+
+@pytest.fixture
+def declared(pdict):
+    """`pdict` selecting stations by their declared Bundesland and postal code only."""
+    return dict(pdict, plz_assignment="declared")
+
+
+@pytest.mark.parametrize("chunksize", [1, 997, 10 ** 6])
+def test_chunks_match_single_read(declared, chunksize):
+    whole   = ig.read_lstations(declared, chunksize=10 ** 7, verbose=False)
+    ret     = ig.read_lstations(declared, chunksize=chunksize, verbose=False)
+
+    assert ret.equals(whole)
+    stats   = ret.attrs["ingest_stats"]
+    assert sum(s["rows_kept"] for s in stats) == len(ret)
+    assert all(s["rows_read"] <= chunksize for s in stats)
+
+
+def test_region_rows_only(declared, register):
+    rows    = []
+    def edit(lines):
+        rows.extend(lines)
+        return lines
+    ret     = ig.read_lstations(dict(declared, file_lstations=register(edit)), verbose=False)
+
+    plz_lo, plz_hi = declared["lstat_plz_range"]
+    expected = [r for r in rows if r[BUNDESLAND].strip() == declared["lstat_bundesland"]
+                and r[POSTLEITZAHL].strip() and plz_lo < int(r[POSTLEITZAHL]) < plz_hi]
+    assert len(ret) == len(expected)
+    assert ret['Bundesland'].eq(declared["lstat_bundesland"]).all()
+    assert ret['Postleitzahl'].between(plz_lo, plz_hi, inclusive="neither").all()
+
+
+def test_keys_unique_for_identical_rows(declared, register):
+    ret     = ig.read_lstations(dict(declared, file_lstations=register(lambda rows: rows + rows[:3])),
+                                verbose=False)
+    assert ret['Key'].is_unique
+    # the copies have the same content, but not the same key
+    assert ret['RowHash'].duplicated().sum() >= 3
+
+
+def test_empty_register(declared, register):
+    ret     = ig.read_lstations(dict(declared, file_lstations=register(lambda rows: [])), verbose=False)
+    assert len(ret) == 0
+    assert list(ret.columns) == list(ig.LSTAT_DTYPES) + ['Key', 'RowHash']
+    assert ret.dtypes.to_dict() == pd.DataFrame({c: pd.Series(dtype=t) for c, t in dict(
+        ig.LSTAT_DTYPES, Key='uint64', RowHash='uint64').items()}).dtypes.to_dict()
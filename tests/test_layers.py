@@ -0,0 +1,66 @@
+import json
+
+import numpy                         as np
+import pandas                        as pd
+import geopandas                     as gpd
+import shapely
+import pytest
+
+from core import layers              as ly
+
+
+@pytest.fixture
+def areas():
+    # four adjacent unit squares
+    return gpd.GeoDataFrame({'PLZ': [10115, 10117, 10119, 10178], 'Number': [0.0, 5.0, np.nan, 10.0]},
+                            geometry=[shapely.box(i, 0, i + 1, 1) for i in range(4)], crs="EPSG:4326")
+
+
+def test_color_column_interpolates_and_marks_missing():
+    scale   = ly.color_scale(pd.DataFrame({'Number': [0.0, 10.0]}), 'Number')
+    ret     = ly.color_column(pd.Series([0.0, 5.0, 10.0, np.nan, np.inf, None]), scale)
+    assert ret.tolist() == ["#ffff00", "#ff7f00", "#ff0000"] + [ly.NAN_COLOR] * 3
+
+
+@pytest.mark.parametrize("dtype", ['Int64', 'Float64'])
+def test_color_column_nullable(dtype):
+    scale   = ly.color_scale(pd.DataFrame({'Number': [0, 10]}), 'Number')
+    ret     = ly.color_column(pd.Series([0, pd.NA, 10], dtype=dtype), scale)
+    assert ret.tolist() == ["#ffff00", ly.NAN_COLOR, "#ff0000"]
+
+
+def test_color_scale_diverging_is_centred():
+    scale   = ly.color_scale(pd.DataFrame({'Stations_gap': [-2.0, 0.5, 4.0]}), 'Stations_gap')
+    assert (scale.vmin, scale.vmax) == (-4.0, 4.0)
+    assert ly.color_column([0.0], scale).tolist() == ["#ffffff"]
+
+
+def test_layer_geojson_features(areas):
+    ly.clear_cache()
+    scale   = ly.color_scale(areas, 'Number')
+    ret     = json.loads(ly.layer_geojson(areas, 'Number', scale))
+
+    props   = [f['properties'] for f in ret['features']]
+    assert [p['PLZ'] for p in props] == areas['PLZ'].tolist()
+    assert [p['Number'] for p in props] == [0.0, 5.0, None, 10.0]
+    assert [p['fillColor'] for p in props] == ly.color_column(areas['Number'], scale).tolist()
+    assert all(f['geometry']['type'] == "Polygon" for f in ret['features'])
+
+
+def test_layer_geojson_nullable(areas):
+    ly.clear_cache()
+    counts  = areas.assign(Number=pd.array([0, 5, pd.NA, 10], dtype='Int64'))
+    ret     = json.loads(ly.layer_geojson(counts, 'Number', ly.color_scale(counts, 'Number')))
+    assert [f['properties']['Number'] for f in ret['features']] == [0, 5, None, 10]
+
+
+def test_layer_geojson_follows_updates(areas):
+    ly.clear_cache()
+    scale   = ly.color_scale(areas, 'Number')
+    before  = ly.layer_geojson(areas, 'Number', scale)
+    assert ly.layer_geojson(areas, 'Number', scale) is before
+
+    changed = areas.assign(Number=[0.0, 5.0, 7.5, 10.0])
+    ret     = json.loads(ly.layer_geojson(changed, 'Number', scale))
+    assert ret['features'][2]['properties']['Number'] == 7.5
+    assert ret['features'][2]['properties']['fillColor'] != ly.NAN_COLOR
@@ -0,0 +1,58 @@
+"""Vector tiles (MVT) of the heatmap layers
+
+Builds the PLZ and Bezirk aggregates into an MBTiles file and serves it as a local tile endpoint. With
+`pdict["map_mode"] = "tiles"` the Streamlit app loads only the tiles in view instead of embedding
+all polygons in the page.
+
+    python tiles.py build
+    python tiles.py build --out tiles/heatmap.mbtiles --minzoom 8 --maxzoom 14
+    python tiles.py serve --port 8765
+
+Every tile holds the layers `PLZ` and `Bezirk` with the measures of `core.aggregate` and a precomputed
+fill colour `fill_<column>` per map layer.
+"""
+import os
+import sys
+import time
+import argparse
+from urllib.parse import urlparse
+
+from config                          import pdict
+
+
+def main(argv=None):
+    url     = urlparse(pdict["tiles_url"])
+    parser  = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub     = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="build the MBTiles file from the current layers")
+    build.add_argument("--out", default=pdict["tiles_file"], help="MBTiles file (default: pdict['tiles_file'])")
+    build.add_argument("--minzoom", type=int, default=pdict["tiles_zoom"][0])
+    build.add_argument("--maxzoom", type=int, default=pdict["tiles_zoom"][1])
+
+    serve = sub.add_parser("serve", help="serve an MBTiles file at /tiles/{z}/{x}/{y}.pbf")
+    serve.add_argument("--file", default=pdict["tiles_file"], help="MBTiles file (default: pdict['tiles_file'])")
+    serve.add_argument("--host", default=url.hostname or "127.0.0.1")
+    serve.add_argument("--port", type=int, default=url.port or 8765)
+    args = parser.parse_args(argv)
+
+    from core import tiles               as tl
+
+    if args.command == "serve":
+        if not os.path.exists(args.file):
+            parser.error("{} does not exist, run `python tiles.py build` first".format(args.file))
+        tl.serve(args.file, args.host, args.port)
+        return 0
+
+    from core import dataloader          as dl
+
+    t_start = time.perf_counter()
+    layers  = dl.build_layers(pdict)
+    n       = tl.export_mbtiles(layers, args.out, args.minzoom, args.maxzoom)
+    print(" ====> Wrote {} tiles (zoom {}-{}) to {} in {:.2f} secs".format(
+        n, args.minzoom, args.maxzoom, args.out, time.perf_counter() - t_start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())